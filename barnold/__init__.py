@@ -16,6 +16,33 @@ bl_info = {
 import bpy
 import sys
 import os
+import time
+
+# startup timings {phase: seconds}, see timings()
+_TIMINGS = {}
+engine = None
+
+
+def _engine():
+    """Import the engine on the first use, it loads the arnold bindings"""
+    global engine
+    if engine is None:
+        pc = time.perf_counter()
+        from . import engine
+        _timing("engine", pc)
+    return engine
+
+
+def _timing(phase, pc):
+    _TIMINGS[phase] = time.perf_counter() - pc
+    if os.environ.get("BARNOLD_TIMINGS"):
+        print("Arnold: %s (%f)" % (phase, _TIMINGS[phase]))
+
+
+def timings():
+    """Startup timings of the add-on: register and the first engine import"""
+    return dict(_TIMINGS)
+
 
 class ArnoldRenderEngine(bpy.types.RenderEngine):
     bl_idname = "ARNOLD"
@@ -141,22 +168,34 @@ class ArnoldRenderEngine(bpy.types.RenderEngine):
         return context.scene.render.engine == cls.bl_idname
 
     def update(self, data, depsgraph):
-        engine.update(self, data, depsgraph)
+        _engine().update(self, data, depsgraph)
 
     def render(self, depsgraph):
-        engine.render(self, depsgraph)
+        _engine().render(self, depsgraph)
 
     def view_update(self, context):
-        engine.view_update(self, context)
+        _engine().view_update(self, context)
+
+    def update_render_passes(self, scene=None, renderlayer=None):
+        from .props import AOVS
+        self.register_pass(scene, renderlayer, "Combined", 4, "RGBA", 'COLOR')
+        if scene.arnold.output_mode == 'EXR':
+            # AOVs are written to the exr file only
+            return
+        aovs = scene.arnold.aovs
+        for aov, aov_type, name, channels, chan_id, pass_type in AOVS:
+            if aov in aovs:
+                self.register_pass(scene, renderlayer, name, channels, chan_id, pass_type)
 
     def view_draw(self, context):
-        engine.view_draw(self, context.depsgraph, context.region, context.space_data, context.region_data)
+        _engine().view_draw(self, context.depsgraph, context.region, context.space_data, context.region_data)
 
     # def __del__(self):
     #     engine.free(self)
 
 
 def register():
+    pc = time.perf_counter()
     from . import addon_preferences
     addon_preferences.register()
 
@@ -164,11 +203,15 @@ def register():
     from . import nodes
     from . import ops
     from . import ui
-    from . import engine
     from . import addon_preferences
+    # the engine (arnold bindings) is imported on the first render,
+    # set BARNOLD_EAGER to import it at startup
+    if os.environ.get("BARNOLD_EAGER"):
+        _engine()
 
     bpy.utils.register_class(ArnoldRenderEngine)
     nodes.register()
+    _timing("register", pc)
 
 
 def unregister():
@@ -177,7 +220,6 @@ def unregister():
     from . import nodes
     from . import ops
     from . import ui
-    from . import engine
     from . import addon_preferences
     addon_preferences.unregister()
     bpy.utils.unregister_class(ArnoldRenderEngine)
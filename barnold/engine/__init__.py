@@ -11,6 +11,7 @@ import numpy
 import math
 import time
 import re
+import threading
 from contextlib import contextmanager
 import traceback
 
@@ -27,10 +28,20 @@ import arnold
 #     ArnoldNodeLightOutput
 # )
 import barnold.nodes as nt
+from ..props import AOVS as _AOVS
+from .. import profile as _PROFILE
 from . import bla as _BLA
 from . import ipr as _IPR
+from . import cache as _CACHE
+from . import params as _PARAMS
+from . import tiles as _TILES
 
+_SharedArrays = _IPR.SharedArrays
 _IPR = _IPR.ipr()
+_GC = _CACHE.GeometryCache(0)  # geometry cache, persists between renders
+_OPTIONS = _PARAMS.OPTIONS
+_SHADERS = _PARAMS.SHADERS
+_PROFILER = None  # profiler of the current render, see update()
 
 _RN = re.compile("[^-0-9A-Za-z_]")  # regex to cleanup names
 _CT = {'MESH', 'CURVE', 'SURFACE', 'META', 'FONT'}  # convertible types
@@ -38,6 +49,16 @@ _MR = Matrix.Rotation(math.radians(90.0), 4, 'X')
 _SQRT2 = math.sqrt(2)
 
 
+@contextmanager
+def _Phase(phase, ob=None):
+    """Time an export phase, if the render is profiled"""
+    if _PROFILER is None:
+        yield
+    else:
+        with _PROFILER.phase(phase, ob):
+            yield
+
+
 def _CleanNames(prefix, count):
     def fn(name):
         return "%s%d::%s" % (prefix, next(count), _RN.sub("_", name))
@@ -91,12 +112,49 @@ _AiNodeSet = {
 }
 
 
-def _AiNode(node, prefix, nodes):
+def _Hashable(v):
+    """Hashable representation of a socket or property value"""
+    if isinstance(v, (str, bytes)):
+        return v
+    try:
+        return tuple(_Hashable(i) for i in v)
+    except TypeError:
+        return v
+
+
+class _NodeCache:
+    """Shader nodes shared by all node trees, keyed by their structure.
+
+    A key is (node type, parameter values, linked nodes), linked nodes are
+    already deduplicated, so equal keys mean equal subtrees.
+    """
+
+    def __init__(self):
+        self.nodes = {}  # {key: AiNode}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, node, values, links):
+        try:
+            key = (
+                node.ai_name,
+                tuple((t, i, _Hashable(v)) for t, i, v in values),
+                tuple((i, ctypes.cast(n, ctypes.c_void_p).value) for i, n in links)
+            )
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+
+def _AiNode(node, prefix, nodes, cache=None):
     """
     Args:
         node (ArnoldNode): node.
         prefix (str): node name prefix.
         nodes (dict): created nodes {Node: AiNode}.
+        cache (_NodeCache): structurally identical subtrees are created
+            once and linked from every consumer.
     Returns:
         arnold.AiNode or None
     """
@@ -105,20 +163,39 @@ def _AiNode(node, prefix, nodes):
 
     anode = nodes.get(node)
     if anode is None:
-        anode = arnold.AiNode(node.ai_name)
-        name = "%s&N%d::%s" % (prefix, len(nodes), _RN.sub("_", node.name))
-        arnold.AiNodeSetStr(anode, "name", name)
-        nodes[node] = anode
+        links = []  # [(param, AiNode)]
+        values = []  # [(type, param, value)]
         for input in node.inputs:
             if input.is_linked:
-                _anode = _AiNode(input.links[0].from_node, prefix, nodes)
+                _anode = _AiNode(input.links[0].from_node, prefix, nodes, cache)
                 if _anode is not None:
-                    arnold.AiNodeLink(_anode, input.identifier, anode)
+                    links.append((input.identifier, _anode))
                     continue
             if not input.hide_value:
-                _AiNodeSet[input.bl_idname](anode, input.identifier, input.default_value)
+                values.append((input.bl_idname, input.identifier, input.default_value))
         for p_name, (p_type, p_value) in node.ai_properties.items():
+            values.append((p_type, p_name, p_value))
+
+        key = None
+        if cache is not None:
+            key = cache.key(node, values, links)
+            anode = cache.nodes.get(key)
+            if anode is not None:
+                cache.hits += 1
+                nodes[node] = anode
+                return anode
+            cache.misses += 1
+
+        anode = arnold.AiNode(node.ai_name)
+        name = "%s&N%d::%s" % (prefix, len(nodes), _RN.sub("_", node.name))
+        arnold.AiNodeSetStr(anode, "name", name)
+        nodes[node] = anode
+        for p_name, _anode in links:
+            arnold.AiNodeLink(_anode, p_name, anode)
+        for p_type, p_name, p_value in values:
             _AiNodeSet[p_type](anode, p_name, p_value)
+        if key is not None:
+            cache.nodes[key] = anode
     return anode
 
 
@@ -127,6 +204,7 @@ class Shaders:
         self._data = data
 
         self._shaders = {}
+        self.nodes = _NodeCache()  # shared shader nodes
         self._default = arnold.AiNode('lambert')  # default shader, if used
 
         self._Name = _CleanNames("M", itertools.count())
@@ -135,7 +213,8 @@ class Shaders:
         if mat:
             node = self._shaders.get(mat)
             if node is None:
-                node = self._export(mat)
+                with _Phase("shaders"):
+                    node = self._export(mat)
                 if node is None:
                     node = self.default
                 self._shaders[mat] = node
@@ -176,198 +255,33 @@ class Shaders:
     def _export(self, mat):
         if mat.use_nodes:
             for n in mat.node_tree.links:
-                return _AiNode(n.from_node, self._Name(mat.name), {})
+                return _AiNode(n.from_node, self._Name(mat.name), {}, self.nodes)
 
         shader = mat.arnold
         if mat == mat:
             node = arnold.AiNode(shader.type)
-            if shader.type == 'lambert':
-                lambert = shader.lambert
-                arnold.AiNodeSetFlt(node, "Kd", lambert.Kd)
-                arnold.AiNodeSetRGB(node, "Kd_color", *lambert.Kd_color)
-                arnold.AiNodeSetRGB(node, "opacity", *lambert.opacity)
-            elif shader.type == 'standard_surface':
-                standard_surface = shader.standard_surface
-                arnold.AiNodeSetFlt(node, "base", standard_surface.base)
-                arnold.AiNodeSetRGB(node, "base_color", *standard_surface.base_color)
-                arnold.AiNodeSetFlt(node, "diffuse_roughness", standard_surface.diffuse_roughness)
-                arnold.AiNodeSetFlt(node, "metalness", standard_surface.metalness)
-                arnold.AiNodeSetFlt(node, "specular", standard_surface.specular)
-                arnold.AiNodeSetRGB(node, "specular_color", *standard_surface.specular_color)
-                arnold.AiNodeSetFlt(node, "specular_roughness", standard_surface.specular_roughness)
-                #arnold.AiNodeSetFlt(node, "specular_ior", standard_surface.specular_ior)
-                arnold.AiNodeSetFlt(node, "specular_anisotropy", standard_surface.specular_anisotropy)
-                arnold.AiNodeSetFlt(node, "specular_rotation", standard_surface.specular_rotation)
-                arnold.AiNodeSetFlt(node, "emission", standard_surface.emission)
-                arnold.AiNodeSetRGB(node, "emission_color", *standard_surface.emission_color)
-                arnold.AiNodeSetFlt(node, "transmission", standard_surface.transmission)
-                arnold.AiNodeSetRGB(node, "transmission_color", *standard_surface.transmission_color)
-                arnold.AiNodeSetFlt(node, "transmission_depth", standard_surface.transmission_depth)
-                arnold.AiNodeSetRGB(node, "transmission_scatter", *standard_surface.transmission_scatter)
-                arnold.AiNodeSetFlt(node, "transmission_scatter_anisotropy", standard_surface.transmission_scatter_anisotropy)
-                arnold.AiNodeSetFlt(node, "transmission_dispersion", standard_surface.transmission_dispersion)
-                arnold.AiNodeSetFlt(node, "transmission_extra_roughness", standard_surface.transmission_extra_roughness)
-                arnold.AiNodeSetBool(node, "transmit_aovs", standard_surface.transmit_aovs)
-                #arnold.AiNodeSetFlt(node, "sss_synopsis", standard_surface.sss_synopsis)
-                arnold.AiNodeSetFlt(node, "subsurface", standard_surface.subsurface)
-                arnold.AiNodeSetRGB(node, "subsurface_color", *standard_surface.subsurface_color)
-                arnold.AiNodeSetRGB(node, "subsurface_radius", *standard_surface.subsurface_radius)
-                arnold.AiNodeSetFlt(node, "subsurface_scale", standard_surface.subsurface_scale)
-                arnold.AiNodeSetFlt(node, "subsurface_anisotropy", standard_surface.subsurface_anisotropy)
-                arnold.AiNodeSetStr(node, "subsurface_type", standard_surface.subsurface_type)
-                arnold.AiNodeSetBool(node, "thin_walled", standard_surface.thin_walled)
-                arnold.AiNodeSetVec(node, "normal", *standard_surface.normal)
-                # arnold.AiNodeSetFlt(node, "tangent", standard_surface.tangent)
-                arnold.AiNodeSetFlt(node, "coat", standard_surface.coat)
-                arnold.AiNodeSetRGB(node, "coat_color", *standard_surface.coat_color)
-                arnold.AiNodeSetFlt(node, "coat_roughness", standard_surface.coat_roughness)
-                #arnold.AiNodeSetFlt(node, "coat_ior", standard_surface.coat_ior)
-                arnold.AiNodeSetVec(node, "coat_normal", *standard_surface.coat_normal)
-                arnold.AiNodeSetFlt(node, "coat_affect_color", standard_surface.coat_affect_color)
-                arnold.AiNodeSetFlt(node, "coat_affect_roughness", standard_surface.coat_affect_roughness)
-                #arnold.AiNodeSetFlt(node, "opacity", standard_surface.opacity)
-                arnold.AiNodeSetBool(node, "caustics", standard_surface.caustics)
-                arnold.AiNodeSetBool(node, "internal_reflections", standard_surface.internal_reflections)
-                arnold.AiNodeSetBool(node, "exit_to_background", standard_surface.exit_to_background)
-                arnold.AiNodeSetFlt(node, "indirect_diffuse", standard_surface.indirect_diffuse)
-                arnold.AiNodeSetFlt(node, "indirect_specular", standard_surface.indirect_specular)
-                # arnold.AiNodeSetStr(node, "sss_set_name", standard_surface.sss_set_name)
-                # arnold.AiNodeSetStr(node, "anistropy_tangent", standard_surface.anistropy_tangent)
-                arnold.AiNodeSetFlt(node, "thin_film_thickness", standard_surface.thin_film_thickness)
-                #arnold.AiNodeSetFlt(node, "thin_film_ior", standard_surface.thin_film_ior)
-                # arnold.AiNodeSetRGB(node, "aov_id(1-8)", standard_surface.aov_id(1-8))
-                arnold.AiNodeSetFlt(node, "sheen", standard_surface.sheen)
-                arnold.AiNodeSetRGB(node, "sheen_color", *standard_surface.sheen_color)
-                arnold.AiNodeSetFlt(node, "sheen_roughness", standard_surface.sheen_roughness)
-                # TODO: other standard_surface node parmas
-            elif shader.type == 'toon':
-                toon = shader.toon
-                arnold.AiNodeSetFlt(node, "base", toon.base)
-                arnold.AiNodeSetRGB(node, "base_color", *toon.base_color)
-                arnold.AiNodeSetRGB(node, "base_tonemap", *toon.base_toonmap)
-
-                arnold.AiNodeSetRGB(node, "mask_color", toon.mask_color)
-                arnold.AiNodeSetRGB(node, "edge_color", *toon.edge_color)
-                arnold.AiNodeSetRGB(node, "edge_tonemap", *toon.edge_toonmap)
-                arnold.AiNodeSetFlt(node, "edge_opacity", *toon.edge_opacity)
-                arnold.AiNodeSetFlt(node, "edge_width_scale", *toon.edge_width_scale)
-
-                arnold.AiNodeSetRGB(node, "silhouette_color", *toon.silhouette_color)
-                arnold.AiNodeSetRGB(node, "silhouette_tonemap", *toon.silhouette_tonemap)
-                arnold.AiNodeSetFlt(node, "silhouette_opacity", *toon.silhouette_opacity)
-                arnold.AiNodeSetFlt(node, "silhouette_width_scale", *toon.silhouette_width_scale)
-                arnold.AiNodeSetBool(node, "enable_silhouette", *toon.enable_silhouette)
-                arnold.AiNodeSetBool(node, "ignore_throughput", *toon.ignore_throughput)
-                arnold.AiNodeSetBool(node, "enable", *toon.enable)
-                arnold.AiNodeSetBool(node, "id_difference", *toon.id_difference)
-                arnold.AiNodeSetBool(node, "shader_difference", *toon.shader_difference)
-                arnold.AiNodeSetFlt(node, "uv_threshold", *toon.uv_threshold)
-                arnold.AiNodeSetFlt(node, "angle_threshold", *toon.angle_threshold)
-
-                arnold.AiNodeSetRGB(node, "specular_color", *toon.specular_color)
-                arnold.AiNodeSetFlt(node, "specular", *toon.specular)
-                arnold.AiNodeSetFlt(node, "specular_roughness", *toon.specular_roughness)
-                arnold.AiNodeSetRGB(node, "specular_tonemap", *toon.specular_tonemap)
-                arnold.AiNodeSetFlt(node, "specular_anisotropy", *toon.specular_anisotropy)
-                arnold.AiNodeSetFlt(node, "specular_rotation", *toon.specular_rotation)
-                arnold.AiNodeSetStr(node, "lights", *toon.lights)
-                arnold.AiNodeSetRGB(node, "highlight_color", *toon.highlight_color)
-                arnold.AiNodeSetFlt(node, "highlight_size", *toon.highlight_size)
-                arnold.AiNodeSetStr(node, "aov_highlight", *toon.aov_highlight)
-                arnold.AiNodeSetStr(node, "rim_light", *toon.rim_light)
-                arnold.AiNodeSetRGB(node, "rim_light_color", *toon.rim_light_color)
-                arnold.AiNodeSetFlt(node, "rim_light_width", *toon.rim_light_width)
-                arnold.AiNodeSetStr(node, "aov_rim_light", *toon.aov_rim_light)
-
-                arnold.AiNodeSetRGB(node, "transmission_color", *toon.transmission_color)
-                arnold.AiNodeSetFlt(node, "transmission", *toon.transmission)
-                arnold.AiNodeSetFlt(node, "transmission_roughness", *toon.transmission_roughness)
-                arnold.AiNodeSetFlt(node, "transmission_anisotropy", *toon.transmission_anisotropy)
-                arnold.AiNodeSetFlt(node, "transmission_rotation", *toon.transmission_rotation)
-
-                arnold.AiNodeSetRGB(node, "emission_color", *toon.emission_color)
-                arnold.AiNodeSetFlt(node, "emission", *toon.emission)
-
-                arnold.AiNodeSetFlt(node, "IOR", *toon.IOR)
-                arnold.AiNodeSetVec(node, "normal", *toon.normal)
-                arnold.AiNodeSetVec(node, "tangent", *toon.tangent)
-                arnold.AiNodeSetFlt(node, "indirect_diffuse", *toon.indirect_diffuse)
-                arnold.AiNodeSetFlt(node, "indirect_specular", *toon.indirect_specular)
-                arnold.AiNodeSetStr(node, "bump_mode", *toon.bump_mode)
-                arnold.AiNodeSetBool(node, "energy_conserving", *toon.energy_conserving)
-                arnold.AiNodeSetBool(node, "user_id", *toon.user_id)
-
-                arnold.AiNodeSetFlt(node, "sheen", *toon.sheen)
-                arnold.AiNodeSetRGB(node, "sheen_color", *toon.sheen_color)
-                arnold.AiNodeSetFlt(node, "sheen_roughness", *toon.sheen_roughness)
-
-
-            elif shader.type == 'utility':
-                utility = shader.utility
-                arnold.AiNodeSetStr(node, "color_mode", utility.color_mode)
-                arnold.AiNodeSetStr(node, "shade_mode", utility.shade_mode)
-                arnold.AiNodeSetStr(node, "overlay_mode", utility.overlay_mode)
-                arnold.AiNodeSetRGB(node, "color", *mat.base_color)
-                arnold.AiNodeSetFlt(node, "opacity", utility.opacity)
-                arnold.AiNodeSetFlt(node, "ao_distance", utility.ao_distance)
-            elif shader.type == 'flat':
-                arnold.AiNodeSetRGB(node, "color", *mat.base_color)
-                arnold.AiNodeSetRGB(node, "opacity", *shader.flat.opacity)
-            elif shader.type == 'standard_hair':
-                standard_hair = shader.standard_hair
-                arnold.AiNodeSetFlt(node, "base", standard_hair.base)
-                arnold.AiNodeSetRGB(node, "base_color", *standard_hair.base_color)
-                arnold.AiNodeSetFlt(node, "melanin", standard_hair.melanin)
-                arnold.AiNodeSetFlt(node, "melanin_redness", standard_hair.melanin_redness)
-                arnold.AiNodeSetFlt(node, "melanin_randomize", standard_hair.melanin_randomize)
-                arnold.AiNodeSetFlt(node, "roughness", standard_hair.roughness)
-                arnold.AiNodeSetFlt(node, "ior", standard_hair.ior)
-                arnold.AiNodeSetFlt(node, "shift", standard_hair.shift)
-                arnold.AiNodeSetRGB(node, "specular_tint", *standard_hair.specular_tint)
-                arnold.AiNodeSetRGB(node, "specular2_tint", *standard_hair.specular2_tint)
-                arnold.AiNodeSetRGB(node, "transmission_tint", *standard_hair.transmission_tint)
-                arnold.AiNodeSetFlt(node, "diffuse", standard_hair.diffuse)
-                arnold.AiNodeSetRGB(node, "diffuse_color", *standard_hair.diffuse_color)
-                arnold.AiNodeSetFlt(node, "emission", standard_hair.emission)
-                arnold.AiNodeSetRGB(node, "emission_color ", *standard_hair.emission_color)
-                arnold.AiNodeSetRGB(node, "opacity", *standard_hair.opacity)
-                arnold.AiNodeSetFlt(node, "indirect_diffuse", standard_hair.indirect_diffuse)
-                arnold.AiNodeSetFlt(node, "indirect_specular", standard_hair.indirect_specular)
-                arnold.AiNodeSetFlt(node, "extra_depth", standard_hair.extra_depth)
-                arnold.AiNodeSetFlt(node, "extra_samples", standard_hair.extra_samples)
+            params = _SHADERS.get(shader.type)
         elif mat.type == 'WIRE':
-            wire = shader.wire
             node = arnold.AiNode('wireframe')
-            arnold.AiNodeSetStr(node, "edge_type", wire.edge_type)
-            arnold.AiNodeSetRGB(node, "line_color", *wire.diffuse_color)
-            arnold.AiNodeSetRGB(node, "fill_color", *wire.fill_color)
-            arnold.AiNodeSetFlt(node, "line_width", wire.line_width)
-            arnold.AiNodeSetBool(node, "raster_space", wire.raster_space)
+            params = _SHADERS['wireframe']
         elif mat.type == 'VOLUME':
-            standard_volume = shader.standard_volume
             node = arnold.AiNode('standard_volume')
-            arnold.AiNodeSetFlt(node, "density", standard_volume.density)
-            arnold.AiNodeSetFlt(node, "scatter", standard_volume.scatter)
-            arnold.AiNodeSetRGB(node, "scatter_color", *standard_volume.scatter_color)
-            arnold.AiNodeSetFlt(node, "scatter_anisotropy", standard_volume.scatter_anisotropy)
-            arnold.AiNodeSetRGB(node, "transparent", *standard_volume.transparent)
-            arnold.AiNodeSetFlt(node, "transparent_depth", standard_volume.transparent_depth)
-            #arnold.AiNodeSetStr(node, "emission_mode", standard_volume.emission_mode)
-            arnold.AiNodeSetFlt(node, "emission", standard_volume.emission)
-            arnold.AiNodeSetRGB(node, "emission_color", *standard_volume.emission_color)
-            arnold.AiNodeSetFlt(node, "temperature", standard_volume.temperature)
-            arnold.AiNodeSetFlt(node, "blackbody_kelvin", standard_volume.blackbody_kelvin)
-            arnold.AiNodeSetFlt(node, "blackbody_intensity", standard_volume.blackbody_intensity)
-            # arnold.AiNodeSetFlt(node, "interpolation", standard_volume.interpolation)
+            params = _SHADERS['standard_volume']
         else:
             return None
+        if params is not None:
+            params.apply(node, mat)
         arnold.AiNodeSetStr(node, "name", self._Name(mat.name))
         return node
 
 
-def _AiPolymesh(mesh, shaders):
-    pc = time.perf_counter()
+def _MeshArrays(mesh, alloc=numpy.ndarray):
+    """Extract polymesh buffers from an evaluated mesh.
 
+    Args:
+        mesh (bpy.types.Mesh): evaluated mesh.
+        alloc (callable): array allocator, alloc(n, dtype=...).
+    """
     verts = mesh.vertices
     nverts = len(verts)
     loops = mesh.loops
@@ -375,54 +289,208 @@ def _AiPolymesh(mesh, shaders):
     polygons = mesh.polygons
     npolygons = len(polygons)
 
+    arrays = {}
     # vertices
-    a = numpy.ndarray(nverts * 3, dtype=numpy.float32)
+    a = alloc(nverts * 3, dtype=numpy.float32)
     verts.foreach_get("co", a)
-    vlist = arnold.AiArrayConvert(nverts, 1, arnold.AI_TYPE_VECTOR, ctypes.c_void_p(a.ctypes.data))
+    arrays['vlist'] = a
     # normals
-    a = numpy.ndarray(nloops * 3, dtype=numpy.float32)
+    a = alloc(nloops * 3, dtype=numpy.float32)
     loops.foreach_get("normal", a)
-    nlist = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_VECTOR, ctypes.c_void_p(a.ctypes.data))
+    arrays['nlist'] = a
     # polygons
-    a = numpy.ndarray(npolygons, dtype=numpy.uint32)
+    a = alloc(npolygons, dtype=numpy.uint32)
     polygons.foreach_get("loop_total", a)
-    nsides = arnold.AiArrayConvert(npolygons, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
-    a = numpy.ndarray(nloops, dtype=numpy.uint32)
+    arrays['nsides'] = a
+    a = alloc(nloops, dtype=numpy.uint32)
     polygons.foreach_get("vertices", a)
-    vidxs = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
+    arrays['vidxs'] = a
+    # uv
+    arrays['uvlist'] = None
+    for i, uvt in enumerate(mesh.uv_layers):
+        if uvt.active_render:
+            uvd = mesh.uv_layers[i].data
+            a = alloc(len(uvd) * 2, dtype=numpy.float32)
+            uvd.foreach_get("uv", a)
+            arrays['uvlist'] = a
+            break
+    # shaders per face assignment
+    arrays['shidxs'] = None
+    if mesh.materials:
+        a = alloc(npolygons, dtype=numpy.uint8)
+        polygons.foreach_get("material_index", a)
+        arrays['shidxs'] = a
+    return arrays
+
+
+def _ShaderIndices(a, shader, key=id, out=None):
+    """Remap per face material slot indices to indices of unique shaders.
+
+    Args:
+        a (numpy.ndarray): material slot per face (uint8).
+        shader (callable): shader(slot), called once per used slot.
+        key (callable): shader identity, shaders with equal keys are merged.
+        out (numpy.ndarray): result array, may be `a` itself.
+    Returns:
+        tuple: (shader index per face, [shaders])
+    """
+    counts = numpy.bincount(a)
+    table = numpy.zeros(len(counts), dtype=numpy.uint8)
+    shaders = []
+    index = {}
+    for i in numpy.flatnonzero(counts):
+        sh = shader(int(i))
+        k = key(sh)
+        j = index.get(k)
+        if j is None:
+            j = index[k] = len(shaders)
+            shaders.append(sh)
+        table[i] = j
+    return numpy.take(table, a, out=out), shaders
+
+
+def _AiPolymeshArrays(arrays, slots=None, ob=None):
+    """Convert polymesh buffers to arnold arrays.
+
+    Doesn't touch blender data, so it may run in a worker thread.
+
+    Args:
+        arrays (dict): mesh buffers, see _MeshArrays.
+        slots (list): shader node per material slot.
+        ob (str): object name for the profiler, the current object if None.
+    Returns:
+        tuple: ({param: AtArray}, [shader nodes ordered by shidxs])
+    """
+    pc = time.perf_counter()
+    params = {}
+
+    a = arrays['vlist']
+    params['vlist'] = arnold.AiArrayConvert(len(a) // 3, 1, arnold.AI_TYPE_VECTOR, ctypes.c_void_p(a.ctypes.data))
+    a = arrays['nlist']
+    nloops = len(a) // 3
+    params['nlist'] = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_VECTOR, ctypes.c_void_p(a.ctypes.data))
+    a = arrays['nsides']
+    params['nsides'] = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
+    a = arrays['vidxs']
+    params['vidxs'] = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
     # TODO: very slow, seems its always a range(0, nloops)
     #a = numpy.array([i for p in polygons for i in p.loop_indices], dtype=numpy.uint32)
     #nidxs = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
     a = numpy.arange(nloops, dtype=numpy.uint32)
-    nidxs = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
+    params['nidxs'] = arnold.AiArrayConvert(nloops, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
+
+    # uv
+    a = arrays['uvlist']
+    if a is not None:
+        nuvs = len(a) // 2
+        uva = numpy.arange(nuvs, dtype=numpy.uint32)
+        params['uvidxs'] = arnold.AiArrayConvert(nuvs, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(uva.ctypes.data))
+        params['uvlist'] = arnold.AiArrayConvert(nuvs, 1, arnold.AI_TYPE_VECTOR2, ctypes.c_void_p(a.ctypes.data))
+
+    # shaders per face assignment
+    shaders = []
+    if slots:
+        # new array, cached buffers must stay untouched
+        n = len(slots) - 1
+        a, shaders = _ShaderIndices(arrays['shidxs'], lambda i: slots[min(i, n)])
+        if len(shaders) > 1:
+            params['shidxs'] = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_BYTE, ctypes.c_void_p(a.ctypes.data))
+
+    pc = time.perf_counter() - pc
+    arnold.AiMsgDebug(b"    arrays (%f)", ctypes.c_double(pc))
+    if _PROFILER is not None:
+        _PROFILER.add("AiArrayConvert", pc, sum(a.nbytes for a in arrays.values() if a is not None), ob)
+    return params, shaders
+
+
+def _AiPolymeshSet(node, params, shaders):
+    """Set the result of _AiPolymeshArrays to the polymesh node"""
+    for param, array in params.items():
+        arnold.AiNodeSetArray(node, param, array)
+    if len(shaders) > 1:
+        shader = arnold.AiArrayAllocate(len(shaders), 1, arnold.AI_TYPE_POINTER)
+        for i, mn in enumerate(shaders):
+            arnold.AiArraySetPtr(shader, i, mn)
+        arnold.AiNodeSetArray(node, "shader", shader)
+    elif shaders:
+        arnold.AiNodeSetPtr(node, "shader", shaders[0])
+
+
+class _Pipeline:
+    """Converts polymesh buffers to arnold arrays in worker threads.
+
+    Nodes are created and updated on the main thread, the number of
+    buffers in flight is limited to keep the memory bounded.
+    """
 
+    def __init__(self, threads):
+        self.pending = collections.deque()  # [(node, future)]
+        self.limit = threads * 2
+        self.pool = None
+        if threads > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            self.pool = ThreadPoolExecutor(threads, "barnold-export")
+
+    def submit(self, node, arrays, slots):
+        if self.pool is None:
+            _AiPolymeshSet(node, *_AiPolymeshArrays(arrays, slots))
+            return
+        if len(self.pending) >= self.limit:
+            self._pop()
+        ob = None if _PROFILER is None else _PROFILER.object
+        self.pending.append((node, self.pool.submit(_AiPolymeshArrays, arrays, slots, ob)))
+
+    def drain(self):
+        while self.pending:
+            self._pop()
+
+    def close(self):
+        try:
+            self.drain()
+        finally:
+            self._shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the export failed, drop the buffers still in flight
+            while self.pending:
+                self.pending.popleft()[1].cancel()
+            self._shutdown()
+
+    def _shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _pop(self):
+        node, future = self.pending.popleft()
+        _AiPolymeshSet(node, *future.result())
+
+
+def _AiPolymesh(arrays, materials, shaders, pipeline=None):
+    """
+    Args:
+        arrays (dict): mesh buffers, see _MeshArrays.
+        materials (list): material per slot.
+        shaders (Shaders): shaders cache.
+        pipeline (_Pipeline): converts arrays asynchronously, if specified.
+    Returns:
+        arnold.AiNode
+    """
     node = arnold.AiNode('polymesh')
     arnold.AiNodeSetBool(node, "smoothing", True)
-    arnold.AiNodeSetArray(node, "vlist", vlist)
-    arnold.AiNodeSetArray(node, "nlist", nlist)
-    arnold.AiNodeSetArray(node, "nsides", nsides)
-    arnold.AiNodeSetArray(node, "vidxs", vidxs)
-    arnold.AiNodeSetArray(node, "nidxs", nidxs)
-
-    # uv
-    for i, uvt in enumerate(mesh.uv_layers):
-        if uvt.active_render:
-            uvd = mesh.uv_layers[i].data
-            nuvs = len(uvd)
-            a = numpy.arange(nuvs, dtype=numpy.uint32)
-            uvidxs = arnold.AiArrayConvert(nuvs, 1, arnold.AI_TYPE_UINT, ctypes.c_void_p(a.ctypes.data))
-            a = numpy.ndarray(nuvs * 2, dtype=numpy.float32)
-            uvd.foreach_get("uv", a)
-            uvlist = arnold.AiArrayConvert(nuvs, 1, arnold.AI_TYPE_VECTOR2, ctypes.c_void_p(a.ctypes.data))
-            arnold.AiNodeSetArray(node, "uvidxs", uvidxs)
-            arnold.AiNodeSetArray(node, "uvlist", uvlist)
-            break
 
     # materials
-    if mesh.materials:
+    slots = None
+    if materials and arrays['shidxs'] is not None:
         _Name = _CleanNames("M", itertools.count())
-        if mesh.materials[0].use_nodes:
-            for _node in mesh.materials[0].node_tree.nodes:
+        if materials[0].use_nodes:
+            for _node in materials[0].node_tree.nodes:
                 if isinstance(_node, nt.ArnoldNodeOutput) and _node.is_active:
                     for input in _node.inputs:
                         if input.is_linked:
@@ -430,14 +498,14 @@ def _AiPolymesh(mesh, shaders):
                             if input.identifier == "disp_map":
                                 dispnodes = []
                                 # _AiNode() converts blender node to arnold node
-                                dispnodes.append(_AiNode(input.links[0].from_node, _Name(mesh.materials[0].name), {}))
+                                dispnodes.append(_AiNode(input.links[0].from_node, _Name(materials[0].name), {}, shaders.nodes))
                                 nmaps = len(dispnodes)
                                 # Calculate the number of nodes linked to displacement and initialize a numpy array
                                 a = numpy.ndarray(nmaps, dtype=numpy.uint8)
                                 mm = collections.OrderedDict()
                                 # Set up the arnold parameters as NODE INDEX 
                                 for i in numpy.unique(a):
-                                    mn = _AiNode(input.links[0].from_node, _Name(mesh.materials[0].name), {})
+                                    mn = _AiNode(input.links[0].from_node, _Name(materials[0].name), {}, shaders.nodes)
                                     mi = mm.setdefault(id(mn), (mn, []))[1]
                                     mi.append(i)
                                 for i, (mn, mi) in enumerate(mm.values()):
@@ -456,35 +524,12 @@ def _AiPolymesh(mesh, shaders):
                                         # Link Displacement Map to corresponding image node
                                         arnold.AiNodeSetArray(node, "disp_map", AiDisplace)
                                         
-        # Calculate shaders per face assignment
-        a = numpy.ndarray(npolygons, dtype=numpy.uint8)
-        polygons.foreach_get("material_index", a)
-        mm = collections.OrderedDict()
-        for i in numpy.unique(a):
-            mn = shaders.get(mesh.materials[i])
-            mi = mm.setdefault(id(mn), (mn, []))[1]
-            mi.append(i)
-        for i, (mn, mi) in enumerate(mm.values()):
-            a[numpy.in1d(a, numpy.setdiff1d(mi, i))] = i
-        if mm:
-            nmm = len(mm)
-            t = mm.popitem(False)
-            if mm:
-                shader = arnold.AiArrayAllocate(nmm, 1, arnold.AI_TYPE_POINTER)
-                arnold.AiArraySetPtr(shader, 0, t[1][0])
-                i = 1
-                while mm:
-                    arnold.AiArraySetPtr(shader, i, mm.popitem(False)[1][0])
-                    i += 1
-                shidxs = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_BYTE, ctypes.c_void_p(a.ctypes.data))
-                #disp_map = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_BYTE, ctypes.c_void_p(a.ctypes.data))
-                arnold.AiNodeSetArray(node, "shader", shader)
-                arnold.AiNodeSetArray(node, "shidxs", shidxs)
-                #arnold.AiNodeSetArray(node, "disp_map", disp_map)
-            else:
-                arnold.AiNodeSetPtr(node, "shader", t[1][0])
+        slots = [shaders.get(mat) for mat in materials]
 
-    arnold.AiMsgDebug(b"    node (%f)", ctypes.c_double(time.perf_counter() - pc))
+    if pipeline is None:
+        _AiPolymeshSet(node, *_AiPolymeshArrays(arrays, slots))
+    else:
+        pipeline.submit(node, arrays, slots)
     return node
 
 
@@ -524,34 +569,35 @@ def _AiCurvesPS(data, ob, mod, ps, pss, shaders):
         if uv_no >= 0:
             pc = time.perf_counter()
 
-            setFlt = arnold.AiArraySetFlt
-            uv_on_emitter = ps.uv_on_emitter
-
-            np = len(ps.particles)
             nch = len(ps.child_particles)
-            if nch == 0 or pss.use_parent_particles:
-                tot = np + nch
-                uparam = arnold.AiArrayAllocate(tot, 1, arnold.AI_TYPE_FLOAT)
-                vparam = arnold.AiArrayAllocate(tot, 1, arnold.AI_TYPE_FLOAT)
-                for i, p in enumerate(ps.particles):
-                    u, v = uv_on_emitter(mod, p, i, uv_no)
-                    setFlt(uparam, i, u)
-                    setFlt(vparam, i, v)
-                n = i + 1
-            else:
-                uparam = arnold.AiArrayAllocate(nch, 1, arnold.AI_TYPE_FLOAT)
-                vparam = arnold.AiArrayAllocate(nch, 1, arnold.AI_TYPE_FLOAT)
+            use_parent_particles = nch == 0 or pss.use_parent_particles
+            uvs = None
+            if ob.modifiers[0] == mod:
+                # emitter is the original mesh
+                uvs = _BLA.psys_get_uvs(ps, ob.data, uv_no, use_parent_particles)
+            if uvs is None:
+                uv_on_emitter = ps.uv_on_emitter
+                particles = ps.particles
+                np = len(particles)
+                uvs = numpy.ndarray([(np if use_parent_particles else 0) + nch, 2], dtype=numpy.float32)
                 n = 0
-            if nch > 0:
-                j = np
-                r = nch // np
-                for p in ps.particles:
-                    for i in range(r):
-                        u, v = uv_on_emitter(mod, p, j, uv_no)
-                        setFlt(uparam, n, u)
-                        setFlt(vparam, n, v)
-                        j += 1
+                if use_parent_particles:
+                    for i, p in enumerate(particles):
+                        uvs[n] = uv_on_emitter(mod, p, i, uv_no)
                         n += 1
+                if nch > 0:
+                    j = np
+                    r = nch // np
+                    for p in particles:
+                        for i in range(r):
+                            uvs[n] = uv_on_emitter(mod, p, j, uv_no)
+                            j += 1
+                            n += 1
+                uvs = uvs[:n]
+            u = numpy.ascontiguousarray(uvs[:, 0])
+            v = numpy.ascontiguousarray(uvs[:, 1])
+            uparam = arnold.AiArrayConvert(len(u), 1, arnold.AI_TYPE_FLOAT, ctypes.c_void_p(u.ctypes.data))
+            vparam = arnold.AiArrayConvert(len(v), 1, arnold.AI_TYPE_FLOAT, ctypes.c_void_p(v.ctypes.data))
 
             arnold.AiMsgDebug(b"    standard_hair uvs (%f)", ctypes.c_double(time.perf_counter() - pc))
 
@@ -622,8 +668,75 @@ def _export_object_properties(ob, node):
         arnold.AiNodeSetBool(node, "subdiv_smooth_derivs", props.subdiv_smooth_derivs)
 
 
-def _export(data, depsgraph, camera, xres, yres, session=None):
+def _AiOutputs(options, opts, session=None):
+    """Create the drivers and set the outputs of the options.
+
+    Returns:
+        tuple: (display driver node, [(pass, channels, chan_id)] of the
+        extra AOVs packed by the display driver)
     """
+    display = arnold.AiNode("driver_display_callback")
+    arnold.AiNodeSetStr(display, "name", "__driver")
+    outputs_aovs = [str.encode(opts.aov_pass + "__driver")]
+    # direct to disk, blender gets only the beauty preview
+    exr = None
+    if session is not None and opts.output_mode == 'EXR':
+        filename = frame_path(bpy.path.abspath(opts.exr_filepath), bpy.context.scene.frame_current)
+        dirname = os.path.dirname(filename)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        exr = arnold.AiNode("driver_exr")
+        arnold.AiNodeSetStr(exr, "name", "__exr")
+        arnold.AiNodeSetStr(exr, "filename", filename)
+        arnold.AiNodeSetStr(exr, "compression", opts.exr_compression)
+        arnold.AiNodeSetBool(exr, "half_precision", opts.exr_half_precision)
+        arnold.AiNodeSetBool(exr, "tiled", opts.exr_tiled)
+        if not opts.exr_preview:
+            outputs_aovs = []
+        outputs_aovs.append(b"RGBA RGBA __filter __exr")
+    # extra AOVs, packed with the beauty by the display driver or layers of the exr file
+    aovs = []  # [(pass, channels, chan_id)], in the order of the outputs
+    if session is not None and opts.aovs:
+        closest = None
+        for aov, aov_type, name, channels, chan_id, pass_type in _AOVS:
+            if aov in opts.aovs:
+                _filter = "__filter"
+                if aov_type != "RGB":
+                    # don't blend data AOVs
+                    if closest is None:
+                        closest = arnold.AiNode("closest_filter")
+                        arnold.AiNodeSetStr(closest, "name", "__closest")
+                    _filter = "__closest"
+                if exr is not None:
+                    outputs_aovs.append(str.encode("%s %s %s __exr" % (aov, aov_type, _filter)))
+                    continue
+                outputs_aovs.append(str.encode("%s %s %s __driver" % (aov, aov_type, _filter)))
+                aovs.append((name, channels, chan_id))
+
+    outputs = arnold.AiArray(len(outputs_aovs), 1, arnold.AI_TYPE_STRING, *outputs_aovs)
+    arnold.AiNodeSetArray(options, "outputs", outputs)
+    return display, aovs
+
+
+def _shape_properties(ob):
+    """Object properties of the shape itself, a ginstance can't override them"""
+    props = ob.arnold
+    key = (props.invert_normals, props.disp_height, props.subdiv_type)
+    if props.subdiv_type != 'none':
+        key += (
+            props.subdiv_iterations, props.subdiv_adaptive_error, props.subdiv_adaptive_metric,
+            props.subdiv_adaptive_space, props.subdiv_uv_smoothing, props.subdiv_smooth_derivs
+        )
+    return key
+
+
+def _export(data, depsgraph, camera, xres, yres, session=None, objects=None, shapes_only=False,
+            geometry_cache=True):
+    """
+    Args:
+        objects (list): export only these objects, all objects if None.
+        shapes_only (bool): skip the world shaders, used by .ass chunks.
+        geometry_cache (bool): use the geometry cache if it's enabled.
     """
 
     @contextmanager
@@ -636,12 +749,40 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
             if mesh:
                 mesh.calc_normals_split()
                 arnold.AiMsgDebug(b"    mesh (%f)", ctypes.c_double(time.perf_counter() - pc))
+            if _PROFILER is not None:
+                _PROFILER.add("to_mesh", time.perf_counter() - pc)
 
             yield mesh
         finally:
             if mesh:
                 bpy.data.meshes.remove(mesh, do_unlink=False)
 
+    def _Arrays(ob):
+        fp = None
+        if opts.geometry_cache and geometry_cache:
+            fp = _CACHE.fingerprint(ob, bpy.context.scene.frame_current)
+        key = (ob.name, ob.data.name)
+        arrays = None if fp is None else _GC.get(key, fp)
+        if arrays is None:
+            with _Mesh(ob) as mesh:
+                if mesh is None:
+                    return None
+                with _Phase("foreach_get"):
+                    arrays = _MeshArrays(mesh)
+            if fp is not None:
+                _GC.put(key, fp, arrays)
+        else:
+            arnold.AiMsgDebug(b"    mesh (cached)")
+        return arrays
+
+    def _Polymesh(ob, arrays=None):
+        if arrays is None:
+            arrays = _Arrays(ob)
+            if arrays is None:
+                return None
+        materials = [slot.material for slot in ob.material_slots]
+        return _AiPolymesh(arrays, materials, shaders, pipeline)
+
     _Name = _CleanNames("O", itertools.count())
 
     # enabled scene layers
@@ -650,6 +791,8 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
     # nodes cache
     nodes = {}  # {Object: AiNode}
     inodes = {}  # {Object.data: AiNode}
+    gnodes = {}  # {(geometry digest, materials): AiNode}
+    ninstances = 0  # instances by geometry digest
     lamp_nodes = {}
     mesh_lights = []
     duplicators = []
@@ -662,243 +805,284 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
     arnold.AiMsgSetMaxWarnings(opts.max_warnings)
     arnold.AiMsgDebug(b"ARNOLD: >>>")
 
-    plugins_path = os.path.normpath(os.path.join(os.path.dirname(__file__), os.path.pardir, "bin"))
-    arnold.AiLoadPlugins(plugins_path)
+    if opts.geometry_cache:
+        _GC.resize(opts.geometry_cache_size * 1048576)  # 1024*1024
+    else:
+        _GC.clear()
 
-    ##############################
-    ## objects
-    for ob in bpy.data.objects:
-        arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
+    # converts the polymesh arrays, its threads are stopped on errors too
+    with _Pipeline(opts.export_threads or os.cpu_count() or 1) as pipeline:
+        plugins_path = os.path.normpath(os.path.join(os.path.dirname(__file__), os.path.pardir, "bin"))
+        arnold.AiLoadPlugins(plugins_path)
 
-        if ob.hide_render or not ob.visible_get(): # or not in_layers(ob)
-            arnold.AiMsgDebug(b"    skip (hidden)")
-            continue
+        ##############################
+        ## objects
+        for ob in bpy.data.objects if objects is None else objects:
+            arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
+            if _PROFILER is not None:
+                _PROFILER.object = ob.name
 
-        if duplicator_parent is not False:
-            if duplicator_parent == ob.parent:
-                duplicator_parent = False
-            else:
-                arnold.AiMsgDebug(b"    skip (duplicator child)")
+            if ob.hide_render or not ob.visible_get(): # or not in_layers(ob)
+                arnold.AiMsgDebug(b"    skip (hidden)")
                 continue
 
-        if ob.is_instancer:
-            duplicators.append(ob)
-            if ob.instance_type in {'VERTS', 'FACES'}:
-                duplicator_parent = ob.parent
-            if ob.show_instancer_for_render:
-                arnold.AiMsgDebug(b"    particle system emitter")
-            else: 
-                arnold.AiMsgDebug(b"    skip (duplicator)")
-                continue
+            if duplicator_parent is not False:
+                if duplicator_parent == ob.parent:
+                    duplicator_parent = False
+                else:
+                    arnold.AiMsgDebug(b"    skip (duplicator child)")
+                    continue
 
-        if ob.type in _CT:
-            name = None
-
-            particle_systems = [
-                (m, m.particle_system) for m in ob.modifiers
-                if m.type == 'PARTICLE_SYSTEM' and m.show_render
-            ]
-            if particle_systems:
-                use_render_emitter = False
-                for mod, ps in particle_systems:
-                    pss = ps.settings
-                    if ob.show_instancer_for_render:
-                        use_render_emitter = True
-                    node = None
-                    if pss.type == 'HAIR' and pss.render_type == 'PATH':
-                        node = _AiCurvesPS(bpy.data.objects, ob, mod, ps, pss, shaders)
-                    elif pss.type == 'EMITTER' and pss.render_type in {'HALO', 'LINE', 'PATH'}:
-                        node = _AiPointsPS(bpy.data.objects, ob, ps, pss, bpy.context.scene.frame_current, shaders)
-                    if node is not None:
-                        if name is None:
-                            name = _Name(ob.name)
-                        arnold.AiNodeSetStr(node, "name", "%s&PS:%s" % (name, _RN.sub("_", ps.name)))
-                if not use_render_emitter:
+            if ob.is_instancer:
+                duplicators.append(ob)
+                if ob.instance_type in {'VERTS', 'FACES'}:
+                    duplicator_parent = ob.parent
+                if ob.show_instancer_for_render:
+                    arnold.AiMsgDebug(b"    particle system emitter")
+                else: 
+                    arnold.AiMsgDebug(b"    skip (duplicator)")
                     continue
 
-            if name is None:
-                name = _Name(ob.name)
+            if ob.type in _CT:
+                name = None
+
+                particle_systems = [
+                    (m, m.particle_system) for m in ob.modifiers
+                    if m.type == 'PARTICLE_SYSTEM' and m.show_render
+                ]
+                if particle_systems:
+                    use_render_emitter = False
+                    for mod, ps in particle_systems:
+                        pss = ps.settings
+                        if ob.show_instancer_for_render:
+                            use_render_emitter = True
+                        node = None
+                        with _Phase("particles"):
+                            if pss.type == 'HAIR' and pss.render_type == 'PATH':
+                                node = _AiCurvesPS(bpy.data.objects, ob, mod, ps, pss, shaders)
+                            elif pss.type == 'EMITTER' and pss.render_type in {'HALO', 'LINE', 'PATH'}:
+                                node = _AiPointsPS(bpy.data.objects, ob, ps, pss, bpy.context.scene.frame_current, shaders)
+                        if node is not None:
+                            if name is None:
+                                name = _Name(ob.name)
+                            arnold.AiNodeSetStr(node, "name", "%s&PS:%s" % (name, _RN.sub("_", ps.name)))
+                    if not use_render_emitter:
+                        continue
 
-            modified = ob.is_modified(bpy.context.scene, 'RENDER')
-            if not modified:
-                inode = inodes.get(ob.data)
-                if inode is not None:
-                    node = arnold.AiNode("ginstance")
-                    arnold.AiNodeSetStr(node, "name", name)
-                    arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(ob.matrix_world))
-                    arnold.AiNodeSetBool(node, "inherit_xform", False)
-                    arnold.AiNodeSetPtr(node, "node", inode)
-                    _export_object_properties(ob, node)
-                    arnold.AiMsgDebug(b"    instance (%S)", ob.data.name)
-                    continue
+                if name is None:
+                    name = _Name(ob.name)
 
-            with _Mesh(ob) as mesh:
-                if mesh is not None:
-                    node = _AiPolymesh(mesh, shaders)
+                modified = ob.is_modified(bpy.context.scene, 'RENDER')
+                if not modified:
+                    inode = inodes.get(ob.data)
+                    if inode is not None:
+                        node = arnold.AiNode("ginstance")
+                        arnold.AiNodeSetStr(node, "name", name)
+                        arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(ob.matrix_world))
+                        arnold.AiNodeSetBool(node, "inherit_xform", False)
+                        arnold.AiNodeSetPtr(node, "node", inode)
+                        _export_object_properties(ob, node)
+                        arnold.AiMsgDebug(b"    instance (%S)", ob.data.name)
+                        continue
+
+                # modified or single user copies with identical evaluated geometry
+                arrays = _Arrays(ob) if ob.type == 'MESH' else None
+                gkey = None
+                if arrays is not None:
+                    with _Phase("instancing"):
+                        gkey = (
+                            _CACHE.digest(arrays),
+                            tuple(slot.material for slot in ob.material_slots),
+                            _shape_properties(ob)
+                        )
+                    inode = gnodes.get(gkey)
+                    if inode is not None:
+                        node = arnold.AiNode("ginstance")
+                        arnold.AiNodeSetStr(node, "name", name)
+                        arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(ob.matrix_world))
+                        arnold.AiNodeSetBool(node, "inherit_xform", False)
+                        arnold.AiNodeSetPtr(node, "node", inode)
+                        _export_object_properties(ob, node)
+                        arnold.AiMsgDebug(b"    instance (geometry)")
+                        ninstances += 1
+                        continue
+
+                node = _Polymesh(ob, arrays)
+                if node is not None:
                     arnold.AiNodeSetStr(node, "name", name)
                     arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(ob.matrix_world))
                     _export_object_properties(ob, node)
                     if not modified:
                         # cache unmodified shapes for instancing
                         inodes[ob.data] = node
+                    if gkey is not None:
+                        gnodes[gkey] = node
                     # cache for duplicators
                     nodes[ob] = node
-        elif ob.type == 'LIGHT':
-            lamp = ob.data
-            light = lamp.arnold
-            matrix = ob.matrix_world.copy()
-            if lamp.type == 'POINT':
-                node = arnold.AiNode("point_light")
-                arnold.AiNodeSetFlt(node, "radius", light.radius)
-                arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                arnold.AiMsgDebug(b"    point_light")
-            elif lamp.type == 'SUN':
-                node = arnold.AiNode("distant_light")
-                arnold.AiNodeSetFlt(node, "angle", light.angle)
-                arnold.AiMsgDebug(b"    distant_light")
-            elif lamp.type == 'SPOT':
-                node = arnold.AiNode("spot_light")
-                arnold.AiNodeSetFlt(node, "radius", light.radius)
-                arnold.AiNodeSetFlt(node, "lens_radius", light.lens_radius)
-                arnold.AiNodeSetFlt(node, "cone_angle", math.degrees(lamp.spot_size))
-                arnold.AiNodeSetFlt(node, "penumbra_angle", light.penumbra_angle)
-                arnold.AiNodeSetFlt(node, "aspect_ratio", light.aspect_ratio)
-                arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                arnold.AiMsgDebug(b"    spot_light")
-            elif lamp.type == 'HEMI':
-                node = arnold.AiNode("skydome_light")
-                arnold.AiNodeSetInt(node, "resolution", light.resolution)
-                arnold.AiNodeSetStr(node, "format", light.format)
-                arnold.AiMsgDebug(b"    skydome_light")
-            elif lamp.type == 'AREA':
-                node = arnold.AiNode(light.type)
-                if light.type == 'cylinder_light':
-                    top = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, lamp.size_y / 2, 0))
-                    arnold.AiNodeSetArray(node, "top", top)
-                    bottom = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, -lamp.size_y / 2, 0))
-                    arnold.AiNodeSetArray(node, "bottom", bottom)
-                    arnold.AiNodeSetFlt(node, "radius", lamp.size / 2)
+            elif ob.type == 'LIGHT':
+                lamp = ob.data
+                light = lamp.arnold
+                matrix = ob.matrix_world.copy()
+                if lamp.type == 'POINT':
+                    node = arnold.AiNode("point_light")
+                    arnold.AiNodeSetFlt(node, "radius", light.radius)
                     arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                elif light.type == 'disk_light':
-                    arnold.AiNodeSetFlt(node, "radius", lamp.size / 2)
-                    #arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                elif light.type == 'quad_light':
-                    x = lamp.size / 2
-                    y = lamp.size_y / 2 if lamp.shape == 'RECTANGLE' else x
-                    verts = arnold.AiArrayAllocate(4, 1, arnold.AI_TYPE_VECTOR)
-                    arnold.AiArraySetVec(verts, 0, arnold.AtVector(-x, -y, 0))
-                    arnold.AiArraySetVec(verts, 1, arnold.AtVector(-x, y, 0))
-                    arnold.AiArraySetVec(verts, 2, arnold.AtVector(x, y, 0))
-                    arnold.AiArraySetVec(verts, 3, arnold.AtVector(x, -y, 0))
-                    arnold.AiNodeSetArray(node, "vertices", verts)
-                    arnold.AiNodeSetInt(node, "resolution", light.quad_resolution)
-                    #arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                elif light.type == 'photometric_light':
-                    arnold.AiNodeSetStr(node, "filename", bpy.path.abspath(light.filename))
-                    matrix = matrix @ _MR
-                elif light.type == 'mesh_light':
+                    arnold.AiMsgDebug(b"    point_light")
+                elif lamp.type == 'SUN':
+                    node = arnold.AiNode("distant_light")
+                    arnold.AiNodeSetFlt(node, "angle", light.angle)
+                    arnold.AiMsgDebug(b"    distant_light")
+                elif lamp.type == 'SPOT':
+                    node = arnold.AiNode("spot_light")
+                    arnold.AiNodeSetFlt(node, "radius", light.radius)
+                    arnold.AiNodeSetFlt(node, "lens_radius", light.lens_radius)
+                    arnold.AiNodeSetFlt(node, "cone_angle", math.degrees(lamp.spot_size))
+                    arnold.AiNodeSetFlt(node, "penumbra_angle", light.penumbra_angle)
+                    arnold.AiNodeSetFlt(node, "aspect_ratio", light.aspect_ratio)
                     arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                    if light.mesh:
-                        mesh_lights.append((node, light.mesh))
-            else:
-                arnold.AiMsgDebug(b"    skip (unsupported)")
-                continue
+                    arnold.AiMsgDebug(b"    spot_light")
+                elif lamp.type == 'HEMI':
+                    node = arnold.AiNode("skydome_light")
+                    arnold.AiNodeSetInt(node, "resolution", light.resolution)
+                    arnold.AiNodeSetStr(node, "format", light.format)
+                    arnold.AiMsgDebug(b"    skydome_light")
+                elif lamp.type == 'AREA':
+                    node = arnold.AiNode(light.type)
+                    if light.type == 'cylinder_light':
+                        top = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, lamp.size_y / 2, 0))
+                        arnold.AiNodeSetArray(node, "top", top)
+                        bottom = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, -lamp.size_y / 2, 0))
+                        arnold.AiNodeSetArray(node, "bottom", bottom)
+                        arnold.AiNodeSetFlt(node, "radius", lamp.size / 2)
+                        arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
+                    elif light.type == 'disk_light':
+                        arnold.AiNodeSetFlt(node, "radius", lamp.size / 2)
+                        #arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
+                    elif light.type == 'quad_light':
+                        x = lamp.size / 2
+                        y = lamp.size_y / 2 if lamp.shape == 'RECTANGLE' else x
+                        verts = arnold.AiArrayAllocate(4, 1, arnold.AI_TYPE_VECTOR)
+                        arnold.AiArraySetVec(verts, 0, arnold.AtVector(-x, -y, 0))
+                        arnold.AiArraySetVec(verts, 1, arnold.AtVector(-x, y, 0))
+                        arnold.AiArraySetVec(verts, 2, arnold.AtVector(x, y, 0))
+                        arnold.AiArraySetVec(verts, 3, arnold.AtVector(x, -y, 0))
+                        arnold.AiNodeSetArray(node, "vertices", verts)
+                        arnold.AiNodeSetInt(node, "resolution", light.quad_resolution)
+                        #arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
+                    elif light.type == 'photometric_light':
+                        arnold.AiNodeSetStr(node, "filename", bpy.path.abspath(light.filename))
+                        matrix = matrix @ _MR
+                    elif light.type == 'mesh_light':
+                        arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
+                        if light.mesh:
+                            mesh_lights.append((node, light.mesh))
+                else:
+                    arnold.AiMsgDebug(b"    skip (unsupported)")
+                    continue
 
-            name = _Name(ob.name)
-            arnold.AiNodeSetStr(node, "name", name)
-            color_node = None
-            if lamp.use_nodes:
-                filter_nodes = []
-                for _node in lamp.node_tree.nodes:
-                    if isinstance(_node, nt.ArnoldNodeLightOutput) and _node.is_active:
-                        for input in _node.inputs:
-                            if input.is_linked:
-                                _node = _AiNode(input.links[0].from_node, name, lamp_nodes)
-                                if input.identifier == "color":
-                                    color_node = _node
-                                elif input.bl_idname == "ArnoldNodeSocketFilter":
-                                    filter_nodes.append(_node)
-                        break
-                if filter_nodes:
-                    filters = arnold.AiArray(len(filter_nodes), 1, arnold.AI_TYPE_NODE, *filter_nodes)
-                    arnold.AiNodeSetArray(node, "filters", filters)
-            if color_node is None:
-                arnold.AiNodeSetRGB(node, "color", *lamp.color)
+                name = _Name(ob.name)
+                arnold.AiNodeSetStr(node, "name", name)
+                color_node = None
+                if lamp.use_nodes:
+                    filter_nodes = []
+                    for _node in lamp.node_tree.nodes:
+                        if isinstance(_node, nt.ArnoldNodeLightOutput) and _node.is_active:
+                            for input in _node.inputs:
+                                if input.is_linked:
+                                    _node = _AiNode(input.links[0].from_node, name, lamp_nodes)
+                                    if input.identifier == "color":
+                                        color_node = _node
+                                    elif input.bl_idname == "ArnoldNodeSocketFilter":
+                                        filter_nodes.append(_node)
+                            break
+                    if filter_nodes:
+                        filters = arnold.AiArray(len(filter_nodes), 1, arnold.AI_TYPE_NODE, *filter_nodes)
+                        arnold.AiNodeSetArray(node, "filters", filters)
+                if color_node is None:
+                    arnold.AiNodeSetRGB(node, "color", *lamp.color)
+                else:
+                    arnold.AiNodeLink(color_node, "color", node)
+                arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(matrix))
+                arnold.AiNodeSetFlt(node, "intensity", light.intensity)
+                arnold.AiNodeSetFlt(node, "exposure", light.exposure)
+                arnold.AiNodeSetBool(node, "cast_shadows", light.cast_shadows)
+                arnold.AiNodeSetBool(node, "cast_volumetric_shadows", light.cast_volumetric_shadows)
+                arnold.AiNodeSetFlt(node, "shadow_density", light.shadow_density)
+                arnold.AiNodeSetRGB(node, "shadow_color", *light.shadow_color)
+                arnold.AiNodeSetInt(node, "samples", light.samples)
+                arnold.AiNodeSetBool(node, "normalize", light.normalize)
+                #arnold.AiNodeSetBool(node, "affect_diffuse", light.affect_diffuse)
+                # arnold.AiNodeSetBool(node, "affect_specular", light.affect_specular)
+                # arnold.AiNodeSetBool(node, "affect_volumetrics", light.affect_volumetrics)
+                arnold.AiNodeSetFlt(node, "diffuse", light.diffuse)
+                arnold.AiNodeSetFlt(node, "specular", light.specular)
+                arnold.AiNodeSetFlt(node, "sss", light.sss)
+                arnold.AiNodeSetFlt(node, "indirect", light.indirect)
+                arnold.AiNodeSetInt(node, "max_bounces", light.max_bounces)
+                arnold.AiNodeSetInt(node, "volume_samples", light.volume_samples)
+                arnold.AiNodeSetFlt(node, "volume", light.volume)
             else:
-                arnold.AiNodeLink(color_node, "color", node)
-            arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(matrix))
-            arnold.AiNodeSetFlt(node, "intensity", light.intensity)
-            arnold.AiNodeSetFlt(node, "exposure", light.exposure)
-            arnold.AiNodeSetBool(node, "cast_shadows", light.cast_shadows)
-            arnold.AiNodeSetBool(node, "cast_volumetric_shadows", light.cast_volumetric_shadows)
-            arnold.AiNodeSetFlt(node, "shadow_density", light.shadow_density)
-            arnold.AiNodeSetRGB(node, "shadow_color", *light.shadow_color)
-            arnold.AiNodeSetInt(node, "samples", light.samples)
-            arnold.AiNodeSetBool(node, "normalize", light.normalize)
-            #arnold.AiNodeSetBool(node, "affect_diffuse", light.affect_diffuse)
-            # arnold.AiNodeSetBool(node, "affect_specular", light.affect_specular)
-            # arnold.AiNodeSetBool(node, "affect_volumetrics", light.affect_volumetrics)
-            arnold.AiNodeSetFlt(node, "diffuse", light.diffuse)
-            arnold.AiNodeSetFlt(node, "specular", light.specular)
-            arnold.AiNodeSetFlt(node, "sss", light.sss)
-            arnold.AiNodeSetFlt(node, "indirect", light.indirect)
-            arnold.AiNodeSetInt(node, "max_bounces", light.max_bounces)
-            arnold.AiNodeSetInt(node, "volume_samples", light.volume_samples)
-            arnold.AiNodeSetFlt(node, "volume", light.volume)
-        else:
-            arnold.AiMsgDebug(b"    skip (unsupported)")
+                arnold.AiMsgDebug(b"    skip (unsupported)")
 
-    for duplicator in duplicators:
-        i = 0
-        pc = time.perf_counter()
-        arnold.AiMsgDebug(b"[DUPLI:%S:%S] '%S'", duplicator.type,
-                         duplicator.instance_type, duplicator.name)
-        arnold.AiMsgTab(4)
-        try:
-            for d in depsgraph.object_instances:
-                if d.is_instance:
-                    ob = d.instance_object.original
-                    if not ob.hide_render and ob.instance_type not in {'VERTS', 'FACES'} and ob.type in _CT:
-                        onode = nodes.get(ob)
-                        if onode is None:
-                            arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
-                            with _Mesh(ob) as mesh:
-                                if mesh is not None:
-                                    node = _AiPolymesh(mesh, shaders)
+        for duplicator in duplicators:
+            i = 0
+            pc = time.perf_counter()
+            arnold.AiMsgDebug(b"[DUPLI:%S:%S] '%S'", duplicator.type,
+                             duplicator.instance_type, duplicator.name)
+            arnold.AiMsgTab(4)
+            try:
+                for d in depsgraph.object_instances:
+                    if d.is_instance:
+                        ob = d.instance_object.original
+                        if not ob.hide_render and ob.instance_type not in {'VERTS', 'FACES'} and ob.type in _CT:
+                            onode = nodes.get(ob)
+                            if onode is None:
+                                arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
+                                node = _Polymesh(ob)
+                                if node is not None:
                                     arnold.AiNodeSetStr(node, "name", _Name(ob.name))
                                     arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(d.matrix_world.copy()))
                                     nodes[ob] = node
-                        else:
-                            node = arnold.AiNode("ginstance")
-                            arnold.AiNodeSetStr(node, "name", _Name(ob.name))
-                            arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(d.matrix_world.copy()))
-                            arnold.AiNodeSetBool(node, "inherit_xform", False)
-                            arnold.AiNodeSetPtr(node, "node", onode)
-                            i += 1
-                        _export_object_properties(ob, node)
-            arnold.AiMsgDebug(b"instances %d (%f)", ctypes.c_int(i),
-                             ctypes.c_double(time.perf_counter() - pc))
-        finally:
-            arnold.AiMsgTab(-4)
-
-    ##############################
-    ## mesh lights
-    for light_node, name in mesh_lights:
-        ob = bpy.data.objects.get(name)
-        if ob is None:
-            continue
-        node = nodes.get(ob)
-        if node is None:
-            if ob.type not in _CT:
+                            else:
+                                node = arnold.AiNode("ginstance")
+                                arnold.AiNodeSetStr(node, "name", _Name(ob.name))
+                                arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(d.matrix_world.copy()))
+                                arnold.AiNodeSetBool(node, "inherit_xform", False)
+                                arnold.AiNodeSetPtr(node, "node", onode)
+                                i += 1
+                            _export_object_properties(ob, node)
+                arnold.AiMsgDebug(b"instances %d (%f)", ctypes.c_int(i),
+                                 ctypes.c_double(time.perf_counter() - pc))
+                if _PROFILER is not None:
+                    _PROFILER.add("instancing", time.perf_counter() - pc, ob=duplicator.name)
+            finally:
+                arnold.AiMsgTab(-4)
+
+        ##############################
+        ## mesh lights
+        for light_node, name in mesh_lights:
+            ob = bpy.data.objects.get(name)
+            if ob is None:
                 continue
-            arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
-            with _Mesh(ob) as mesh:
-                if mesh is not None:
-                    node = _AiPolymesh(mesh, shaders)
+            node = nodes.get(ob)
+            if node is None:
+                if ob.type not in _CT:
+                    continue
+                arnold.AiMsgDebug(b"[%S] '%S'", ob.type, ob.name)
+                node = _Polymesh(ob)
+                if node is not None:
                     arnold.AiNodeSetStr(node, "name", _Name(ob.name))
                     arnold.AiNodeSetMatrix(node, "matrix", _AiMatrix(ob.matrix_world))
                     nodes[ob] = node
-        arnold.AiNodeSetPtr(light_node, "mesh", node)
+            arnold.AiNodeSetPtr(light_node, "mesh", node)
+
+    if _PROFILER is not None:
+        _PROFILER.object = None
+    pc = time.perf_counter()
+
+    arnold.AiMsgDebug(b"geometry instances: %d", ctypes.c_int(ninstances))
+    arnold.AiMsgDebug(b"shader nodes: %d created, %d shared", ctypes.c_int(shaders.nodes.misses),
+                      ctypes.c_int(shaders.nodes.hits))
 
     render = bpy.context.scene.render
     aspect_x = render.pixel_aspect_x
@@ -929,60 +1113,7 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
         arnold.AiNodeSetBool(options, "AA_sample_clamp_affects_aovs", opts.AA_sample_clamp_affects_aovs)
     if not opts.auto_threads:
         arnold.AiNodeSetInt(options, "threads", opts.threads)
-    arnold.AiNodeSetStr(options, "thread_priority", opts.thread_priority)
-    arnold.AiNodeSetStr(options, "pin_threads", opts.pin_threads)
-    arnold.AiNodeSetBool(options, "abort_on_error", opts.abort_on_error)
-    arnold.AiNodeSetBool(options, "abort_on_license_fail", opts.abort_on_license_fail)
-    arnold.AiNodeSetBool(options, "skip_license_check", opts.skip_license_check)
-    arnold.AiNodeSetRGB(options, "error_color_bad_texture", *opts.error_color_bad_texture)
-    arnold.AiNodeSetRGB(options, "error_color_bad_pixel", *opts.error_color_bad_pixel)
-    arnold.AiNodeSetRGB(options, "error_color_bad_shader", *opts.error_color_bad_shader)
-    arnold.AiNodeSetInt(options, "bucket_size", opts.bucket_size)
-    arnold.AiNodeSetStr(options, "bucket_scanning", opts.bucket_scanning)
-    arnold.AiNodeSetBool(options, "ignore_textures", opts.ignore_textures)
-    arnold.AiNodeSetBool(options, "ignore_shaders", opts.ignore_shaders)
-    arnold.AiNodeSetBool(options, "ignore_atmosphere", opts.ignore_atmosphere)
-    arnold.AiNodeSetBool(options, "ignore_lights", opts.ignore_lights)
-    arnold.AiNodeSetBool(options, "ignore_shadows", opts.ignore_shadows)
-    #TODO: DELETE? arnold.AiNodeSetBool(options, "ignore_direct_lighting", opts.ignore_direct_lighting)
-    arnold.AiNodeSetBool(options, "ignore_subdivision", opts.ignore_subdivision)
-    arnold.AiNodeSetBool(options, "ignore_displacement", opts.ignore_displacement)
-    arnold.AiNodeSetBool(options, "ignore_bump", opts.ignore_bump)
-    arnold.AiNodeSetBool(options, "ignore_motion_blur", opts.ignore_motion_blur)
-    arnold.AiNodeSetBool(options, "ignore_dof", opts.ignore_dof)
-    arnold.AiNodeSetBool(options, "ignore_smoothing", opts.ignore_smoothing)
-    arnold.AiNodeSetBool(options, "ignore_sss", opts.ignore_sss)
-    # TODO: DELETE? arnold.AiNodeSetStr(options, "auto_transparency_mode", opts.auto_transparency_mode)
-    arnold.AiNodeSetInt(options, "auto_transparency_depth", opts.auto_transparency_depth)
-    # TODO: DELETE? arnold.AiNodeSetFlt(options, "auto_transparency_threshold", opts.auto_transparency_threshold)
-    arnold.AiNodeSetInt(options, "texture_max_open_files", opts.texture_max_open_files)
-    arnold.AiNodeSetFlt(options, "texture_max_memory_MB", opts.texture_max_memory_MB)
-    arnold.AiNodeSetStr(options, "texture_searchpath", opts.texture_searchpath)
-    arnold.AiNodeSetBool(options, "texture_automip", opts.texture_automip)
-    arnold.AiNodeSetInt(options, "texture_autotile", opts.texture_autotile)
-    arnold.AiNodeSetBool(options, "texture_accept_untiled", opts.texture_accept_untiled)
-    arnold.AiNodeSetBool(options, "texture_accept_unmipped", opts.texture_accept_unmipped)
-    #arnold.AiNodeSetFlt(options, "texture_specular_blur", opts.texture_specular_blur)
-    #arnold.AiNodeSetFlt(options, "texture_diffuse_blur", opts.texture_diffuse_blur)
-    arnold.AiNodeSetFlt(options, "low_light_threshold", opts.low_light_threshold)
-    arnold.AiNodeSetInt(options, "GI_sss_samples", opts.GI_sss_samples)
-    arnold.AiNodeSetBool(options, "sss_use_autobump", opts.sss_use_autobump)
-    arnold.AiNodeSetInt(options, "GI_volume_samples", opts.GI_volume_samples)
-    arnold.AiNodeSetByte(options, "max_subdivisions", opts.max_subdivisions)
-    arnold.AiNodeSetStr(options, "procedural_searchpath", opts.procedural_searchpath)
-    arnold.AiNodeSetStr(options, "plugin_searchpath", opts.plugin_searchpath)
-    # TODO: DELETE? arnold.AiNodeSetFlt(options, "texture_gamma", opts.texture_gamma)
-    # TODO: DELETE? arnold.AiNodeSetFlt(options, "light_gamma", opts.light_gamma)
-    # TODO: DELETE? arnold.AiNodeSetFlt(options, "shader_gamma", opts.shader_gamma)
-    arnold.AiNodeSetInt(options, "GI_diffuse_depth", opts.GI_diffuse_depth)
-    arnold.AiNodeSetInt(options, "GI_specular_depth", opts.GI_specular_depth)
-    # TODO: DELETE? arnold.AiNodeSetInt(options, "GI_reflection_depth", opts.GI_reflection_depth)
-    arnold.AiNodeSetInt(options, "GI_transmission_depth", opts.GI_transmission_depth)
-    arnold.AiNodeSetInt(options, "GI_volume_depth", opts.GI_volume_depth)
-    arnold.AiNodeSetInt(options, "GI_total_depth", opts.GI_total_depth)
-    arnold.AiNodeSetInt(options, "GI_diffuse_samples", opts.GI_diffuse_samples)
-    arnold.AiNodeSetInt(options, "GI_specular_samples", opts.GI_specular_samples)
-    arnold.AiNodeSetInt(options, "GI_transmission_samples", opts.GI_transmission_samples)
+    _OPTIONS.apply(options, opts)
 
     ##############################
     ## camera
@@ -1039,7 +1170,7 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
     ##############################
     ## world
     world = bpy.context.scene.world
-    if world:
+    if world and not shapes_only:
         if world.use_nodes:
             for _node in world.node_tree.nodes:
                 if isinstance(_node, nt.ArnoldNodeWorldOutput) and _node.is_active:
@@ -1089,37 +1220,182 @@ def _export(data, depsgraph, camera, xres, yres, session=None):
         arnold.AiNodeSetFlt(filter, "width", opts.sample_filter_width)
         arnold.AiNodeSetStr(filter, "filter_weights", opts.sample_filter_weights)
 
-    display = arnold.AiNode("driver_display_callback")
-    arnold.AiNodeSetStr(display, "name", "__driver")
-    outputs_aovs = ( str.encode(opts.aov_pass + "__driver"), )
-
-    outputs = arnold.AiArray(len(outputs_aovs), 1, arnold.AI_TYPE_STRING, *outputs_aovs)
-    arnold.AiNodeSetArray(options, "outputs", outputs)
+    display, aovs = _AiOutputs(options, opts, session)
 
     AA_samples = opts.AA_samples
     if session is not None:
         session["display"] = display
         session["offset"] = xoff, yoff
+        session["bucket_size"] = opts.bucket_size
+        session["aovs"] = aovs
         if opts.progressive_refinement:
             isl = opts.initial_sampling_level
             session["ipr"] = (isl, AA_samples + 1)
             AA_samples = isl
     arnold.AiNodeSetInt(options, "AA_samples", AA_samples)
+    if _PROFILER is not None:
+        _PROFILER.add("options", time.perf_counter() - pc)
 
     arnold.AiMsgDebug(b"ARNOLD DEBUG: <<<")
 
 
-def export_ass(data, depsgraph, camera, xres, yres, filepath, open_procs, binary):
+def _export_chunks(split):
+    """Group objects for a split .ass export.
+
+    Returns:
+        tuple: ({chunk name: [Object]}, [Object] left in the master file)
+    """
+    chunks = collections.OrderedDict()
+    master = []
+    for ob in bpy.data.objects:
+        if ob.type not in _CT or ob.hide_render or not ob.visible_get():
+            master.append(ob)
+        elif split == 'OBJECT':
+            chunks[ob.name] = [ob]
+        else:
+            collection = ob.users_collection[0].name if ob.users_collection else ""
+            chunks.setdefault(collection, []).append(ob)
+    return chunks, master
+
+
+def export_ass(data, depsgraph, camera, xres, yres, filepath, open_procs, binary,
+               split='NONE', compress=False):
+    """
+    Args:
+        split (str): 'NONE', 'OBJECT' or 'COLLECTION', write geometry of
+            every object or collection into its own file referenced by
+            procedural nodes of the master file.
+        compress (bool): gzip chunk files.
+    """
+    procedurals = []
+    if split != 'NONE':
+        chunks, objects = _export_chunks(split)
+        dirname = os.path.splitext(filepath)[0] + "_chunks"
+        os.makedirs(dirname, exist_ok=True)
+        ext = ".ass.gz" if compress else ".ass"
+        for i, (name, chunk) in enumerate(chunks.items()):
+            path = os.path.join(dirname, "%04d_%s%s" % (i, _RN.sub("_", name), ext))
+            pc = time.perf_counter()
+            # every chunk is translated in its own universe and bypasses the
+            # geometry cache, so the memory is bounded by the largest chunk
+            arnold.AiBegin()
+            try:
+                _export(data, depsgraph, camera, xres, yres, objects=chunk, shapes_only=True,
+                        geometry_cache=False)
+                arnold.AiASSWrite(path, arnold.AI_NODE_SHAPE | arnold.AI_NODE_SHADER, open_procs, binary)
+            finally:
+                arnold.AiEnd()
+            print("Arnold: chunk '%s' [%d] (%f)" % (path, len(chunk), time.perf_counter() - pc))
+            procedurals.append((name, path))
+    else:
+        objects = None
+
     arnold.AiBegin()
     try:
-        _export(data, depsgraph, camera, xres, yres)
+        _export(data, depsgraph, camera, xres, yres, objects=objects)
+        _Name = _CleanNames("P", itertools.count())
+        for name, path in procedurals:
+            node = arnold.AiNode("procedural")
+            arnold.AiNodeSetStr(node, "name", _Name(name))
+            arnold.AiNodeSetStr(node, "filename", path)
         arnold.AiASSWrite(filepath, arnold.AI_NODE_ALL, open_procs, binary)
     finally:
         arnold.AiEnd()
 
 
+def _is_static(ob):
+    """True if neither the transform nor the geometry of an object is animated"""
+    if ob.is_instancer or any(m.type == 'PARTICLE_SYSTEM' for m in ob.modifiers):
+        return False
+    while ob is not None:
+        for id in (ob, ob.data):
+            ad = getattr(id, "animation_data", None)
+            if ad is not None and (ad.action is not None or ad.drivers):
+                return False
+        if ob.constraints or _CACHE.is_volatile(ob):
+            return False
+        ob = ob.parent
+    return True
+
+
+def frame_path(filepath, frame):
+    """Replace '#' sequence in the file name with the zero padded frame number"""
+    dirname, basename = os.path.split(filepath)
+    m = re.search("#+", basename)
+    if m is None:
+        root, ext = os.path.splitext(basename)
+        if root.endswith(".ass"):  # .ass.gz
+            root, ext = root[:-4], ".ass" + ext
+        basename = "%s.%04d%s" % (root, frame, ext)
+    else:
+        basename = "%s%0*d%s" % (basename[:m.start()], m.end() - m.start(), frame, basename[m.end():])
+    return os.path.join(dirname, basename)
+
+
+def export_ass_static(data, depsgraph, camera, xres, yres, filepath, binary):
+    """Write geometry of the static objects to an include file for export_ass_frames.
+
+    Returns:
+        int: number of static objects.
+    """
+    objects = [
+        ob for ob in bpy.data.objects
+        if ob.type in _CT and not ob.hide_render and ob.visible_get() and _is_static(ob)
+    ]
+    arnold.AiBegin()
+    try:
+        _export(data, depsgraph, camera, xres, yres, objects=objects, shapes_only=True)
+        arnold.AiASSWrite(filepath, arnold.AI_NODE_SHAPE | arnold.AI_NODE_SHADER, False, binary)
+    finally:
+        arnold.AiEnd()
+    return len(objects)
+
+
+def export_ass_frames(data, camera, xres, yres, filepath, frames, open_procs, binary,
+                      include=None, progress=None):
+    """Export a frame sequence, one .ass file per frame.
+
+    Args:
+        filepath (str): file path, '#' sequence is replaced by the frame number.
+        frames (iterable): frame numbers.
+        include (str): static geometry written by export_ass_static, the
+            static objects are skipped and the file is referenced by a procedural.
+        progress (callable): progress(frame), called after each written frame.
+    """
+    scene = bpy.context.scene
+    objects = None
+    if include:
+        objects = [
+            ob for ob in bpy.data.objects
+            if ob.type not in _CT or ob.hide_render or not ob.visible_get() or not _is_static(ob)
+        ]
+    for frame in frames:
+        pc = time.perf_counter()
+        scene.frame_set(frame)
+        path = frame_path(filepath, frame)
+        # write a hidden file and rename it, so finished frames appear atomically
+        dirname, basename = os.path.split(path)
+        tmp = os.path.join(dirname, "." + basename)
+        arnold.AiBegin()
+        try:
+            _export(data, bpy.context.depsgraph, camera, xres, yres, objects=objects)
+            if include:
+                node = arnold.AiNode("procedural")
+                arnold.AiNodeSetStr(node, "name", "P::static")
+                arnold.AiNodeSetStr(node, "filename", include)
+            arnold.AiASSWrite(tmp, arnold.AI_NODE_ALL, open_procs, binary)
+        finally:
+            arnold.AiEnd()
+        os.replace(tmp, path)
+        print("Arnold: frame %d '%s' (%f)" % (frame, path, time.perf_counter() - pc))
+        if progress is not None:
+            progress(frame)
+
+
 def update(engine, data, depsgraph):
+    global _PROFILER
     print("Arnold Engine Updating...")
+    _PROFILER = _PROFILE.Profiler() if bpy.context.scene.arnold.profile else None
     engine.use_highlight_tiles = True
     engine._session = {}
     bpy.context.scene.frame_set(bpy.context.scene.frame_current)
@@ -1132,335 +1408,459 @@ def update(engine, data, depsgraph):
 
 
 def render(engine, depsgraph):
+    thread = None
     try:
         session = engine._session
         xoff, yoff = session["offset"]
 
         _htiles = {}  # highlighted tiles
         session["peak"] = 0  # memory peak usage
-        
-        def display_callback(x, y, width, height, buffer, data):
-            _x = x - xoff
-            _y = y - yoff
-            if buffer:
-                try:
-                    result = _htiles.pop((_x, _y), None)
-                    if result is None:
-                        result = engine.begin_result(_x, _y, width, height)
-                    _buffer = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_float))
-                    rect = numpy.ctypeslib.as_array(_buffer, shape=(width * height, 4))
-                    result.layers[0].passes[0].rect = rect
-                    engine.end_result(result)
-
-                    # HACK: Update Render Progress
-                    display_callback.counter += 0.0020
-                    engine.update_progress(display_callback.counter)
-                
-                finally:
-                    arnold.AiFree(buffer)
-            else:
-                result = engine.begin_result(_x, engine.resolution_y - _y - height, width, height)
-                _htiles[(_x, _y)] = result
-
-            if engine.test_break():
-                arnold.AiRenderAbort()
-                while _htiles:
-                    (_x, _y), result = _htiles.popitem()
-                    engine.end_result(result, cancel=True)
 
-            mem = session["mem"] = arnold.AiMsgUtilGetUsedMemory() / 1048576  # 1024*1024
-            peak = session["peak"] = max(session["peak"], mem)
-            engine.update_memory_stats(memory_used=mem, memory_peak=peak)
-
-        # display callback must be a variable
-        cb = arnold.AtDisplayCallBack(display_callback)
-        arnold.AiNodeSetPtr(session["display"], "callback", cb)
+        # finished buckets are queued by the display drivers and written to
+        # the result here, render threads never enter python
+        aovs = session["aovs"]
+        display = session["display"]
+        entry = arnold.AiNodeGetNodeEntry(display)
+        if arnold.AiNodeEntryLookUpParameter(entry, "ring"):
+            # a slab holds the bucket of every AOV
+            slab_size = session["bucket_size"] ** 2 * 4 * (1 + len(aovs))
+            ring = _TILES.TileRing((os.cpu_count() or 1) * 4, slab_size,
+                                   arnold.AiNodeEntryGetFilename(entry), (xoff, yoff))
+            arnold.AiNodeSetPtr(display, "ring", ring.address)
+        else:
+            # driver built before the ring, it calls back with the beauty only
+            print("Arnold: display driver without tile ring, AOVs are skipped")
+            ring = _TILES.CallbackTiles((xoff, yoff))
+            arnold.AiNodeSetPtr(display, "callback", ring.callback)
+            aovs = []
+        for name, channels, chan_id in aovs:
+            engine.add_pass(name, channels, chan_id)
+
+        def _write(result, rects):
+            passes = result.layers[0].passes
+            passes[0].rect = rects[0]
+            for (name, channels, chan_id), rect in zip(aovs, rects[1:]):
+                passes.find_by_name(name, "").rect = rect[:, :channels]
+            engine.end_result(result)
+
+        status = {}
+
+        def _render():
+            res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
+            if res != arnold.AI_SUCCESS:
+                ipr = session.get("ipr")
+                if ipr:
+                    options = arnold.AiUniverseGetOptions()
+                    for sl in range(*ipr):
+                        arnold.AiNodeSetInt(options, "AA_samples", sl)
+                        res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
+                        if res == arnold.AI_SUCCESS:
+                            break
+                        status["sl"] = sl
+            status["res"] = res
+
+        thread = threading.Thread(target=_render, name="barnold-render")
+        thread.start()
+        pc = time.perf_counter()
 
         # HACK: Update Render Progress
-        display_callback.counter = 0
+        progress = 0
+        stats = 0
+        aborted = False
+        while True:
+            done = not thread.is_alive()
+            highlights, finished = ring.drain()
+            keys = {(t[0], t[1]) for t in finished}
+            for _x, _y, width, height, slot, pixels in highlights:
+                key = (_x, _y)
+                if key not in keys and key not in _htiles:
+                    _htiles[key] = engine.begin_result(_x, engine.resolution_y - _y - height, width, height)
+            tiles = []
+            for t in finished:
+                result = _htiles.pop((t[0], t[1]), None)
+                if result is None:
+                    tiles.append(t[:4] + (t[5], ))
+                else:
+                    _write(result, t[5])
+            # all passes of adjacent tiles in one result
+            for _x, _y, width, height, run in _TILES.rows(tiles):
+                result = engine.begin_result(_x, _y, width, height)
+                _write(result, [_TILES.join(height, [pixels[i] for pixels in run]) for i in range(len(run[0]))])
+            ring.release(finished)
+            progress += 0.0020 * len(finished)
 
-        res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
-        if res != arnold.AI_SUCCESS:
-            ipr = session.get("ipr")
-            if ipr:
-                options = arnold.AiUniverseGetOptions()
-                for sl in range(*ipr):
-                    arnold.AiNodeSetInt(options, "AA_samples", sl)
-                    res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
-                    if res == arnold.AI_SUCCESS:
-                        break
-                    engine.update_stats("", "Mem: %.2fMb, SL: %d" % (session.get("mem", "NA"), sl))
+            pc = time.perf_counter()
+            if done or pc - stats > 0.25:
+                stats = pc
+                engine.update_progress(progress)
+                mem = session["mem"] = arnold.AiMsgUtilGetUsedMemory() / 1048576  # 1024*1024
+                peak = session["peak"] = max(session["peak"], mem)
+                engine.update_memory_stats(memory_used=mem, memory_peak=peak)
+                sl = status.pop("sl", None)
+                if sl is not None:
+                    engine.update_stats("", "Mem: %.2fMb, SL: %d" % (mem, sl))
+
+            if not aborted and engine.test_break():
+                aborted = True
+                arnold.AiRenderAbort()
+            if done:
+                break
+            thread.join(0.01)
+
+        while _htiles:
+            (_x, _y), result = _htiles.popitem()
+            engine.end_result(result, cancel=True)
+        if _PROFILER is not None:
+            _PROFILER.add("render", time.perf_counter() - pc)
+        if ring.overflows:
+            arnold.AiMsgDebug(b"tile ring overflows: %d", ctypes.c_int(ring.overflows))
+
+        res = status["res"]
         if res != arnold.AI_SUCCESS:
             engine.error_set("Render status: %d" % res)
-    
+
     except:
         # cancel render on error
         engine.end_result(None, cancel=True)
     finally:
+        if thread is not None and thread.is_alive():
+            arnold.AiRenderAbort()
+            thread.join()
         del engine._session
         arnold.AiEnd()
+        if _PROFILER is not None:
+            _profile_report()
+
+
+def _profile_report():
+    """Keep the report of the profiled render for the UI and write it to the file"""
+    global _PROFILER
+    report = _PROFILE.LAST = _PROFILER.report()
+    _PROFILER = None
+    opts = bpy.context.scene.arnold
+    for ob in report["objects"][:opts.profile_top]:
+        print("Arnold: %s (%f) %d bytes" % (ob["name"], ob["seconds"], ob["bytes"]))
+    if opts.profile_filepath:
+        _PROFILE.write(report, bpy.path.abspath(opts.profile_filepath))
+
+def _IprNode(node, prefix, nodes, cache):
+    """
+    Args:
+        node (ArnoldNode): node.
+        prefix (str): node name prefix.
+        nodes (list): created IPR node descriptions [(ai_name, params)].
+        cache (dict): created nodes {Node: name}.
+    Returns:
+        str or None, name of the IPR node
+    """
+    name = cache.get(node)
+    if name is None and isinstance(node, nt.ArnoldNode):
+        name = "%s&N::%s" % (prefix, node.name)
+        cache[node] = name
+        params = {'name': ('STRING', name)}
+        for input in node.inputs:
+            if input.is_linked:
+                _name = _IprNode(input.links[0].from_node, prefix, nodes, cache)
+                if _name is not None:
+                    params[input.identifier] = ('LINK', _name)
+                    continue
+            if not input.hide_value:
+                v = input.default_value
+                if input.bl_idname in {'NodeSocketColor',
+                                       'NodeSocketVector',
+                                       'NodeSocketVectorXYZ',
+                                       'ArnoldNodeSocketColor'}:
+                    v = v[:]
+                params[input.identifier] = (input.bl_idname, v)
+        for n, (t, v) in node.ai_properties.items():
+            if t in {'RGB', 'RGBA', 'VECTOR'}:
+                v = v[:]
+            params[n] = (t, v)
+        nodes.append((node.ai_name, params))
+    return name
+
+
+def _IprShader(mat, nodes):
+    """Append IPR nodes of a material, returns the shader name"""
+    prefix = "M::" + mat.name
+    if mat.use_nodes:
+        for link in mat.node_tree.links:
+            name = _IprNode(link.from_node, prefix, nodes, {})
+            if name is not None:
+                return name
+    nodes.append(('lambert', {
+        'name': ('STRING', prefix),
+        'Kd_color': ('RGB', mat.diffuse_color[:3]),
+    }))
+    return prefix
+
+
+def _IprMatrix(ob):
+    matrix = ob.matrix_world
+    if ob.type == 'LIGHT' and ob.data.arnold.type == 'photometric_light':
+        matrix = matrix @ _MR
+    return ('MATRIX', numpy.reshape(matrix.transposed(), -1))
+
+
+def _IprPolymesh(ob, mesh, nodes, shaders, arena):
+    """
+    Args:
+        ob (bpy.types.Object): object.
+        mesh (bpy.types.Mesh): evaluated mesh.
+        nodes (list): created IPR node descriptions.
+        shaders (dict): exported shaders {Material: name}, the default
+            shader of empty slots is None.
+        arena (SharedArrays): memory shared with the IPR worker.
+    """
+    arrays = _MeshArrays(mesh, arena.empty)
+    share = arena.share
+    params = {
+        'name': ('STRING', "O::" + ob.name),
+        'matrix': _IprMatrix(ob),
+        'smoothing': ('BOOL', True),
+        'vlist': ('ARRAY', (arnold.AI_TYPE_VECTOR, share(arrays['vlist']))),
+        'nlist': ('ARRAY', (arnold.AI_TYPE_VECTOR, share(arrays['nlist']))),
+        'nsides': ('ARRAY', (arnold.AI_TYPE_UINT, share(arrays['nsides']))),
+        'vidxs': ('ARRAY', (arnold.AI_TYPE_UINT, share(arrays['vidxs']))),
+        'nidxs': ('RANGE', len(arrays['vidxs'])),
+    }
+    a = arrays['uvlist']
+    if a is not None:
+        params['uvlist'] = ('ARRAY', (arnold.AI_TYPE_VECTOR2, share(a)))
+        params['uvidxs'] = ('RANGE', len(a) // 2)
+
+    materials = [slot.material for slot in ob.material_slots]
+    a = arrays['shidxs']
+    if materials and a is not None:
+        def _shader(mat):
+            name = shaders.get(mat)
+            if name is None:
+                if mat is None:
+                    # same as Shaders.default of the final render
+                    name = "__default"
+                    nodes.append(('lambert', {'name': ('STRING', name)}))
+                else:
+                    name = _IprShader(mat, nodes)
+                shaders[mat] = name
+            return name
+
+        n = len(materials) - 1
+        a, names = _ShaderIndices(a, lambda i: _shader(materials[min(i, n)]), lambda mn: mn, a)
+        if len(names) > 1:
+            params['shader'] = ('NODES', names)
+            params['shidxs'] = ('ARRAY', (arnold.AI_TYPE_BYTE, share(a)))
+        else:
+            params['shader'] = ('NODE', names[0])
+    nodes.append(('polymesh', params))
+
+
+def _IprLight(ob, nodes):
+    """Append IPR light node, returns False if the light isn't supported"""
+    lamp = ob.data
+    light = lamp.arnold
+    name = "L::" + ob.name
+    params = {
+        'name': ('STRING', name),
+        'matrix': _IprMatrix(ob),
+    }
+    if lamp.type == 'POINT':
+        ai_name = "point_light"
+        params['radius'] = ('FLOAT', light.radius)
+        params['decay_type'] = ('STRING', light.decay_type)
+    elif lamp.type == 'SUN':
+        ai_name = "distant_light"
+        params['angle'] = ('FLOAT', light.angle)
+    elif lamp.type == 'SPOT':
+        ai_name = "spot_light"
+        params['radius'] = ('FLOAT', light.radius)
+        params['lens_radius'] = ('FLOAT', light.lens_radius)
+        params['cone_angle'] = ('FLOAT', math.degrees(lamp.spot_size))
+        params['penumbra_angle'] = ('FLOAT', light.penumbra_angle)
+        params['aspect_ratio'] = ('FLOAT', light.aspect_ratio)
+        params['decay_type'] = ('STRING', light.decay_type)
+    elif lamp.type == 'HEMI':
+        ai_name = "skydome_light"
+        params['resolution'] = ('INT', light.resolution)
+        params['format'] = ('STRING', light.format)
+    elif lamp.type == 'AREA':
+        ai_name = light.type
+        if ai_name == 'cylinder_light':
+            y = lamp.size_y / 2
+            params['top'] = ('ARRAY', (arnold.AI_TYPE_VECTOR, numpy.array([0, y, 0], dtype=numpy.float32)))
+            params['bottom'] = ('ARRAY', (arnold.AI_TYPE_VECTOR, numpy.array([0, -y, 0], dtype=numpy.float32)))
+            params['radius'] = ('FLOAT', lamp.size / 2)
+            params['decay_type'] = ('STRING', light.decay_type)
+        elif ai_name == 'disk_light':
+            params['radius'] = ('FLOAT', lamp.size / 2)
+        elif ai_name == 'quad_light':
+            x = lamp.size / 2
+            y = lamp.size_y / 2 if lamp.shape == 'RECTANGLE' else x
+            verts = numpy.array([-x, -y, 0, -x, y, 0, x, y, 0, x, -y, 0], dtype=numpy.float32)
+            params['vertices'] = ('ARRAY', (arnold.AI_TYPE_VECTOR, verts))
+            params['resolution'] = ('INT', light.quad_resolution)
+        elif ai_name == 'photometric_light':
+            params['filename'] = ('STRING', bpy.path.abspath(light.filename))
+        elif ai_name == 'mesh_light':
+            params['decay_type'] = ('STRING', light.decay_type)
+            if light.mesh:
+                params['mesh'] = ('NODE', "O::" + light.mesh)
+    else:
+        return False
+
+    color = None
+    if lamp.use_nodes:
+        for _node in lamp.node_tree.nodes:
+            if isinstance(_node, nt.ArnoldNodeLightOutput) and _node.is_active:
+                for input in _node.inputs:
+                    if input.is_linked and input.identifier == "color":
+                        color = _IprNode(input.links[0].from_node, name, nodes, {})
+                break
+    params['color'] = ('RGB', lamp.color[:]) if color is None else ('LINK', color)
+    params['intensity'] = ('FLOAT', light.intensity)
+    params['exposure'] = ('FLOAT', light.exposure)
+    params['cast_shadows'] = ('BOOL', light.cast_shadows)
+    params['cast_volumetric_shadows'] = ('BOOL', light.cast_volumetric_shadows)
+    params['shadow_density'] = ('FLOAT', light.shadow_density)
+    params['shadow_color'] = ('RGB', light.shadow_color[:])
+    params['samples'] = ('INT', light.samples)
+    params['normalize'] = ('BOOL', light.normalize)
+    params['diffuse'] = ('FLOAT', light.diffuse)
+    params['specular'] = ('FLOAT', light.specular)
+    params['sss'] = ('FLOAT', light.sss)
+    params['indirect'] = ('FLOAT', light.indirect)
+    params['max_bounces'] = ('INT', light.max_bounces)
+    params['volume_samples'] = ('INT', light.volume_samples)
+    params['volume'] = ('FLOAT', light.volume)
+    nodes.append((ai_name, params))
+    return True
+
+
+def _IprObject(ob, depsgraph, nodes, shaders, arena):
+    """Append IPR nodes of an object, returns the object node name or None"""
+    if ob.type in _CT:
+        pc = time.perf_counter()
+        mesh = ob.to_mesh(depsgraph, apply_modifiers=True, calc_undeformed=False)
+        if mesh is None:
+            return None
+        try:
+            mesh.calc_normals_split()
+            print("    to_mesh (%f)" % (time.perf_counter() - pc))
+            _IprPolymesh(ob, mesh, nodes, shaders, arena)
+        finally:
+            # it force call view_update
+            bpy.data.meshes.remove(mesh)
+        return "O::" + ob.name
+    if ob.type == 'LIGHT' and _IprLight(ob, nodes):
+        return "L::" + ob.name
+    return None
+
+
+def _IprWorld(world, nodes, options):
+    if world and world.use_nodes:
+        for _node in world.node_tree.nodes:
+            if isinstance(_node, nt.ArnoldNodeWorldOutput) and _node.is_active:
+                for input in _node.inputs:
+                    if input.is_linked:
+                        name = _IprNode(input.links[0].from_node, "W::" + world.name, nodes, {})
+                        if name:
+                            options[input.identifier] = ('NODE', name)
+                break
+
+
+def _view_update_objects():
+    return {
+        ob.name: ob for ob in bpy.data.objects
+        if (ob.type in _CT or ob.type == 'LIGHT') and ob.visible_get()
+    }
+
+
+def _view_update_delta(ipr, context):
+    """Collect IPR scene changes since the last update.
+
+    Returns:
+        dict: {'destroy': [names], 'upsert': [nodes], 'nodes': {name: params}, 'options': params}
+    """
+    depsgraph = context.depsgraph
+    objects = ipr.objects  # {Object.name: node name}
+    shaders = ipr.shaders  # {Material: node name}
+    data = {}
+    destroy = []
+    upsert = []
+    patch = {}
+
+    current = _view_update_objects()
+    for name in [n for n in objects if n not in current]:
+        destroy.append(objects.pop(name))
+
+    updated = set()
+    for u in depsgraph.updates:
+        id = u.id.original
+        if isinstance(id, bpy.types.Object):
+            if id.name not in current:
+                continue
+            if u.is_updated_geometry or id.type == 'LIGHT' and u.is_updated_shading:
+                updated.add(id.name)
+            elif u.is_updated_transform:
+                node = objects.get(id.name)
+                if node is not None:
+                    patch.setdefault(node, {})['matrix'] = _IprMatrix(id)
+        elif isinstance(id, (bpy.types.Mesh, bpy.types.Light)):
+            updated.update(n for n, ob in current.items() if ob.data == id)
+        elif isinstance(id, (bpy.types.Material, bpy.types.NodeTree)):
+            for mat, name in list(shaders.items()):
+                if mat is not None and (mat == id or mat.node_tree == id):
+                    shaders[mat] = _IprShader(mat, upsert)
+                    if shaders[mat] != name:
+                        # root shader changed, relink the users
+                        updated.update(
+                            n for n, ob in current.items()
+                            if any(slot.material == mat for slot in ob.material_slots)
+                        )
+        elif isinstance(id, bpy.types.World):
+            options = data.setdefault('options', {})
+            _IprWorld(id, upsert, options)
+
+    for name, ob in current.items():
+        if name not in objects or name in updated:
+            node = _IprObject(ob, depsgraph, upsert, shaders, ipr._arena_)
+            if node is not None:
+                objects[name] = node
+
+    if destroy:
+        data['destroy'] = destroy
+    if upsert:
+        data['upsert'] = upsert
+    if patch:
+        data['nodes'] = patch
+    return data
+
 
 def view_update(engine, context):
-    print(">>> view_update [%f]:" % time.clock(), engine)
+    print(">>> view_update [%f]:" % time.perf_counter(), engine)
     try:
         ipr = getattr(engine, "_ipr", None)
         if ipr is None:
-            blend_data = context.blend_data
             depsgraph = context.depsgraph
-            scene = context.scene
             region = context.region
             v3d = context.space_data
             rv3d = context.region_data
 
             nodes = []
-            lights = []
-            _nodes = {}
-
-            @contextmanager
-            def _to_mesh(ob):
-                pc = time.perf_counter()
-                mesh = ob.to_mesh(depsgraph, apply_modifiers=True, calc_undeformed=False)
-                if mesh is not None:
-                    try:
-                        mesh.calc_normals_split()
-                        print("    to_mesh (%f)" % (time.perf_counter() - pc))
-                        yield mesh
-                    finally:
-                        # it force call view_update
-                        blend_data.meshes.remove(mesh)
-                else:
-                    yield None
-
-            def _AiNode(node, prefix):
-                anode = _nodes.get(node)
-                if anode is None and isinstance(node, nt.ArnoldNode):
-                    params = {'name': ('STRING', "%s&N::%s" % (prefix, node.name))}
-                    for input in node.inputs:
-                        if input.is_linked:
-                            _anode = _AiNode(input.links[0].from_node, prefix)
-                            if _anode is not None:
-                                params[input.identifier] = ('LINK', _anode)
-                                continue
-                        if not input.hide_value:
-                            v = input.default_value
-                            if input.bl_idname in {'NodeSocketColor',
-                                                   'NodeSocketVector',
-                                                   'NodeSocketVectorXYZ',
-                                                   'ArnoldNodeSocketColor'}:
-                                v = v[:]
-                            params[input.identifier] = (input.bl_idname, v)
-                    for n, (t, v) in node.ai_properties.items():
-                        if t in {'RGB', 'RGBA', 'VECTOR'}:
-                            v = v[:]
-                        params[n] = (t, v)
-                    anode = (node.ai_name, params)
-                    _nodes[node] = anode
-                    nodes.append(anode)
-                return anode
-
-            for ob in bpy.data.objects:
-                if ob.type in _CT: # and ob.is_visible(scene)
-                    with _to_mesh(ob) as mesh:
-                        if mesh is not None:
-                            shaders = Shaders(blend_data)
-                            verts = mesh.vertices
-                            polygons = mesh.polygons
-                            npolygons = len(polygons)
-                            loops = mesh.loops
-                            vlist = numpy.ndarray(len(verts) * 3, dtype=numpy.float32)
-                            verts.foreach_get("co", vlist)
-                            nsides = numpy.ndarray(len(polygons), dtype=numpy.uint32)
-                            polygons.foreach_get("loop_total", nsides)
-                            vidxs = numpy.ndarray(len(loops), dtype=numpy.uint32)
-                            polygons.foreach_get("vertices", vidxs)
-                            if mesh.materials:
-                                ## Add Shader data
-                                # a = numpy.ndarray(npolygons, dtype=numpy.uint8)
-                                # polygons.foreach_get("material_index", a)
-                                mat = mesh.materials[0]
-
-                                node = shaders.get(mat)
-                                a = numpy.ndarray(npolygons, dtype=numpy.uint8)
-                                polygons.foreach_get("material_index", a)
-                                mm = collections.OrderedDict()
-
-                                shader = mat.arnold
-                                #if bpy.types.Material.arnold == 'SURFACE':
-                                if shader.type == 'lambert':
-                                    node = arnold.AiNode('polymesh')
-                                    nodes.append(('lambert', {
-                                        'name': ('STRING', ob.name),
-                                        'Kd': ('FLOAT', (1.0)),
-                                        'Kd_color': ('RGBA', (arnold.AI_TYPE_RGBA, *mat.diffuse_color)),
-                                    }))
-                                for i in numpy.unique(a):
-                                    mn = shaders.get(mesh.materials[i])
-                                    print(mn)
-                                    mi = mm.setdefault(id(mn), (mn, []))[1]
-                                    mi.append(i)
-                                for i, (mn, mi) in enumerate(mm.values()):
-                                    a[numpy.in1d(a, numpy.setdiff1d(mi, i))] = i
-                                    if mm:
-                                        nmm = len(mm)
-                                        t = mm.popitem(False)
-                                        if mm:
-                                            shader = arnold.AiArrayAllocate(nmm, 1, arnold.AI_TYPE_POINTER)
-                                            arnold.AiArraySetPtr(shader, 0, t[1][0])
-                                            i = 1
-                                            while mm:
-                                                arnold.AiArraySetPtr(shader, i, mm.popitem(False)[1][0])
-                                                i += 1
-                                            shidxs = arnold.AiArrayConvert(len(a), 1, arnold.AI_TYPE_BYTE, ctypes.c_void_p(a.ctypes.data))
-                                            arnold.AiNodeSetArray(node, "shader", shader)
-                                            arnold.AiNodeSetArray(node, "shidxs", shidxs)
-                                        else:
-                                            arnold.AiNodeSetPtr(node, "shader", t[1][0])
-
-                            def index_containing_substring(the_list, substring):
-                                for i, s in enumerate(the_list):
-                                    if substring in s:
-                                        return i
-                                return -1
-
-                            index = index_containing_substring(nodes, ob.name)
-
-                            nodes.append(('polymesh', {
-                                'name': ('STRING', "O::" + ob.name),
-                                'matrix': ('MATRIX', numpy.reshape(ob.matrix_world.transposed(), -1)),
-                                'vlist': ('ARRAY', (arnold.AI_TYPE_VECTOR, vlist)),
-                                'nsides': ('ARRAY', (arnold.AI_TYPE_UINT, nsides)),
-                                'vidxs': ('ARRAY', (arnold.AI_TYPE_UINT, vidxs)),
-                                #'shader':('NODE', (nodes[index])),
-                                #'smoothing': ('BOOL', True),
-                            }))
-                                ## TODO: Assign Shader data to polymesh...
-                                # Create an array based version of _AiPolymesh?
-                _Name = _CleanNames("O", itertools.count())
-
-                if ob.type == 'LIGHT':
-                    lamp = ob.data
-                    light = lamp.arnold
-                    matrix = ob.matrix_world.copy()
-                    if lamp.type == 'POINT':
-                        node = "point_light"
-                        lights.append((node, {
-                            'radius': ('FLOAT', (light.radius)),
-                            'decay_type': ('STRING', light.decay_type),
-                        }))
-                    elif lamp.type == 'SUN':
-                        node = "distant_light"
-                        lights.append((node, {
-                            'angle': ('FLOAT', (light.angle)),
-                        }))
-                    elif lamp.type == 'SPOT':
-                        node = "spot_light"
-                        lights.append((node, {
-                            'radius': ('FLOAT', (light.radius)),
-                            'lens_radius': ('FLOAT', (light.lens_radius)),
-                            'cone_angle': ('FLOAT', (math.degrees(lamp.spot_size))),
-                            'penumbra_angle': ('FLOAT', (light.penumbra_angle)),
-                            'aspect_ratio': ('FLOAT', (light.aspect_ratio)),
-                            'decay_type': ('STRING', (light.decay_type)),
-                        }))
-                    elif lamp.type == 'HEMI':
-                        node = "skydome_light"
-                        lights.append((node, {
-                            'resolution': ('INT', (light.resolution)),
-                            'format': ('STRING', (light.format)),
-                        }))
-                    elif lamp.type == 'AREA':
-                        node = light.type
-                        if light.type == 'cylinder_light':
-                            top = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, lamp.size_y / 2, 0))
-                            # arnold.AiNodeSetArray(node, "top", top)
-                            bottom = arnold.AiArray(1, 1, arnold.AI_TYPE_VECTOR, arnold.AtVector(0, -lamp.size_y / 2, 0))
-                            # arnold.AiNodeSetArray(node, "bottom", bottom)
-                            # arnold.AiNodeSetFlt(node, "radius", lamp.size / 2)
-                            # arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                            lights.append((node, {
-                                #TODO: Fix top/bottom
-                                # 'top': ('ARRAY', (arnold.AI_TYPE_VECTOR, top)),
-                                # 'bottom': ('ARRAY', (arnold.AI_TYPE_VECTOR, bottom)),
-                                'radius': ('FLOAT', (lamp.size / 2)),
-                                'decay_type': ('STRING', (light.decay_type)),
-                            }))
-                        elif light.type == 'disk_light':
-                            lights.append((node, {
-                                'radius': ('FLOAT', (lamp.size / 2)),
-                                #'decay_type': ('STRING', (light.decay_type)),
-                            }))
-                        elif light.type == 'quad_light':
-                            x = lamp.size / 2
-                            y = lamp.size_y / 2 if lamp.shape == 'RECTANGLE' else x
-                            verts = arnold.AiArrayAllocate(4, 1, arnold.AI_TYPE_VECTOR)
-                            arnold.AiArraySetVec(verts, 0, arnold.AtVector(-x, -y, 0))
-                            arnold.AiArraySetVec(verts, 1, arnold.AtVector(-x, y, 0))
-                            arnold.AiArraySetVec(verts, 2, arnold.AtVector(x, y, 0))
-                            arnold.AiArraySetVec(verts, 3, arnold.AtVector(x, -y, 0))
-                            numpy.ndarray(len(verts) * 3, dtype=numpy.float32)
-                            verts.foreach_get("co", vlist)
-                            # arnold.AiNodeSetArray(node, "vertices", verts)
-                            # arnold.AiNodeSetInt(node, "resolution", light.quad_resolution)
-                            #arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                            lights.append((node, {
-                                'vertices': ('ARRAY', (verts)),
-                                'resolution': ('INT', (light.quad_resolution)),
-                            }))
-                        elif light.type == 'photometric_light':
-                            arnold.AiNodeSetStr(node, "filename", bpy.path.abspath(light.filename))
-                            matrix *= _MR
-                        elif light.type == 'mesh_light':
-                            arnold.AiNodeSetStr(node, "decay_type", light.decay_type)
-                            if light.mesh:
-                                mesh_lights.append((node, light.mesh))
-                    else:
-                        arnold.AiMsgDebug(b"    skip (unsupported)")
-                        continue
-
-                    name = _Name(ob.name)
-                    color_node = None
-                    if color_node is None:
-                        for tuple in lights:
-                            if tuple[0] == node:
-                                tuple[1]['color'] = ('RGBA', (arnold.AI_TYPE_RGBA, *lamp.color))
-                    else:
-                        arnold.AiNodeLink(color_node, "color", node) #TODO: Refactor for Dict()
-                    for tuple in lights:
-                        i = 1
-                        j = 0
-                        if tuple[j] == node:
-                            if 'matrix' not in str(tuple):
-                                tuple[i]['matrix'] = ('MATRIX', numpy.reshape(ob.matrix_world.transposed(), -1))
-                                tuple[i]['intensity']=('FLOAT', light.intensity)
-                                tuple[i]['exposure']=('FLOAT', light.exposure)
-                                tuple[i]['cast_shadows']=('BOOL', light.cast_shadows)
-                                tuple[i]['cast_volumetric_shadows']=('BOOL', light.cast_volumetric_shadows)
-                                tuple[i]['shadow_density']=('FLOAT', light.shadow_density)
-                                tuple[i]['shadow_color']=('RGBA', (arnold.AI_TYPE_RGBA, *light.shadow_color))
-                                tuple[i]['samples']=('INT', light.samples)
-                                tuple[i]['normalize']=('BOOL', light.normalize)
-                                tuple[i]['affect_diffuse']=('BOOL', light.affect_diffuse)
-                                tuple[i]['affect_specular']=('BOOL', light.affect_specular)
-                                tuple[i]['affect_volumetrics']=('BOOL', light.affect_volumetrics)
-                                tuple[i]['diffuse']=('FLOAT', light.diffuse)
-                                tuple[i]['specular']=('FLOAT', light.specular)
-                                tuple[i]['sss']=('FLOAT', light.sss)
-                                tuple[i]['indirect']=('FLOAT', light.indirect)
-                                tuple[i]['max_bounces']=('INT', light.max_bounces)
-                                tuple[i]['volume_samples']=('INT', light.volume_samples)
-                                tuple[i]['volume']=('FLOAT', light.volume)
-                                break
-                            j += 1
-                else:
-                    arnold.AiMsgDebug(b"    skip (unsupported)")
+            objects = {}
+            shaders = {}
+            arena = _SharedArrays()
 
+            for name, ob in _view_update_objects().items():
+                node = _IprObject(ob, depsgraph, nodes, shaders, arena)
+                if node is not None:
+                    objects[name] = node
 
             #####################################
             ## camera
             view_matrix = rv3d.view_matrix.copy()
             _camera = {
                 'name': ('STRING', '__camera'),
-                'matrix': ('MATRIX', numpy.reshape(view_matrix.inverted().transposed(), 1)),
+                'matrix': ('MATRIX', numpy.reshape(view_matrix.inverted().transposed(), -1)),
             }
             view_perspective = rv3d.view_perspective
             if view_perspective == 'CAMERA':
@@ -1469,98 +1869,58 @@ def view_update(engine, context):
                 camera_data = _view_update_persp(v3d, _camera)
             else:  # view_perspective == 'PERSP'
                 pass
-            camera = ('persp_camera', _camera)
-            nodes.append(camera)
+            nodes.append(('persp_camera', _camera))
 
             #####################################
             ## options
             opts = context.scene.arnold
-            options = {
-                'camera': ('NODE', camera),
-                'thread_priority': ('STRING', opts.thread_priority),
-                'pin_threads': ('STRING', opts.pin_threads),
-                'abort_on_error': ('BOOL', opts.abort_on_error),
-                'abort_on_license_fail': ('BOOL', opts.abort_on_license_fail),
-                'skip_license_check': ('BOOL', opts.skip_license_check),
-                'error_color_bad_texture': ('RGB', opts.error_color_bad_texture[:]),
-                'error_color_bad_pixel': ('RGB', opts.error_color_bad_pixel[:]),
-                'error_color_bad_shader': ('RGB', opts.error_color_bad_shader[:]),
-                'bucket_size': ('INT', opts.ipr_bucket_size),
-                'bucket_scanning': ('STRING', opts.bucket_scanning),
-                'ignore_textures': ('BOOL', opts.ignore_textures),
-                'ignore_shaders': ('BOOL', opts.ignore_shaders),
-                'ignore_atmosphere': ('BOOL', opts.ignore_atmosphere),
-                'ignore_lights': ('BOOL', opts.ignore_lights),
-                'ignore_shadows': ('BOOL', opts.ignore_shadows),
-                #TODO: DELETE 'ignore_direct_lighting': ('BOOL', opts.ignore_direct_lighting),
-                'ignore_subdivision': ('BOOL', opts.ignore_subdivision),
-                'ignore_displacement': ('BOOL', opts.ignore_displacement),
-                'ignore_bump': ('BOOL', opts.ignore_bump),
-                'ignore_motion_blur': ('BOOL', opts.ignore_motion_blur),
-                'ignore_dof': ('BOOL', opts.ignore_dof),
-                'ignore_smoothing': ('BOOL', opts.ignore_smoothing),
-                'ignore_sss': ('BOOL', opts.ignore_sss),
-                # TODO: DELETE? 'auto_transparency_mode': ('STRING', opts.auto_transparency_mode),
-                'auto_transparency_depth': ('INT', opts.auto_transparency_depth),
-                # TODO: DELETE? 'auto_transparency_threshold': ('FLOAT', opts.auto_transparency_threshold),
-                'texture_max_open_files': ('INT', opts.texture_max_open_files),
-                'texture_max_memory_MB': ('FLOAT', opts.texture_max_memory_MB),
-                'texture_searchpath': ('STRING', opts.texture_searchpath),
-                'texture_automip': ('BOOL', opts.texture_automip),
-                'texture_autotile': ('INT', opts.texture_autotile),
-                'texture_accept_untiled': ('BOOL', opts.texture_accept_untiled),
-                'texture_accept_unmipped': ('BOOL', opts.texture_accept_unmipped),
-                # 'texture_specular_blur': ('FLOAT', opts.texture_specular_blur),
-                # 'texture_diffuse_blur': ('FLOAT', opts.texture_diffuse_blur),
-                'low_light_threshold': ('FLOAT', opts.low_light_threshold),
-                'GI_sss_samples': ('INT', opts.GI_sss_samples),
-                'sss_use_autobump': ('BOOL', opts.sss_use_autobump),
-                'GI_volume_samples': ('INT', opts.GI_volume_samples),
-                'max_subdivisions': ('BYTE', opts.max_subdivisions),
-                'procedural_searchpath': ('STRING', opts.procedural_searchpath),
-                'plugin_searchpath': ('STRING', opts.plugin_searchpath),
-                # TODO: DELETE? 'texture_gamma': ('FLOAT', opts.texture_gamma),
-                # TODO: DELETE? 'light_gamma': ('FLOAT', opts.light_gamma),
-                # TODO: DELETE? 'shader_gamma': ('FLOAT', opts.shader_gamma),
-                'GI_diffuse_depth': ('INT', opts.GI_diffuse_depth),
-                'GI_specular_depth': ('INT', opts.GI_specular_depth),
-                # TODO: DELETE? 'GI_reflection_depth': ('INT', opts.GI_reflection_depth),
-                'GI_transmission_depth': ('INT', opts.GI_transmission_depth),
-                'GI_volume_depth': ('INT', opts.GI_volume_depth),
-                'GI_total_depth': ('INT', opts.GI_total_depth),
-                'GI_diffuse_samples': ('INT', opts.GI_diffuse_samples),
-                'GI_specular_samples': ('INT', opts.GI_specular_samples),
-                'GI_transmission_samples': ('INT', opts.GI_transmission_samples),
-            }
+            options = _OPTIONS.ipr(opts)
+            options['camera'] = ('NODE', '__camera')
+            options['bucket_size'] = ('INT', opts.ipr_bucket_size)
 
             #####################################
             ## world
-            world = context.scene.world
-            if world and world.use_nodes:
-                for _node in world.node_tree.nodes:
-                    if isinstance(_node, nt.ArnoldNodeWorldOutput) and _node.is_active:
-                        for input in _node.inputs:
-                            if input.is_linked:
-                                node = _AiNode(input.links[0].from_node, "W::" + world.name)
-                                if node:
-                                    options[input.identifier] = ('NODE', node)
+            _IprWorld(context.scene.world, nodes, options)
 
             # from pprint import pprint as pp
             # pp(options)
             # pp(nodes)
 
+            progressive = None
+            if opts.ipr_progressive:
+                progressive = (
+                    opts.ipr_pass_samples,
+                    opts.ipr_max_samples or opts.AA_samples ** 2,
+                    opts.ipr_time_limit
+                )
+
+            resolution = None
+            if opts.ipr_dynamic_resolution:
+                resolution = (opts.ipr_frame_budget, opts.ipr_min_scale, opts.ipr_idle_time)
+
             ipr = _IPR(engine, {
                 'options': options,
                 'nodes': nodes,
-                'lights': lights,
-                'sl': (opts.initial_sampling_level, opts.AA_samples)
-            }, region.width, region.height)
+                'sl': (opts.initial_sampling_level, opts.AA_samples),
+                'progressive': progressive,
+                'resolution': resolution,
+                'workers': opts.ipr_workers
+            }, region.width, region.height, arena)
+            arena.release()
 
             ipr.view_perspective = view_perspective
             ipr.view_matrix = view_matrix
             ipr.camera_data = camera_data
+            ipr.objects = objects
+            ipr.shaders = shaders
 
             engine._ipr = ipr
+        else:
+            data = _view_update_delta(ipr, context)
+            if data:
+                region = context.region
+                ipr.update(region.width, region.height, data)
+                ipr._arena_.release()
     except:
         print("~" * 30)
         traceback.print_exc()
@@ -1575,16 +1935,25 @@ def view_draw(engine, depsgraph, region, space_data, region_data):
         v3d = bpy.context.space_data
         rv3d = bpy.context.region_data
 
+        ipr = getattr(engine, "_ipr", None)
+        if ipr is None:
+            return
+        if not ipr.alive():
+            # the IPR worker died, view_update starts a new session
+            print(">>> view_draw: IPR worker died, restart")
+            free(engine)
+            engine.tag_update()
+            return
+
         data = {}
         _camera = {}
-        ipr = engine._ipr
         width = region.width
         height = region.height
 
         view_matrix = rv3d.view_matrix
         if view_matrix != ipr.view_matrix:
             ipr.view_matrix = view_matrix.copy()
-            _camera['matrix'] = ('MATRIX', numpy.reshape(view_matrix.inverted().transposed(), 1))
+            _camera['matrix'] = ('MATRIX', numpy.reshape(view_matrix.inverted().transposed(), -1))
 
         view_perspective = rv3d.view_perspective
         if view_perspective != ipr.view_perspective:
@@ -1619,6 +1988,10 @@ def view_draw(engine, depsgraph, region, space_data, region_data):
 
         (width, height), rect = ipr.update(width, height, data)
 
+        samples, converged = ipr.converged()
+        if samples:
+            engine.update_stats("", "Samples: %d (%d%%)" % (samples, converged * 100))
+
         v = bgl.Buffer(bgl.GL_FLOAT, 4)
         bgl.glGetFloatv(bgl.GL_VIEWPORT, v)
         vw = v[2]
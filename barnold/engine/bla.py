@@ -53,14 +53,14 @@ LOWSEED = 0x330e
 
 # <...>\source\blender\blenkernel\BKE_particle.h:247
 PSYS_FRAND_COUNT = 1024
-PSYS_FRAND_SEED_OFFSET = []
-PSYS_FRAND_SEED_MULTIPLIER = []
-PSYS_FRAND_BASE = []
+PSYS_FRAND_SEED_OFFSET = None
+PSYS_FRAND_SEED_MULTIPLIER = None
+PSYS_FRAND_BASE = None
 
 
 class RNG():
     def __init__(self, x):
-        self.X = ctypes.c_uint64(x)
+        self.X = x
 
     # <...>\source\blender\blenlib\intern\rand.c:96
     def srandom(self, seed: int):
@@ -72,44 +72,77 @@ class RNG():
 
     # <...>\source\blender\blenlib\intern\rand.c:88
     def seed(self, seed: int):
-        self.X = ctypes.c_uint64((seed << 16) | LOWSEED)
+        self.X = ((seed << 16) | LOWSEED) & 0xffffffffffffffff
 
     # <...>\source\blender\blenlib\intern\rand.c:105
     def step(self):
-        self.X = ctypes.c_uint64((MULTIPLIER * self.X.value + ADDEND) & MASK)
+        self.X = (MULTIPLIER * self.X + ADDEND) & MASK
 
     # <...>\source\blender\blenlib\intern\rand.c:110
     def get_int(self):
         self.step()
-        return ctypes.c_int(self.X.value >> 17).value
+        return ctypes.c_int(self.X >> 17).value
 
     # <...>\source\blender\blenlib\intern\rand.c:116
     def get_uint(self):
         self.step()
-        return ctypes.c_uint(self.X.value >> 17).value
+        return (self.X >> 17) & 0xffffffff
 
     # <...>\source\blender\blenlib\intern\rand.c:133
     def get_float(self):
         return ctypes.c_float(self.get_int() / 0x80000000).value
 
+    def steps(self, n):
+        """Next n states at once, the generator is advanced by n steps
+            return:
+                numpy.ndarray(n, dtype=numpy.uint64)
+        """
+        # X[k] = A[k] * X + C[k], A[k] = M^k, C[k] = ADDEND * (M^(k-1) + ... + 1)
+        # uint64 arithmetic wraps modulo 2^64, so masking to 48 bits is exact
+        mask = numpy.uint64(MASK)
+        a = numpy.cumprod(numpy.full(n, MULTIPLIER, dtype=numpy.uint64)) & mask
+        c = numpy.empty(n, dtype=numpy.uint64)
+        c[0] = 0
+        numpy.cumsum(a[:-1], out=c[1:])
+        c = (c * numpy.uint64(ADDEND) + numpy.uint64(ADDEND)) & mask
+        with numpy.errstate(over='ignore'):
+            x = (a * numpy.uint64(self.X) + c) & mask
+        self.X = int(x[-1])
+        return x
+
+
 # <...>\source\blender\blenlib\intern\rand.c:226
 theBLI_rng = RNG(611330372042337130)
 
+
 # <...>\source\blender\blenkernel\intern\particle.c:93
 def psys_init_rng():
+    """Fill PSYS_FRAND_* tables, called on the first psys_frand use"""
+    global PSYS_FRAND_BASE, PSYS_FRAND_SEED_OFFSET, PSYS_FRAND_SEED_MULTIPLIER
     theBLI_rng.srandom(5831)
-    for i in range(PSYS_FRAND_COUNT):
-        PSYS_FRAND_BASE.append(theBLI_rng.get_float())
-        PSYS_FRAND_SEED_OFFSET.append(theBLI_rng.get_uint())
-        PSYS_FRAND_SEED_MULTIPLIER.append(theBLI_rng.get_uint())
+    x = (theBLI_rng.steps(PSYS_FRAND_COUNT * 3) >> numpy.uint64(17)).reshape(-1, 3)
+    # get_float, get_uint, get_uint
+    PSYS_FRAND_BASE = (x[:, 0].astype(numpy.int32) / 0x80000000).astype(numpy.float32)
+    PSYS_FRAND_SEED_OFFSET = x[:, 1].astype(numpy.uint32)
+    PSYS_FRAND_SEED_MULTIPLIER = x[:, 2].astype(numpy.uint32)
 
-psys_init_rng()
 
 # <...>\source\blender\blenkernel\BKE_particle.h:254
-def psys_frand(pss, seed):
-    offset = PSYS_FRAND_SEED_OFFSET[pss.seed % PSYS_FRAND_COUNT]
-    multiplier = PSYS_FRAND_SEED_MULTIPLIER[pss.seed % PSYS_FRAND_COUNT]
-    return PSYS_FRAND_BASE[(offset * seed * multiplier) % PSYS_FRAND_COUNT]
+def psys_frand(ps, seed):
+    """Particle random number
+        ps:
+            bpy.types.ParticleSystem
+        seed:
+            int or numpy.ndarray of seeds
+    """
+    if PSYS_FRAND_BASE is None:
+        psys_init_rng()
+    offset = numpy.uint64(PSYS_FRAND_SEED_OFFSET[ps.seed % PSYS_FRAND_COUNT])
+    multiplier = numpy.uint64(PSYS_FRAND_SEED_MULTIPLIER[ps.seed % PSYS_FRAND_COUNT])
+    # unsigned int arithmetic, 2^32 is a multiple of PSYS_FRAND_COUNT
+    seed = numpy.asarray(seed, dtype=numpy.uint64)
+    with numpy.errstate(over='ignore'):
+        return PSYS_FRAND_BASE[(offset + seed * multiplier) % numpy.uint64(PSYS_FRAND_COUNT)]
 
 
 # <...>\source\blender\makesdna\DNA_listBase.h:59
@@ -134,6 +167,47 @@ class _ParticleCacheKey(ctypes.Structure):
     ]
 
 
+# <...>\source\blender\makesdna\DNA_particle_types.h:56
+class _ParticleKey(ctypes.Structure):
+    _fields_ = [
+        ("co", ctypes.c_float * 3),
+        ("vel", ctypes.c_float * 3),
+        ("rot", ctypes.c_float * 4),
+        ("ave", ctypes.c_float * 3),
+        ("time", ctypes.c_float)
+    ]
+
+
+# <...>\source\blender\makesdna\DNA_particle_types.h:111
+class _ParticleData(ctypes.Structure):
+    _fields_ = [
+        # current global coordinates
+        ("state", _ParticleKey),
+        # previous state
+        ("prev_state", _ParticleKey),
+        ("hair", ctypes.c_void_p),
+        ("keys", ctypes.c_void_p),
+        ("boid", ctypes.c_void_p),
+        ("totkey", ctypes.c_int),
+        ("time", ctypes.c_float),
+        ("lifetime", ctypes.c_float),
+        ("dietime", ctypes.c_float),
+        # index to vert/edge/face
+        ("num", ctypes.c_int),
+        # index to derived mesh data (face) to avoid slow lookups
+        ("num_dmcache", ctypes.c_int),
+        # coordinates on face/edge number "num" and depth along
+        ("fuv", ctypes.c_float * 4),
+        ("foffset", ctypes.c_float),
+        ("size", ctypes.c_float),
+        ("sphdensity", ctypes.c_float),
+        ("pad", ctypes.c_int),
+        ("hair_index", ctypes.c_int),
+        ("flag", ctypes.c_short),
+        ("alive", ctypes.c_short)
+    ]
+
+
 # <...>\source\blender\makesdna\DNA_particle_types.h:72
 class _ChildParticle(ctypes.Structure):
     _fields_ = [
@@ -267,285 +341,349 @@ _PointCache._fields_ = [
 ]
 
 
-def _BezierInterpolate(pts, n, cache, npts, steps, scale):
-    """Interpolate points cache to bezier curve
-        pts:
-            numpy.ndarray([x, y, 3], dtype='f')
-            array for bezier interpolated control points
-        n:
-            int
-            position in pts array
+# structured view of _ParticleCacheKey, only the location is used
+_KEY = numpy.dtype({
+    'names': ["co"],
+    'formats': [(numpy.float32, 3)],
+    'offsets': [_ParticleCacheKey.co.offset],
+    'itemsize': ctypes.sizeof(_ParticleCacheKey)
+})
+
+
+def _PathCache(cache, npts, steps):
+    """Read points of a path cache
         cache:
-            ctypes.POINTER(_ParticleCacheKey)
-            points cache
+            ctypes.POINTER(ctypes.POINTER(_ParticleCacheKey))
+            path cache, array of pointers to the keys of every path
         npts:
             int
-            points number in cache.
+            paths number in cache
+        steps:
+            int
+            keys number of every path
+        return:
+            numpy.ndarray([npts, steps, 3], dtype='f')
+    """
+    co = _NDARRAY([npts, steps, 3], dtype='f')
+    if npts == 0:
+        return co
+    addr = ctypes.cast(cache, ctypes.c_void_p).value
+    ptrs = numpy.ctypeslib.as_array((ctypes.c_ssize_t * npts).from_address(addr))
+    # keys are allocated in buffers, paths of one buffer are contiguous,
+    # so every run of contiguous paths is read by one strided view
+    stride = steps * _KEY.itemsize
+    breaks = numpy.flatnonzero(numpy.diff(ptrs) != stride) + 1
+    for start, end in zip(itertools.chain((0,), breaks), itertools.chain(breaks, (npts,))):
+        size = (end - start) * stride
+        keys = numpy.frombuffer((ctypes.c_char * size).from_address(int(ptrs[start])), dtype=_KEY)
+        co[start:end] = keys['co'].reshape(end - start, steps, 3)
+    return co
+
+
+def _BezierInterpolate(a, scale):
+    """Interpolate paths to bezier curves
+        a:
+            numpy.ndarray([x, steps, 3], dtype='f')
+            paths points
         scale:
             float
             interpolation scale factor
+        return:
+            numpy.ndarray([x, steps * 3 - 2, 3], dtype='f')
+            bezier control points
     """
-    #TODO: First Render -> Cache is Empty, causes Hair only to appear in subsequent renders.
-    #try:
-    for i in range(npts):
-        #print(npts)
-        if cache:
-            c = cache[i]
-
-            a = _NDARRAY([steps, 3], dtype='f')
-            for j in range(steps):
-                a[j] = c[j].co
-
-            s = a[1:-1]
-            t = a[2:] - a[:-2]
-            t *= scale / _NORM(t, axis=1)[_S]  # tangents
-            m = _NORM(a[1:] - a[:-1], axis=1)[_S]  # magnitudes
-
-            pts[n, ::3] = a
-            pts[n, 1] = a[0] + (a[1] - a[0]) * scale
-            pts[n, -2] = a[-1] - (a[-1] - a[-2]) * scale
-            pts[n, 2:-3:3] = s - t * m[:-1]
-            pts[n, 4::3] = s + t * m[1:]
-            n += 1
-        # else:
-        #     cache = []
-        #     for i in range(npts):
-        #         cache.append(i)
-    return n
+    pts = _NDARRAY([a.shape[0], a.shape[1] * 3 - 2, 3], dtype='f')
+
+    s = a[:, 1:-1]
+    t = a[:, 2:] - a[:, :-2]
+    t *= scale / _NORM(t, axis=2)[_S]  # tangents
+    m = _NORM(a[:, 1:] - a[:, :-1], axis=2)[_S]  # magnitudes
+
+    pts[:, ::3] = a
+    pts[:, 1] = a[:, 0] + (a[:, 1] - a[:, 0]) * scale
+    pts[:, -2] = a[:, -1] - (a[:, -1] - a[:, -2]) * scale
+    pts[:, 2:-3:3] = s - t * m[:, :-1]
+    pts[:, 4::3] = s + t * m[:, 1:]
+    return pts
 
 
 def psys_get_curves(ps, steps, use_parent_particles, props):
     nch = len(ps.child_particles)
     if nch == 0 or use_parent_particles:
         np = len(ps.particles)
-        tot = np + nch
-        if tot <= 0:
-            return None
         use_parent_particles = True
     elif nch > 0:
-        tot = nch
         use_parent_particles = False
     else:
         return None
 
+    #TODO: First Render -> Cache is Empty, causes Hair only to appear in subsequent renders.
     _ps = _ParticleSystem.from_address(ps.as_pointer())
-    n = 0
+    paths = []
+    if use_parent_particles and _ps.pathcache:
+        paths.append(_PathCache(_ps.pathcache, np, steps))
+    if nch > 0 and _ps.childcache:
+        paths.append(_PathCache(_ps.childcache, nch, steps))
+    if not paths:
+        return None
+    a = paths[0] if len(paths) == 1 else numpy.concatenate(paths)
+    tot = len(a)
+    if tot == 0:
+        return None
 
     if props.basis == 'bezier':
-        nsteps = steps * 3 - 2
-        points = _NDARRAY([tot, nsteps, 3], dtype=numpy.float32)
-        #print(points)
-        scale = props.bezier_scale
-        if use_parent_particles:
-            n = _BezierInterpolate(points, n, _ps.pathcache, np, steps, scale)
-        _BezierInterpolate(points, n, _ps.childcache, nch, steps, scale)
+        points = _BezierInterpolate(a, props.bezier_scale)
         radius = numpy.linspace(props.radius_root, props.radius_tip, steps, dtype=numpy.float32)
-        return (points.reshape(-1, 3), numpy.tile(radius, tot), nsteps)
+        return (points.reshape(-1, 3), numpy.tile(radius, tot), steps * 3 - 2)
 
     if props.basis in {'b-spline', 'catmull-rom'}:
-        points = _NDARRAY([tot * (steps + 4), 3], dtype=numpy.float32)
-        if use_parent_particles:
-            _cache = _ps.pathcache
-            for i in range(np):
-                if _cache:
-                    c = _cache[i]
-                    points[n:n + 2] = c[0].co
-                    n += 2
-                    for j in range(steps):
-                        points[n] = c[j].co
-                        n += 1
-                    points[n:n + 2] = points[n - 1]
-                    n += 2
-        _cache = _ps.childcache
-        for i in range(nch):
-            if _cache:
-                c = _cache[i]
-                points[n:n + 2] = c[0].co
-                n += 2
-                for j in range(steps):
-                    points[n] = c[j].co
-                    n += 1
-                points[n: n + 2] = points[n - 1]
-                n += 2
+        # duplicate end points, curves pass through them
+        points = _NDARRAY([tot, steps + 4, 3], dtype=numpy.float32)
+        points[:, :2] = a[:, :1]
+        points[:, 2:-2] = a
+        points[:, -2:] = a[:, -1:]
         radius = numpy.ndarray(steps + 2, dtype=numpy.float32)
         radius[1:-1] = numpy.linspace(props.radius_root, props.radius_tip, steps, dtype=numpy.float32)
         radius[0] = 0
         radius[-1] = 0
-        return (points, numpy.tile(radius, tot), steps + 4)
+        return (points.reshape(-1, 3), numpy.tile(radius, tot), steps + 4)
 
     if props.basis == 'linear':
-        points = _NDARRAY([tot * steps, 3], dtype=numpy.float32)
-        if use_parent_particles:
-            _cache = _ps.pathcache
-            for i in range(np):
-                if _cache:
-                    c = _cache[i]
-                    for j in range(steps):
-                        points[n] = c[j].co
-                        n += 1
-        _cache = _ps.childcache
-        for i in range(nch):
-            if _cache:
-                c = _cache[i]
-                for j in range(steps):
-                    points[n] = c[j].co
-                    n += 1
         radius = numpy.linspace(props.radius_root, props.radius_tip, steps, dtype=numpy.float32)
-        return (points, numpy.tile(radius, tot), steps)
+        return (a.reshape(-1, 3), numpy.tile(radius, tot), steps)
 
     return None
 
 
+# <...>\source\blender\blenkernel\BKE_particle.h:68
+DMCACHE_NOTFOUND = -1
+DMCACHE_ISCHILD = -2
+
+
+def _View(address, n, struct, **fields):
+    """numpy view of a C array of structures
+        fields:
+            {name: dtype} visible fields of the structure
+    """
+    dtype = numpy.dtype({
+        'names': list(fields),
+        'formats': list(fields.values()),
+        'offsets': [getattr(struct, name).offset for name in fields],
+        'itemsize': ctypes.sizeof(struct)
+    })
+    if n == 0:
+        return numpy.zeros(0, dtype=dtype)
+    return numpy.frombuffer((ctypes.c_char * (n * dtype.itemsize)).from_address(address), dtype=dtype)
+
+
+def psys_get_uvs(ps, mesh, uv_no, use_parent_particles):
+    """Emitter uv coordinates of all hairs, in the order of psys_get_curves.
+
+    Uses face index and face weights stored by the particle system, works
+    only if the particle system modifier is the first one (the emitter mesh
+    is the original mesh) and its polygons are triangles or quads (one
+    tessellated face per polygon).
+        return:
+            numpy.ndarray([x, 2], dtype='f') or None
+    """
+    pss = ps.settings
+    if pss.emit_from not in {'FACE', 'VOLUME'}:
+        return None
+    polygons = mesh.polygons
+    npolygons = len(polygons)
+    nsides = numpy.ndarray(npolygons, dtype=numpy.int32)
+    polygons.foreach_get("loop_total", nsides)
+    if npolygons == 0 or nsides.max() > 4:
+        return None
+    loop_start = numpy.ndarray(npolygons, dtype=numpy.int32)
+    polygons.foreach_get("loop_start", loop_start)
+    loops = mesh.loops
+    vidxs = numpy.ndarray(len(loops), dtype=numpy.int32)
+    loops.foreach_get("vertex_index", vidxs)
+    uvd = mesh.uv_layers[uv_no].data
+    uvs = numpy.ndarray([len(uvd), 2], dtype='f')
+    uvd.foreach_get("uv", uvs.reshape(-1))
+
+    # loop per tessellated face corner
+    # <...>\source\blender\blenkernel\intern\mesh_evaluate.c: test_index_face
+    # tessellated faces are rotated to avoid vertex 0 at the last corners
+    corners = loop_start[:, numpy.newaxis] + numpy.arange(4)
+    tri = nsides == 3
+    corners[tri, 3] = loop_start[tri]
+    v = vidxs[numpy.minimum(corners, len(vidxs) - 1)]
+    rot = tri & (v[:, 2] == 0)
+    corners[rot, :3] = corners[rot][:, [1, 2, 0]]
+    rot = ~tri & ((v[:, 2] == 0) | (v[:, 3] == 0))
+    corners[rot] = corners[rot][:, [2, 3, 0, 1]]
+
+    _ps = _ParticleSystem.from_address(ps.as_pointer())
+    if not _ps.particles or _ps.totchild > 0 and not _ps.child:
+        return None
+    parts = _View(_ps.particles, _ps.totpart, _ParticleData,
+                  num=numpy.int32, num_dmcache=numpy.int32, fuv=(numpy.float32, 4))
+    pnum = numpy.where(parts['num_dmcache'] >= 0, parts['num_dmcache'], parts['num'])
+
+    num = []
+    fuv = []
+    if use_parent_particles:
+        num.append(pnum)
+        fuv.append(parts['fuv'])
+    if _ps.totchild > 0:
+        # <...>\source\blender\makesrna\intern\rna_particle.c: rna_ParticleSystem_uv_on_emitter
+        child = _View(_ps.child, _ps.totchild, _ChildParticle,
+                      num=numpy.int32, parent=numpy.int32, fuv=(numpy.float32, 4))
+        if pss.child_type == 'INTERPOLATED':
+            num.append(child['num'])
+            fuv.append(child['fuv'])
+        else:
+            parent = child['parent']
+            num.append(pnum[parent])
+            fuv.append(parts['fuv'][parent])
+    num = numpy.concatenate(num)
+    fuv = numpy.concatenate(fuv)
+    if len(num) == 0 or num.min() < 0 or num.max() >= npolygons:
+        return None
+
+    fuv[tri[num], 3] = 0
+    # <...>\source\blender\blenkernel\intern\particle.c: psys_interpolate_uvs
+    return numpy.einsum("ij,ijk->ik", fuv, uvs[corners[num]]).astype('f')
+
+
+def _PointCacheBlocks(ps):
+    """Read memory blocks of the particle system point cache
+        return:
+            [(frame, index, location, velocity)]
+    """
+    blocks = []
+    _cache = _PointCache.from_address(ps.point_cache.as_pointer())
+    _mem = ctypes.cast(_cache.mem_cache.first, ctypes.POINTER(_PTCacheMem))
+    while _mem:
+        # <...>\source\blender\blenkernel\intern\pointcache.c: BPHYS_DATA_INDEX, LOCATION, VELOCITY
+        cur = _mem.contents
+        tp = cur.totpoint
+        data = cur.data
+        if tp > 0 and data[1]:
+            f3 = lambda p: numpy.frombuffer((ctypes.c_float * (tp * 3)).from_address(p), dtype='f').reshape(tp, 3)
+            if data[0]:
+                index = numpy.frombuffer((ctypes.c_uint * tp).from_address(data[0]), dtype=numpy.uint32)
+            else:
+                index = numpy.arange(tp, dtype=numpy.uint32)
+            blocks.append((cur.frame, index, f3(data[1]), f3(data[2]) if data[2] else numpy.zeros([tp, 3], 'f')))
+        _mem = cur.next
+    return blocks
+
+
+def _Rows(index, n):
+    """Inverse of the block index, row of every particle or -1"""
+    rows = numpy.full(max(n, int(index.max()) + 1 if len(index) else 0), -1, dtype=numpy.int64)
+    rows[index] = numpy.arange(len(index))
+    return rows
+
+
+def _psys_get_trails(ps, pss, frame_current):
+    particles = ps.particles
+    n = len(particles)
+    trail_count = pss.trail_count
+    path_end = pss.path_end
+    randlength = pss.length_random
+    use_absolute_path_time = pss.use_absolute_path_time
+    time_tweak = pss.time_tweak
+
+    # <...>\source\blender\editors\space_view3d\drawobject.c:5354
+    bt = _NDARRAY(n, dtype='f')
+    particles.foreach_get("birth_time", bt)
+    dt = _NDARRAY(n, dtype='f')
+    particles.foreach_get("die_time", dt)
+    lt = _NDARRAY(n, dtype='f')
+    particles.foreach_get("lifetime", lt)
+
+    tc = numpy.full(n, trail_count, dtype='f')
+    length = numpy.full(n, path_end, dtype='f')
+    if randlength > 0:
+        r_length = psys_frand(ps, numpy.arange(22, n + 22))
+        tc *= 1.0 - randlength * r_length
+        tc[tc == 0] = 1.0
+        length *= 1.0 - randlength * r_length
+    if use_absolute_path_time:
+        _ct = numpy.full(n, frame_current - path_end, dtype='f')
+    else:
+        _ct = (frame_current - bt) / lt - length
+
+    # <...>\source\blender\editors\space_view3d\drawobject.c:5404
+    j = numpy.arange(1, trail_count + 1, dtype='f')
+    ct = _ct[:, numpy.newaxis] + j / tc[:, numpy.newaxis] * length[:, numpy.newaxis]
+    if use_absolute_path_time:
+        valid = (bt[:, numpy.newaxis] <= ct) & (ct <= dt[:, numpy.newaxis])
+        t = ct
+    else:
+        valid = (0 <= ct) & (ct <= 1)
+        t = bt[:, numpy.newaxis] + ct * (dt - bt)[:, numpy.newaxis]
+    a = numpy.repeat(numpy.arange(n), trail_count)[valid.ravel()]
+    t = t[valid]
+
+    blocks = _PointCacheBlocks(ps)
+    if not blocks:
+        return _NDARRAY([0, 3], dtype='f')
+    # <...>\source\blender\blenkernel\intern\particle.c:839
+    # first block at or after the time and the previous one
+    frames = numpy.array([b[0] for b in blocks], dtype='f')
+    bi = numpy.searchsorted(frames, t)
+    co = _NDARRAY([len(t), 3], dtype='f')
+    found = bi < len(blocks)
+    for b in numpy.unique(bi[found]):
+        q = numpy.flatnonzero(bi == b)
+        cf, index, locs, vels = blocks[b]
+        rows = _Rows(index, n)[a[q]]
+        found[q[rows < 0]] = False
+        q = q[rows >= 0]
+        rows = rows[rows >= 0]
+        co[q] = locs[rows]
+        if b == 0:
+            continue
+        pf, pindex, plocs, pvels = blocks[b - 1]
+        prows = _Rows(pindex, n)[a[q]]
+        h = prows >= 0
+        q = q[h]
+        rows = rows[h]
+        prows = prows[h]
+
+        # <...>\source\blender\blenkernel\intern\particle.c:1118
+        dfra = cf - pf
+        kt = ((t[q] - pf) / dfra)[_S]
+        # <...>\source\blender\blenkernel\intern\particle.c:1123
+        invdt = dfra * 0.04 * time_tweak
+        v = vels[rows] * invdt
+        pv = pvels[prows] * invdt
+        pco = plocs[prows]
+
+        # <...>\source\blender\blenlib\intern\math_geom.c:3283
+        t2 = kt * kt
+        t3 = t2 * kt
+        c = pco - locs[rows]
+        ca = pv + v + 2 * c
+        cb = -2 * pv - v - 3 * c
+        co[q] = ca * t3 + cb * t2 + pv * kt + pco
+    return co[found]
+
+
 def psys_get_points(ps, pss, frame_current):
     nch = len(ps.child_particles)
-    trail_count = pss.trail_count
-    if trail_count > 1:
-        def _it():
-            path_end = pss.path_end
-            randlength = pss.length_random
-            use_absolute_path_time = pss.use_absolute_path_time
-            time_tweak = pss.time_tweak
-
-            length = path_end
-            if use_absolute_path_time:
-                _ct = frame_current - length
-            tc = trail_count if trail_count else 1.0
-
-            cast = ctypes.cast
-            p_uint = ctypes.POINTER(ctypes.c_uint)
-            p_float3 = ctypes.POINTER(ctypes.c_float * 3)
-
-            _cache = _PointCache.from_address(ps.point_cache.as_pointer())
-            _mem = ctypes.cast(_cache.mem_cache.first, ctypes.POINTER(_PTCacheMem))
-
-            def parts():
-               i = 0
-               particles = ps.particles
-               if nch == 0 or pss.use_parent_particles:
-                   for p in particles:
-                       # <...>\source\blender\editors\space_view3d\drawobject.c:5354
-                       bt = p.birth_time
-                       yield (i, bt, p.die_time, (frame_current - bt) / p.lifetime)
-                       i += 1
-               PART_CHILD_FACES = (pss.child_type == 'INTERPOLATED')
-               for c, p in enumerate(ps.child_particles):
-                   cpa = _ChildParticle.from_address(p.as_pointer())
-                   # <...>\source\blender\blenkernel\intern\particle.c:3561
-                   if PART_CHILD_FACES:
-                       bt = 0.0
-                       cpaw = cpa.w
-                       for w, n in enumerate(cpa.pa):
-                           if n < 0:
-                               break
-                           bt += cpaw[w] * particles[n].birth_time
-                       lt = pss.lifetime
-                       if randlength > 0:
-                           lt *= 1.0 - randlength * psys_frand(pss, c + 25)
-                   else:
-                       p = particles[cpa.parent]
-                       bt = p.birth_time
-                       lt = p.lifetime
-                   yield (i, bt, bt + lt, (frame_current - bt) / lt)
-                   i += 1
-
-            #for a, pa_birthtime, pa_dietime, pa_time in parts():
-            for a, pa in enumerate(ps.particles):
-                # <...>\source\blender\editors\space_view3d\drawobject.c:5354
-                pa_birthtime = pa.birth_time
-                pa_dietime = pa.die_time
-                pa_time = (frame_current - pa_birthtime) / pa.lifetime
-
-                if randlength > 0:
-                    r_length = psys_frand(pss, a + 22)
-                    tc = trail_count * (1.0 - randlength * r_length)
-                    if not tc:
-                        tc = 1.0
-                    length = path_end * (1.0 - randlength * r_length)
-                if not use_absolute_path_time:
-                    _ct = pa_time - length
-
-                # <...>\source\blender\editors\space_view3d\drawobject.c:5404
-                for j in range(1, trail_count + 1):
-                    ct = _ct + (j / tc) * length
-                    if use_absolute_path_time:
-                        if pa_birthtime > ct or ct > pa_dietime:
-                            continue
-                        t = ct
-                    elif 0 > ct or ct > 1:
-                        continue
-                    else:
-                        t = pa_birthtime + ct * (pa_dietime - pa_birthtime)
-
-                    prev = None
-                    while _mem:
-                        # <...>\source\blender\blenkernel\intern\particle.c:839
-                        cur = _mem.contents
-                        cf = cur.frame
-                        if t <= cf:
-                            tp = cur.totpoint
-                            data = cur.data
-                            if tp > 0 and data[0]:
-                                idxs = cast(data[0], p_uint)
-                                locs = cast(data[1], p_float3)
-
-                                if prev is not None:
-                                    vels = cast(data[2], p_float3)
-
-                                    data = prev.data
-                                    pidxs = cast(data[0], p_uint)
-                                    plocs = cast(data[1], p_float3)
-                                    pvels = cast(data[2], p_float3)
-                                    ptp = prev.totpoint
-
-                                for k in range(tp):
-                                    i = idxs[k]
-                                    co = locs[i]
-                                    if prev is not None and k < ptp:
-                                        ve = vels[i]
-
-                                        i = pidxs[k]
-                                        pco = plocs[i]
-                                        pve = pvels[i]
-
-                                        # <...>\source\blender\blenkernel\intern\particle.c:1118
-                                        pf = prev.frame
-                                        dfra = cf - pf
-                                        kt = (t - pf) / dfra
-
-                                        # <...>\source\blender\blenkernel\intern\particle.c:1123
-                                        invdt = dfra * 0.04 * time_tweak
-                                        v0 = ve[0] * invdt
-                                        v1 = ve[1] * invdt
-                                        v2 = ve[2] * invdt
-                                        pv0 = pve[0] * invdt
-                                        pv1 = pve[1] * invdt
-                                        pv2 = pve[2] * invdt
-
-                                        # <...>\source\blender\blenlib\intern\math_geom.c:3283
-                                        t2 = kt * kt
-                                        t3 = t2 * kt
-                                        c0 = pco[0] - co[0]
-                                        c1 = pco[1] - co[1]
-                                        c2 = pco[2] - co[2]
-                                        a0 = pv0 + v0 + 2 * c0
-                                        a1 = pv1 + v1 + 2 * c1
-                                        a2 = pv2 + v2 + 2 * c2
-                                        b0 = -2 * pv0 - v0 - 3 * c0
-                                        b1 = -2 * pv1 - v1 - 3 * c1
-                                        b2 = -2 * pv2 - v2 - 3 * c2
-                                        co = [
-                                            a0 * t3 + b0 * t2 + pv0 * kt + pco[0],
-                                            a1 * t3 + b1 * t2 + pv1 * kt + pco[1],
-                                            a2 * t3 + b2 * t2 + pv2 * kt + pco[2]
-                                        ]
-                                    yield co
-                            break
-                        prev = cur
-                        _mem = cur.next
-        it = _it()
+    if pss.trail_count > 1:
+        # TODO: child particles
+        return _psys_get_trails(ps, pss, frame_current)
     elif nch > 0:
         # TODO: child particles
         return None
-    else:
-        it = (p.location for p in ps.particles if p.alive_state == 'ALIVE')
-    return numpy.fromiter(itertools.chain.from_iterable(it), dtype=numpy.float32).reshape([-1, 3])
+    particles = ps.particles
+    n = len(particles)
+    if n == 0:
+        return _NDARRAY([0, 3], dtype='f')
+    _ps = _ParticleSystem.from_address(ps.as_pointer())
+    if not _ps.particles:
+        return _NDARRAY([0, 3], dtype='f')
+    co = _NDARRAY([n, 3], dtype='f')
+    particles.foreach_get("location", co.reshape(-1))
+    # enums aren't supported by foreach_get, read the DNA value
+    alive = _View(_ps.particles, n, _ParticleData, alive=numpy.int16)['alive']
+    ALIVE = particles[0].bl_rna.properties["alive_state"].enum_items["ALIVE"].value
+    return co[alive == ALIVE]
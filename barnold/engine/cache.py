@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "persistent geometry cache shared by repeated renders"
+
+import zlib
+import hashlib
+import collections
+
+import numpy
+
+# modifiers whose result depends on other objects, simulation caches or time,
+# their fingerprint is additionally keyed by the current frame
+_VOLATILE = {
+    'ARMATURE', 'CAST', 'CLOTH', 'COLLISION', 'CORRECTIVE_SMOOTH', 'CURVE',
+    'DATA_TRANSFER', 'DYNAMIC_PAINT', 'EXPLODE', 'FLUID_SIMULATION', 'HOOK',
+    'LAPLACIANDEFORM', 'LATTICE', 'MESH_CACHE', 'MESH_DEFORM', 'MESH_SEQUENCE_CACHE',
+    'NORMAL_EDIT', 'OCEAN', 'PARTICLE_INSTANCE', 'SHRINKWRAP', 'SIMPLE_DEFORM',
+    'SMOKE', 'SOFT_BODY', 'SURFACE', 'SURFACE_DEFORM', 'WARP', 'WAVE',
+    'WEIGHTED_NORMAL', 'UV_PROJECT', 'UV_WARP', 'VERTEX_WEIGHT_PROXIMITY',
+}
+
+# data-block properties which don't change the evaluated geometry
+_ID_SKIP = {"users", "tag", "is_evaluated", "is_library_indirect", "use_fake_user"}
+
+
+def _crc(prop, attr, dtype, n, crc):
+    a = numpy.ndarray(n, dtype=dtype)
+    prop.foreach_get(attr, a)
+    return zlib.crc32(a, crc)
+
+
+class _Uncacheable(Exception):
+    """The evaluated geometry depends on data that can't be fingerprinted"""
+
+
+def _value(v, frame, seen):
+    """Hashable representation of a RNA property value"""
+    if v is None or isinstance(v, (bool, int, float, str)):
+        return v
+    if isinstance(v, (set, frozenset)):
+        return frozenset(v)
+    mw = getattr(v, "matrix_world", None)
+    if mw is not None:
+        # objects used by modifiers (mirror, array offset and caps, booleans, ...),
+        # the geometry of meshes is a part of the result too
+        geometry = None
+        if v.type == 'MESH' and v.name not in seen:
+            seen.add(v.name)
+            geometry = _fingerprint(v, frame, seen)
+        return (v.name, tuple(numpy.reshape(mw, -1)), geometry)
+    if hasattr(v, "users"):
+        # other data-blocks (displace and wave textures, ...)
+        return _id(v, frame, seen)
+    name = getattr(v, "name", None)
+    if name is not None:
+        return name
+    try:
+        return tuple(v)
+    except TypeError:
+        return None
+
+
+def _id(v, frame, seen):
+    """Hashable representation of a data-block used by a modifier"""
+    if getattr(v, "image", None) is not None or getattr(v, "node_tree", None) is not None \
+            or getattr(v, "animation_data", None) is not None:
+        # image pixels and node trees are edited in place, or animated
+        raise _Uncacheable(v.name)
+    h = [v.name]
+    color_ramp = getattr(v, "color_ramp", None)
+    if color_ramp is not None:
+        h.append(tuple((e.position, e.color[:]) for e in color_ramp.elements))
+    for p in v.bl_rna.properties:
+        if p.type not in {'POINTER', 'COLLECTION'} and p.identifier not in _ID_SKIP:
+            h.append(_value(getattr(v, p.identifier), frame, seen))
+    return tuple(h)
+
+
+def _modifiers(ob, frame, seen):
+    h = []
+    for m in ob.modifiers:
+        h.append(m.type)
+        for p in m.bl_rna.properties:
+            if p.type != 'COLLECTION' and p.identifier != "rna_type":
+                h.append(_value(getattr(m, p.identifier), frame, seen))
+    return hash(tuple(h))
+
+
+def _uses_weights(ob):
+    """True if a modifier of an object reads vertex groups"""
+    for m in ob.modifiers:
+        if m.show_render:
+            for p in m.bl_rna.properties:
+                if p.type == 'STRING' and p.identifier.startswith("vertex_group") and getattr(m, p.identifier):
+                    return True
+    return False
+
+
+def _weights(verts, crc):
+    a = numpy.array([(g.group, g.weight) for v in verts for g in v.groups], dtype=numpy.float32)
+    return zlib.crc32(a, crc)
+
+
+def is_volatile(ob):
+    """True if the evaluated geometry of an object may change with the frame"""
+    data = ob.data
+    if getattr(data, "shape_keys", None) is not None:
+        return True
+    return any(m.type in _VOLATILE for m in ob.modifiers if m.show_render)
+
+
+def fingerprint(ob, frame):
+    """Evaluated mesh fingerprint of an object, matrix excluded.
+
+    Meshes of objects used by the modifiers are fingerprinted too.
+
+    Args:
+        ob (bpy.types.Object): mesh object.
+        frame (int): current frame, used only by volatile objects.
+    Returns:
+        tuple or None, if the object can't be fingerprinted.
+    """
+    if ob.type != 'MESH':
+        return None
+    try:
+        return _fingerprint(ob, frame, {ob.name})
+    except _Uncacheable:
+        return None
+
+
+def _fingerprint(ob, frame, seen):
+    mesh = ob.data
+    verts = mesh.vertices
+    loops = mesh.loops
+    polygons = mesh.polygons
+    nverts = len(verts)
+    nloops = len(loops)
+    npolygons = len(polygons)
+
+    # topology
+    crc = _crc(loops, "vertex_index", numpy.uint32, nloops, 0)
+    crc = _crc(polygons, "loop_total", numpy.uint32, npolygons, crc)
+    topology = _crc(polygons, "material_index", numpy.uint16, npolygons, crc)
+    # shape
+    crc = _crc(verts, "co", numpy.float32, nverts * 3, 0)
+    crc = _crc(polygons, "use_smooth", numpy.bool_, npolygons, crc)
+    for uvt in mesh.uv_layers:
+        if uvt.active_render:
+            crc = _crc(uvt.data, "uv", numpy.float32, nloops * 2, crc)
+            break
+    if _uses_weights(ob):
+        crc = _weights(verts, crc)
+
+    return (
+        nverts, nloops, npolygons, topology, crc,
+        mesh.use_auto_smooth, mesh.auto_smooth_angle,
+        _modifiers(ob, frame, seen),
+        frame if is_volatile(ob) else None
+    )
+
+
+def digest(arrays):
+    """blake2b digest of mesh buffers, equal for identical evaluated geometry.
+
+    Args:
+        arrays (dict): mesh buffers {name: numpy.ndarray or None}.
+    Returns:
+        bytes
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for name in sorted(arrays):
+        a = arrays[name]
+        if a is not None:
+            h.update(b"%s:%d:" % (name.encode(), a.nbytes))
+            h.update(numpy.ascontiguousarray(a))
+    return h.digest()
+
+
+class GeometryCache:
+    """LRU cache of mesh buffers ({name: numpy.ndarray}) limited by byte size"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # {key: (fingerprint, arrays, nbytes)}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, fp):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] == fp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._remove(key)
+        self.misses += 1
+        return None
+
+    def put(self, key, fp, arrays):
+        self._remove(key)
+        nbytes = sum(a.nbytes for a in arrays.values() if a is not None)
+        if nbytes > self.max_bytes:
+            return
+        while self._entries and self.nbytes + nbytes > self.max_bytes:
+            self.nbytes -= self._entries.popitem(False)[1][2]
+        self._entries[key] = (fp, arrays, nbytes)
+        self.nbytes += nbytes
+
+    def resize(self, max_bytes):
+        self.max_bytes = max_bytes
+        while self._entries and self.nbytes > max_bytes:
+            self.nbytes -= self._entries.popitem(False)[1][2]
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[2]
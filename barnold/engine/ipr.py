@@ -2,23 +2,514 @@
 
 __authors__ = "Tyler Furby, Ildar Nikolaev"
 
+import os
 import sys
+import math
 import numpy
 import mmap
-import platform
 
 ABORT = 1
 UPDATE = 2
 
 
+class SharedArrays:
+    """Arena of memory mapped files for the arrays sent to the IPR worker.
+
+    Arrays are allocated directly in the mapped files, so only small
+    descriptors (path, dtype, count, offset) are pickled through the pipe.
+    """
+
+    CHUNK = 64 * 1024 * 1024  # 64Mb
+
+    def __init__(self):
+        import shutil
+        import tempfile
+        import weakref
+
+        root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+        self.dir = tempfile.mkdtemp(prefix="barnold-ipr-", dir=root)
+        self._finalize = weakref.finalize(self, shutil.rmtree, self.dir, True)
+        self._chunks = []  # [(address, size, path, mmap)]
+        self._count = 0
+        self._offset = 0
+
+    def empty(self, n, dtype):
+        """Allocate a new one dimensional array"""
+        dtype = numpy.dtype(dtype)
+        nbytes = n * dtype.itemsize
+        offset = (self._offset + 15) & ~15
+        if not self._chunks or offset + nbytes > self._chunks[-1][1]:
+            self._chunk(max(nbytes, self.CHUNK))
+            offset = 0
+        self._offset = offset + nbytes
+        return numpy.frombuffer(self._chunks[-1][3], dtype, n, offset)
+
+    def share(self, a):
+        """Returns descriptor of an array allocated by this arena, or the array itself"""
+        ptr = a.ctypes.data
+        for address, size, path, m in reversed(self._chunks):
+            if address <= ptr < address + size:
+                return (path, a.dtype.str, len(a), ptr - address)
+        return a
+
+    def release(self):
+        """Forget all chunks but the current one, after their arrays were sent"""
+        del self._chunks[:-1]
+
+    def close(self):
+        del self._chunks[:]
+        self._finalize()
+
+    def _chunk(self, size):
+        path = os.path.join(self.dir, "%08d" % self._count)
+        self._count += 1
+        with open(path, "w+b") as f:
+            f.truncate(size)
+            m = mmap.mmap(f.fileno(), size)
+        address = numpy.frombuffer(m, numpy.uint8, 1).ctypes.data
+        self._chunks.append((address, size, path, m))
+
+
+def _attach(maps, desc):
+    """Worker side view of an array described by SharedArrays.share"""
+    path, dtype, count, offset = desc
+    m = maps.get(path)
+    if m is None:
+        with open(path, "rb") as f:
+            m = maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return numpy.frombuffer(m, dtype, count, offset)
+
+
+def _detach(maps):
+    """Close and remove all chunks but the newest one"""
+    for path in sorted(maps)[:-1]:
+        try:
+            maps.pop(path).close()
+            os.remove(path)
+        except (BufferError, OSError):
+            pass
+
+
+class Framebuffer:
+    """Double buffered viewport frame in a file mapped by Blender and the IPR worker.
+
+    The file holds a header and two buffers of capacity bytes. The worker
+    renders into the back buffer and publishes it by swapping the buffers and
+    incrementing the generation, Blender reads the front buffer in place.
+    After a swap the new back buffer is brought up to date by copying the
+    dirty rects, so the worker never writes the published buffer.
+
+    Args:
+        path (str): file created by Framebuffer.create.
+    """
+
+    MAGIC = 0x42465241  # "ARFB"
+    RGBA32F = 1  # pixel formats
+    HEADER_SIZE = 4096
+    MAX_DIRTY = 64
+    FULL = 0xFFFFFFFF  # ndirty of a frame without the dirty rects
+    HEADER = numpy.dtype([
+        ('magic', '<u4'), ('format', '<u4'), ('generation', '<u8'),
+        ('front', '<u4'), ('width', '<u4'), ('height', '<u4'), ('ndirty', '<u4'),
+        ('capacity', '<u8'), ('dirty', '<u4', (MAX_DIRTY, 4)),
+    ], align=True)
+
+    def __init__(self, path):
+        import threading
+
+        self.path = path
+        with open(path, "r+b") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        self.header = numpy.frombuffer(self._mmap, self.HEADER, 1)[0]
+        self.capacity = int(self.header['capacity'])
+        self.lock = threading.Lock()  # worker side, tiles come from the render threads
+        self._dirty = []  # [(x, y, width, height)] of the back buffer
+        self._published = 0.0
+
+    @classmethod
+    def create(cls, dir, capacity, width, height):
+        """New zeroed framebuffer file in dir"""
+        import tempfile
+
+        fd, path = tempfile.mkstemp(prefix="fb-", dir=dir)
+        with os.fdopen(fd, "w+b") as f:
+            f.truncate(cls.HEADER_SIZE + 2 * capacity)
+        fb = cls(path)
+        header = fb.header
+        header['magic'] = cls.MAGIC
+        header['format'] = cls.RGBA32F
+        header['capacity'] = fb.capacity = capacity
+        header['width'] = width
+        header['height'] = height
+        header['ndirty'] = cls.FULL
+        return fb
+
+    def _buffer(self, i):
+        w = int(self.header['width'])
+        h = int(self.header['height'])
+        offset = self.HEADER_SIZE + i * self.capacity
+        return numpy.frombuffer(self._mmap, numpy.float32, w * h * 4, offset).reshape([h, w, 4])
+
+    # Blender side
+
+    def read(self):
+        """Published frame: (generation, rect (height, width, 4) of the front buffer).
+
+        The rect is a view of the shared memory, it stays intact until the
+        worker publishes twice, compare the generation after using it.
+        """
+        header = self.header
+        generation = int(header['generation'])
+        return generation, self._buffer(int(header['front']))
+
+    def dirty(self, generation):
+        """Rects changed since generation, None if the whole frame has to be redrawn"""
+        header = self.header
+        if int(header['generation']) != generation + 1 or header['ndirty'] == self.FULL:
+            return None
+        return [tuple(r) for r in header['dirty'][:header['ndirty']].tolist()]
+
+    # worker side
+
+    def resize(self, width, height):
+        """Change the frame size, both buffers are cleared"""
+        with self.lock:
+            if width * height * 4 * 4 > self.capacity:
+                raise ValueError("framebuffer %dx%d exceeds the capacity" % (width, height))
+            header = self.header
+            header['width'] = width
+            header['height'] = height
+            self._buffer(0)[:] = 0
+            self._buffer(1)[:] = 0
+            header['ndirty'] = self.FULL
+            header['generation'] += 1
+            self._dirty = []
+
+    def back(self):
+        """Rect of the back buffer, write it and mark() holding the lock"""
+        return self._buffer(1 - int(self.header['front']))
+
+    def mark(self, x, y, width, height):
+        self._dirty.append((x, y, width, height))
+
+    def publish(self, interval=0.0):
+        """Swap the buffers if anything was written.
+
+        Args:
+            interval (float): minimal time since the previous swap, seconds.
+        Returns:
+            bool: the buffers were swapped.
+        """
+        import time
+
+        with self.lock:
+            pc = time.perf_counter()
+            if not self._dirty or pc - self._published < interval:
+                return False
+            header = self.header
+            dirty = self._dirty
+            front = 1 - int(header['front'])
+            if len(dirty) > self.MAX_DIRTY:
+                header['ndirty'] = self.FULL
+            else:
+                header['dirty'][:len(dirty)] = dirty
+                header['ndirty'] = len(dirty)
+            header['front'] = front
+            header['generation'] += 1
+            # the new back buffer is the previous frame, bring it up to date
+            src = self._buffer(front)
+            dst = self._buffer(1 - front)
+            if len(dirty) > self.MAX_DIRTY:
+                dst[:] = src
+            else:
+                for x, y, w, h in dirty:
+                    s = numpy.s_[y : y + h, x : x + w]
+                    dst[s] = src[s]
+            self._dirty = []
+            self._published = pc
+            return True
+
+    def close(self):
+        self.header = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # rect views are still alive, the mapping is released with them
+            pass
+
+
+def _same(a, b):
+    """Equal (type, value) parameters"""
+    if a[0] != b[0]:
+        return False
+    if isinstance(a[1], numpy.ndarray) or isinstance(b[1], numpy.ndarray):
+        return numpy.array_equal(a[1], b[1])
+    return a[1] == b[1]
+
+
+class Updates:
+    """Coalescing queue of the IPR messages, Blender side.
+
+    Messages are merged key by key with the last write winning and sent at
+    most once per interval of the most important pending change, parameters
+    equal to the already sent ones are dropped. The priority of a sent
+    message is raised to the interrupt flag, the worker only aborts a render
+    for camera and geometry changes and picks up the others between passes.
+
+    Args:
+        data (dict): initial message of the worker, the sent state.
+    """
+
+    OPTIONS = 1
+    GEOMETRY = 2
+    CAMERA = 3
+    # {priority: seconds since the previous message}
+    INTERVAL = {OPTIONS: 0.1, GEOMETRY: 1 / 30, CAMERA: 1 / 60}
+
+    def __init__(self, data):
+        import threading
+
+        self._cond = threading.Condition()
+        self._closed = False
+        self._sent_at = 0.0
+        # {node name: {param: (type, value)}}, '' is the options
+        self._sent = {np['name'][1]: dict(np) for nt, np in data['nodes']}
+        self._sent[''] = dict(data['options'])
+        self._clear()
+
+    def _clear(self):
+        self.priority = 0
+        self._destroy = []
+        self._upsert = {}  # {name: (type, params)}
+        self._nodes = {}  # {name: {param: (type, value)}}
+        self._options = {}
+        self._other = {}  # {key: value}, mmap_size, framebuffer
+
+    def put(self, data):
+        priority = 0
+        with self._cond:
+            for name in data.get('destroy', ()):
+                self._upsert.pop(name, None)
+                self._nodes.pop(name, None)
+                self._destroy.append(name)
+                priority = self.GEOMETRY
+            for nt, np in data.get('upsert', ()):
+                name = np['name'][1]
+                # the node is recreated with all its parameters
+                self._nodes.pop(name, None)
+                self._upsert[name] = (nt, np)
+                priority = self.GEOMETRY
+            for name, params in data.get('nodes', {}).items():
+                self._nodes.setdefault(name, {}).update(params)
+                priority = max(priority, self.CAMERA if name == '__camera' else self.GEOMETRY)
+            options = data.get('options')
+            if options:
+                self._options.update(options)
+                if 'xres' in options or 'yres' in options:
+                    priority = self.CAMERA
+                priority = max(priority, self.OPTIONS)
+            for key in ('mmap_size', 'framebuffer'):
+                if key in data:
+                    self._other[key] = data[key]
+                    priority = self.CAMERA
+            if priority:
+                self.priority = max(self.priority, priority)
+                self._cond.notify()
+
+    def _patch(self, name, params):
+        """Parameters which differ from the sent ones"""
+        sent = self._sent.setdefault(name, {})
+        patch = {}
+        for n, v in params.items():
+            if n not in sent or not _same(sent[n], v):
+                patch[n] = sent[n] = v
+        return patch
+
+    def _take(self):
+        data = dict(self._other)
+        if self._destroy:
+            data['destroy'] = self._destroy
+            for name in self._destroy:
+                self._sent.pop(name, None)
+        if self._upsert:
+            data['upsert'] = list(self._upsert.values())
+            for name, (nt, np) in self._upsert.items():
+                self._sent[name] = dict(np)
+        nodes = {}
+        for name, params in self._nodes.items():
+            patch = self._patch(name, params)
+            if patch:
+                nodes[name] = patch
+        if nodes:
+            data['nodes'] = nodes
+        options = self._patch('', self._options)
+        if options:
+            data['options'] = options
+        self._clear()
+        return data
+
+    def get(self):
+        """Wait for the next message.
+
+        Returns:
+            tuple: (message, priority), (None, 0) after close().
+        """
+        import time
+
+        with self._cond:
+            while not self._closed:
+                if not self.priority:
+                    self._cond.wait()
+                    continue
+                wait = self._sent_at + self.INTERVAL[self.priority] - time.perf_counter()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                priority = self.priority
+                data = self._take()
+                if data:
+                    self._sent_at = time.perf_counter()
+                    return data, priority
+            return None, 0
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+
+class _Worker:
+    """IPR worker process and the objects it shares with Blender.
+
+    Shared values can only be passed to a process when it starts, so they
+    belong to the process and are reused by every session it serves.
+    """
+
+    def __init__(self, mp, target):
+        self.conn, conn = mp.Pipe()
+        self.redraw_event = mp.Event()
+        self.state = mp.Value('i', 0)
+        # first complete frame after a change: seconds, pixels
+        self.frame = mp.Array('d', 2, lock=False)
+        # progressive refinement: samples per pixel, fraction of the budget
+        self.progress = mp.Array('d', 2, lock=False)
+        # priority of the messages sent since the worker drained the pipe, see Updates
+        self.interrupt = mp.Value('i', 0, lock=False)
+        self.process = mp.Process(target=target, daemon=True, args=(
+            conn, self.redraw_event, self.state, self.progress, self.frame, self.interrupt
+        ))
+        self.process.start()
+        conn.close()
+
+    def reset(self):
+        self.state.value = 0
+        self.frame[:] = [0, 0]
+        self.progress[:] = [0, 0]
+        self.interrupt.value = 0
+        self.redraw_event.clear()
+
+    def alive(self, timeout):
+        """Health check, the worker answers when Arnold is initialized"""
+        try:
+            if not self.process.is_alive():
+                return False
+            self.conn.send('ping')
+            return self.conn.poll(timeout) and self.conn.recv() == 'pong'
+        except (EOFError, OSError):
+            return False
+
+    def done(self, timeout):
+        """Wait for the end of the session, the worker answers when its session is finished"""
+        try:
+            return self.conn.poll(timeout) and self.conn.recv() == 'done'
+        except (EOFError, OSError):
+            return False
+
+    def close(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.conn.close()
+
+    def kill(self):
+        self.process.terminate()
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join(1)
+        self.conn.close()
+
+
+class WorkerPool:
+    """IPR worker processes kept warm between the viewport sessions.
+
+    Idle workers have Arnold initialized and the plugins loaded, a session
+    leases one and the worker resets its universe when the session ends.
+    """
+
+    TIMEOUT = 10.0  # seconds to wait for a worker still initializing
+    STOP_TIMEOUT = 5.0  # seconds to wait for the end of a session
+
+    def __init__(self):
+        self.size = 1
+        self._idle = []  # [_Worker]
+
+    def lease(self, target, size):
+        """Healthy idle worker or a new one, the pool is refilled to size.
+
+        Args:
+            target: _serve of the running __main__ module, the new processes
+                are started with it.
+            size (int): idle workers to keep.
+        """
+        import multiprocessing as mp
+
+        self.size = size
+        worker = None
+        while self._idle and worker is None:
+            w = self._idle.pop(0)
+            if w.alive(self.TIMEOUT):
+                worker = w
+            else:
+                print(">>> WorkerPool: restart", w.process)
+                w.kill()
+        if worker is None:
+            worker = _Worker(mp, target)
+        worker.reset()
+        while len(self._idle) < self.size:
+            self._idle.append(_Worker(mp, target))
+        return worker
+
+    def release(self, worker):
+        """Return a worker after its session was stopped.
+
+        A worker which doesn't end the session in time is killed.
+        """
+        if not worker.done(self.STOP_TIMEOUT):
+            print(">>> WorkerPool: kill", worker.process)
+            worker.kill()
+        elif len(self._idle) < self.size:
+            self._idle.append(worker)
+        else:
+            worker.close()
+
+    def close(self):
+        for w in self._idle:
+            w.close()
+        del self._idle[:]
+
 
 def ipr():
+    import atexit
     import weakref
     from types import ModuleType
 
     code = __spec__.loader.get_code(__name__)
+    pool = WorkerPool()
+    atexit.register(pool.close)
 
-    def _exec(engine, data, width, height):
+    def _exec(engine, data, width, height, arena=None):
         _main = sys.modules["__main__"]
         try:
             mod = ModuleType("__main__")
@@ -26,10 +517,12 @@ def ipr():
 
             mod._engine_ = weakref.ref(engine)
             mod._data_ = data
+            mod._arena_ = arena
             mod._width_ = width
             mod._height_ = height
             mod._mmap_size_ = None
-            mod._mmap_ = None
+            mod._fb_ = None
+            mod._pool_ = pool
 
             sys.modules["__main__"] = mod
             exec(code, mod.__dict__)
@@ -40,10 +533,53 @@ def ipr():
     return _exec
 
 
-def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
+def _serve(conn, redraw_event, state, progress, frame, interrupt):
+    """Pooled worker process, serves the IPR sessions one by one"""
+    print("+++ _serve: started")
+
+    import os
+
+    dir = os.path.dirname(__file__)
+    if dir not in sys.path:
+        sys.path.append(dir)
+
+    import arnold
+
+    plugins_path = os.path.normpath(os.path.join(dir, os.path.pardir, "bin"))
+
+    arnold.AiBegin()
+    try:
+        arnold.AiLoadPlugins(plugins_path)
+        while True:
+            try:
+                msg = conn.recv()
+                if msg == 'ping':
+                    conn.send('pong')
+                    continue
+            except (EOFError, OSError):
+                break
+            if msg is None:
+                break
+            data, mmap_size = msg
+            _worker(data, conn, redraw_event, mmap_size, state, progress, frame, interrupt)
+            try:
+                conn.send('done')
+            except OSError:
+                break
+            # reset the universe for the next session, lease() waits for it with a ping
+            arnold.AiEnd()
+            arnold.AiBegin()
+            arnold.AiLoadPlugins(plugins_path)
+    finally:
+        arnold.AiEnd()
+    print("+++ _serve: finished")
+
+
+def _worker(data, new_data, redraw_event, mmap_size, state, progress, frame, interrupt):
     print("+++ _worker: started")
 
     import os
+    import time
     import ctypes
 
     dir = os.path.dirname(__file__)
@@ -52,18 +588,19 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
 
     import arnold
 
-    nodes = {}
-    lights = {}
     nptrs = []  # nodes linked by AiNodeSetPtr
     links = []  # nodes linked by AiNodeLink
+    maps = {}  # shared arrays {path: mmap}
 
     def _AiNodeSetArray(node, param, value):
         t, a = value
+        if isinstance(a, tuple):
+            a = _attach(maps, a)
         _len = len(a)
         if t == arnold.AI_TYPE_VECTOR:
             _len //= 3
-        elif t == arnold.AI_TYPE_UINT:
-            pass
+        elif t == arnold.AI_TYPE_VECTOR2:
+            _len //= 2
         _a = arnold.AiArrayConvert(_len, 1, t, ctypes.c_void_p(a.ctypes.data))
         arnold.AiNodeSetArray(node, param, _a)
 
@@ -74,7 +611,7 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
         'NodeSocketFloat': lambda n, i, v: arnold.AiNodeSetFlt(n, i, v),
         'NodeSocketColor': lambda n, i, v: arnold.AiNodeSetRGBA(n, i, *v),
         'NodeSocketVector': lambda n, i, v: arnold.AiNodeSetVec(n, i, *v),
-        'NodeSocketVectorXYZ': lambda n, i, v: arnold.AiNodeSetVector(n, i, *v),
+        'NodeSocketVectorXYZ': lambda n, i, v: arnold.AiNodeSetVec(n, i, *v),
         'NodeSocketString': lambda n, i, v: arnold.AiNodeSetStr(n, i, v),
         'ArnoldNodeSocketColor': lambda n, i, v: arnold.AiNodeSetRGB(n, i, *v),
         'ArnoldNodeSocketByte': lambda n, i, v: arnold.AiNodeSetByte(n, i, v),
@@ -90,11 +627,55 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
         'STRING': lambda n, p, v: arnold.AiNodeSetStr(n, p, v),
         'MATRIX': lambda n, p, v: arnold.AiNodeSetMatrix(n, p, arnold.AtMatrix(*v)),
         'ARRAY': _AiNodeSetArray,
+        'RANGE': lambda n, p, v: _AiNodeSetArray(n, p, (arnold.AI_TYPE_UINT, numpy.arange(v, dtype=numpy.uint32))),
         'LINK': lambda n, p, v: links.append((n, p, v)),
         'NODE': lambda n, p, v: nptrs.append((n, p, v)),
+        'NODES': lambda n, p, v: nptrs.append((n, p, v)),
     }
 
-    arnold.AiBegin()
+    def _set(node, params):
+        for n, (t, v) in params.items():
+            _AiNodeSet[t](node, n, v)
+
+    def _resolve():
+        """Link nodes by name, after all nodes of a message are created"""
+        lookup = arnold.AiNodeLookUpByName
+        for n, p, v in nptrs:
+            if isinstance(v, str):
+                arnold.AiNodeSetPtr(n, p, lookup(v))
+            else:
+                a = arnold.AiArrayAllocate(len(v), 1, arnold.AI_TYPE_POINTER)
+                for i, _v in enumerate(v):
+                    arnold.AiArraySetPtr(a, i, lookup(_v))
+                arnold.AiNodeSetArray(n, p, a)
+        for n, p, v in links:
+            arnold.AiNodeLink(lookup(v), p, n)
+        del nptrs[:]
+        del links[:]
+
+    def _upsert(nodes):
+        """Create nodes, nodes with the same name and type are reused"""
+        for nt, np in nodes:
+            name = np['name'][1]
+            anode = arnold.AiNodeLookUpByName(name)
+            if anode is not None:
+                if arnold.AiNodeEntryGetName(arnold.AiNodeGetNodeEntry(anode)) == nt:
+                    for n, (t, v) in np.items():
+                        if t != 'LINK' and arnold.AiNodeIsLinked(anode, n):
+                            arnold.AiNodeUnlink(anode, n)
+                    _set(anode, np)
+                    continue
+                arnold.AiNodeDestroy(anode)
+            anode = arnold.AiNode(nt)
+            _set(anode, np)
+
+    def _destroy(names):
+        for name in names:
+            anode = arnold.AiNodeLookUpByName(name)
+            if anode is not None:
+                arnold.AiNodeDestroy(anode)
+
+    fb = None
     try:
         # arnold.AiMsgSetConsoleFlags(arnold.AI_LOG_ALL)
         # arnold.AiMsgSetConsoleFlags(0x000E)
@@ -103,25 +684,11 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
         # pp(data)
 
         ## Nodes
-        for node in data['nodes']:
-            nt, np = node
-            anode = arnold.AiNode(nt)
-            for n, (t, v) in np.items():
-                _AiNodeSet[t](anode, n, v)
-            nodes[id(node)] = anode
-        for light in data['lights']:
-            nt, np = light
-            anode = arnold.AiNode(nt)
-            for n, (t, v) in np.items():
-                _AiNodeSet[t](anode, n, v)
-            lights[id(light)] = anode
+        _upsert(data['nodes'])
         options = arnold.AiUniverseGetOptions()
-        for n, (t, v) in data['options'].items():
-            _AiNodeSet[t](options, n, v)
-        for n, p, v in nptrs:
-            arnold.AiNodeSetPtr(n, p, nodes[id(v)])
-        for n, p, v in links:
-            arnold.AiNodeLink(nodes[id(v)], p, n)
+        _set(options, data['options'])
+        _resolve()
+        _detach(maps)
 
         ## Outputs
         filter = arnold.AiNode("gaussian_filter")
@@ -136,37 +703,60 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
         arnold.AiNodeSetArray(options, "outputs", outputs)
 
         sl = data['sl']
+        # (AA samples per pass, max samples per pixel, time limit) or None
+        progressive = data.get('progressive')
+
+        fb = Framebuffer(data['framebuffer'])
+        fb.resize(*mmap_size)
 
-        del nodes, nptrs, links, data
+        del data
 
-        if platform.system() == "Darwin" or "Linux":
-            _rect = lambda w, h: numpy.frombuffer(
-                mmap.mmap(-1, w * h * 4 * 4), dtype=numpy.float32
-            ).reshape([h, w, 4])
-            rect = _rect(*mmap_size)
+        # accumulated passes: weighted sum of pixels and weights per pixel,
+        # weight is the number of samples of the current pass, 0 - not accumulated
+        accum = {'weight': 0, 'sum': None, 'count': None}
+
+        def _accumulate(rect, s, a):
+            weight = accum['weight']
+            if not weight:
+                rect[s] = a
+                return
+            acc = accum['sum']
+            count = accum['count']
+            acc[s] += a * weight
+            count[s] += weight
+            numpy.divide(acc[s], count[s][..., None], out=rect[s])
 
-        if platform.system() == "Windows":
-            _rect = lambda n, w, h: numpy.frombuffer(
-                mmap.mmap(-1, w * h * 4 * 4, n), dtype=numpy.float32
-            ).reshape([h, w, 4])
-            rect = _rect(mmap_name, *mmap_size)
+        def _interrupted():
+            """A camera or geometry change is waiting"""
+            if state.value == ABORT:
+                return True
+            if interrupt.value < Updates.GEOMETRY:
+                return False
+            if new_data.poll():
+                return True
+            # the flag was raised after its message was applied
+            interrupt.value = 0
+            return False
 
         def _callback(x, y, width, height, buffer, data):
             #print("+++ _callback:", x, y, width, height, ctypes.cast(buffer, ctypes.c_void_p))
             if buffer:
                 try:
-                    if new_data.poll():
+                    if _interrupted():
                         arnold.AiRenderInterrupt()
                     else:
                         #print("+++ _callback: tile", x, y, width, height)
-                        _buffer = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_uint16))
+                        _buffer = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_float))
                         a = numpy.ctypeslib.as_array(_buffer, shape=(height, width, 4))
-                        rect[y : y + height, x : x + width] = a
-                        redraw_event.set()
+                        with fb.lock:
+                            _accumulate(fb.back(), numpy.s_[y : y + height, x : x + width], a)
+                            fb.mark(x, y, width, height)
+                        if fb.publish(1 / 30):
+                            redraw_event.set()
                     return
                 finally:
                     arnold.AiFree(buffer)
-            elif not new_data.poll():
+            elif not _interrupted():
                 return
             arnold.AiRenderAbort()
             print("+++ _callback: abort")
@@ -174,52 +764,110 @@ def _worker(data, new_data, redraw_event, mmap_size, mmap_name, state):
         cb = arnold.AtDisplayCallBack(_callback)
         arnold.AiNodeSetPtr(driver, "callback", cb)
 
-        class _Dict(dict):
-            def update(self, u):
-                for k, v in u.items():
-                    if isinstance(v, dict):
-                        self[k] = _Dict.update(self.get(k, {}), v)
-                    else:
-                        self[k] = u[k]
-                return self
+        def _apply(data):
+            _destroy(data.get('destroy', ()))
+            _upsert(data.get('upsert', ()))
+            _nodes = data.get('nodes')
+            if _nodes is not None:
+                for name, params in _nodes.items():
+                    node = arnold.AiNodeLookUpByName(name)
+                    if node is not None:
+                        _set(node, params)
+            opts = data.get('options')
+            if opts is not None:
+                _set(options, opts)
+            _resolve()
+            _detach(maps)
 
+        # start of the first frame after a change, see _render()
+        changed = [time.perf_counter()]
 
-        while state.value != ABORT:
-            for _sl in range(*sl):
+        def _render():
+            """AiRender, the first complete frame after a change is timed to frame"""
+            res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
+            if fb.publish():
+                redraw_event.set()
+            if res == arnold.AI_SUCCESS and changed[0] is not None:
+                frame[:] = [time.perf_counter() - changed[0], mmap_size[0] * mmap_size[1]]
+                changed[0] = None
+            return res
+
+        def _progressive():
+            """Blocky preview levels, then passes accumulated until the budget is spent"""
+            accum['weight'] = 0
+            progress[:] = [0, 0]
+            for _sl in range(sl[0], 0):
                 arnold.AiNodeSetInt(options, "AA_samples", _sl)
-                res = arnold.AiRender(arnold.AI_RENDER_MODE_CAMERA)
-                if res == arnold.AI_SUCCESS:
+                if _render() != arnold.AI_SUCCESS or new_data.poll():
+                    return
+            aa, max_samples, time_limit = progressive
+            shape = (mmap_size[1], mmap_size[0])
+            accum['sum'] = numpy.zeros(shape + (4, ), dtype=numpy.float32)
+            accum['count'] = numpy.zeros(shape, dtype=numpy.float32)
+            accum['weight'] = aa * aa
+            arnold.AiNodeSetInt(options, "AA_samples", aa)
+            pc = time.perf_counter()
+            seed = 0
+            samples = 0
+            while samples < max_samples and state.value != ABORT:
+                arnold.AiNodeSetInt(options, "AA_seed", seed)
+                if _render() != arnold.AI_SUCCESS:
+                    return
+                if new_data.poll():
+                    # apply the options between the passes
+                    return
+                seed += 1
+                samples += aa * aa
+                if time_limit and time.perf_counter() - pc > time_limit:
+                    progress[:] = [samples, 1.0]
                     break
+                progress[:] = [samples, min(samples / max_samples, 1.0)]
+            arnold.AiMsgDebug(b"IPR: %d samples per pixel", ctypes.c_int(samples))
+
+        _data = {}
+        while state.value != ABORT:
+            if progressive is None:
+                for _sl in range(*sl):
+                    arnold.AiNodeSetInt(options, "AA_samples", _sl)
+                    res = _render()
+                    if res == arnold.AI_SUCCESS:
+                        break
+            else:
+                _progressive()
             if state.value == ABORT:
                 #print("+++ _worker: abort")
                 break;
 
-            data = _Dict()
+            # apply all pending scene edits, in order, between render passes
+            interrupt.value = 0
             _data = new_data.recv()
-            print(_data)
             while _data is not None:
                 # from pprint import pprint as pp
                 # print("+++ _worker: data")
                 # pp(_data)
-                data.update(_data)
+                _apply(_data)
+                path = _data.get('framebuffer')
+                if path is not None:
+                    fb.close()
+                    fb = Framebuffer(path)
+                size = _data.get('mmap_size')
+                if size is not None:
+                    mmap_size = size
+                    fb.resize(*size)
                 if not new_data.poll():
-                    _nodes = data.get('nodes')
-                    if _nodes is not None:
-                        for name, params in _nodes.items():
-                            node = arnold.AiNodeLookUpByName(name)
-                            for n, (t, v) in params.items():
-                                _AiNodeSet[t](node, n, v)
-                    opts = data.get('options')
-                    if opts is not None:
-                        for n, (t, v) in opts.items():
-                            _AiNodeSet[t](options, n, v)
-                    size = data.get('mmap_size')
-                    if size is not None:
-                        rect = _rect(mmap_name, *size)
                     break
                 _data = new_data.recv()
+            if _data is None:
+                break
+            changed[0] = time.perf_counter()
+
+        if _data is not None:
+            # skip the rest of the session, stop() ends it with None
+            while new_data.recv() is not None:
+                pass
     finally:
-        arnold.AiEnd()
+        if fb is not None:
+            fb.close()
     print("+++ _worker: finished")
 
 
@@ -235,92 +883,177 @@ def _main():
     # logger = _mp.log_to_stderr()
     # logger.setLevel(logging.INFO)
 
-    global _engine_, _data_, _width_, _height_, _mmap_size_, _mmap_
+    global _engine_, _data_, _arena_, _width_, _height_, _mmap_size_, _fb_, _pool_
 
-    _mmap_name = "blender/barnold/ipr/pid-%d" % id(_engine_)
+    import shutil
+    import tempfile
 
-    if platform.system() == "Darwin" or "Linux":
-        _mmap_ = mmap.mmap(-1, 64 * 1024 * 1024)  # 64Mb
+    # framebuffer files, opened by name in the worker
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    fb_dir = tempfile.mkdtemp(prefix="barnold-fb-", dir=root)
 
-    if platform.system() == "Windows":
-        _mmap_ = mmap.mmap(-1, 64 * 1024 * 1024, _mmap_name)  # 64Mb
+    worker = _pool_.lease(_serve, _data_.get('workers', 1))
+    state = worker.state
+    # dynamic resolution: (frame budget, min. scale, idle seconds) or None
+    resolution = _data_.get('resolution')
+    frame = worker.frame
+    # scale of the region resolution, time of the last change
+    view = {'scale': 1.0, 'changed': time.perf_counter()}
+    progress = worker.progress
+    interrupt = worker.interrupt
+    redraw_event = worker.redraw_event
 
-    state = _mp.Value('i', 0)
-    redraw_event = _mp.Event()
+    def _idle():
+        """View is still long enough to step up to the full resolution"""
+        return (
+            view['scale'] < 1.0 and
+            time.perf_counter() - view['changed'] > resolution[2]
+        )
 
     def tag_redraw():
-        while redraw_event.wait() and state.value != ABORT:
+        # the worker process is polled, without dynamic resolution only the
+        # worker requests redraws
+        timeout = 1.0 if resolution is None else min(resolution[2], 0.1)
+        dead = False
+        while True:
+            if not redraw_event.wait(timeout):
+                if dead or worker.process.is_alive():
+                    if resolution is None or not _idle():
+                        continue
+                else:
+                    # view_draw starts a new session
+                    dead = True
+            if state.value == ABORT:
+                break
             redraw_event.clear()
             e = _engine_()
             if e is not None:
                 e.tag_redraw()
             del e
 
-    def _mmap_size(opts):
-        global _mmap_
-        m = max(_width_, _height_)
-        if m > 300:
-            c = 900 / (m + 600)
-            w = int(_width_ * c)
-            h = int(_height_ * c)
-        else:
-            w = _width_
-            h = _height_
+    def _scale():
+        """Fraction of the region resolution to render at"""
+        if resolution is None:
+            m = max(_width_, _height_)
+            return 900 / (m + 600) if m > 300 else 1.0
+        budget, min_scale, idle = resolution
+        if time.perf_counter() - view['changed'] > idle:
+            return 1.0
+        seconds, pixels = frame
+        if not seconds:
+            return view['scale']
+        # frame time is proportional to the number of pixels
+        s = math.sqrt(budget / seconds * pixels / (_width_ * _height_))
+        return min(max(s, min_scale), 1.0)
 
-        if platform.system() == "Darwin" or "Linux":
-            _mmap_ = mmap.mmap(-1, w * h * 4 * 4)
+    def _size(scale):
+        return max(int(_width_ * scale), 1), max(int(_height_ * scale), 1)
 
-        if platform.system() == "Windows":
-            _mmap_ = mmap.mmap(-1, w * h * 4 * 4, _mmap_name)
+    def _mmap_size(data, w, h):
+        global _fb_
+        # the framebuffer is allocated for the full region, lower resolutions reuse it
+        size = w * h * 4 * 4
+        if _fb_ is None or size > _fb_.capacity:
+            if _fb_ is not None:
+                _fb_.close()
+                try:
+                    os.remove(_fb_.path)
+                except OSError:
+                    pass
+            _fb_ = Framebuffer.create(fb_dir, max(_width_ * _height_ * 4 * 4, size), w, h)
+            data['framebuffer'] = _fb_.path
 
+        opts = data.setdefault('options', {})
         opts['xres'] = ('INT', w)
         opts['yres'] = ('INT', h)
         return w, h
 
-    _mmap_size_ = _mmap_size(_data_['options'])
-    pout, pin = _mp.Pipe(False)
+    view['scale'] = _scale()
+    _mmap_size_ = _mmap_size(_data_, *_size(view['scale']))
+    pin = worker.conn
+    updates = Updates(_data_)
+
+    def send():
+        while True:
+            data, priority = updates.get()
+            if data is None:
+                break
+            try:
+                pin.send(data)
+            except OSError:
+                # the worker died, view_draw starts a new session
+                redraw_event.set()
+                break
+            # raised after the message is in the pipe, so the worker finds it
+            interrupt.value = max(interrupt.value, priority)
 
     def update(width, height, data):
         global _width_, _height_, _mmap_size_
-        if _width_ != width or _height_ != height:
-            _width_ = width
-            _height_ = height
-            _mmap_size_ = _mmap_size(data.setdefault('options', {}))
-            data['mmap_size'] = _mmap_size_
+        if data:
+            view['changed'] = time.perf_counter()
+        resized = _width_ != width or _height_ != height
+        _width_ = width
+        _height_ = height
+        scale = _scale()
+        current = view['scale']
+        if resized or scale == 1.0 != current or abs(scale - current) > 0.1 * current:
+            view['scale'] = scale
+            size = _size(scale)
+            if resized or size != _mmap_size_:
+                _mmap_size_ = _mmap_size(data, *size)
+                data['mmap_size'] = _mmap_size_
         if data:
             #print(">>> update [%f]" % time.clock())
-            pin.send(data)
-        return _mmap_size_, numpy.frombuffer(_mmap_, dtype=numpy.float32)
+            updates.put(data)
+        # the size of the published frame, it lags behind a resize
+        generation, rect = _fb_.read()
+        h, w = rect.shape[:2]
+        return (w, h), rect.reshape(-1)
 
     redraw_thread = threading.Thread(target=tag_redraw)
-    process = _mp.Process(target=_worker, args=(
-        _data_, pout, redraw_event, _mmap_size_, _mmap_name, state
-    ))
+    send_thread = threading.Thread(target=send)
+
+    def converged():
+        """(samples per pixel, fraction of the progressive budget)"""
+        return int(progress[0]), progress[1]
+
+    def alive():
+        """False if the worker died, the session must be started again"""
+        return worker.process.is_alive()
 
     def stop():
         print(">>> stop [%f]: ABORT" % time.perf_counter())
         state.value = ABORT
-        print(">>> stop [%f]: close data" % time.perf_counter())
-        pin.send(None)
-        pin.close()
-        print(">>> stop [%f]: set event" % time.perf_counter())
-        redraw_event.set()
-        print(">>> stop [%f]: join" % time.perf_counter(), redraw_thread)
-        redraw_thread.join()
-        print(">>> stop [%f]:" % time.perf_counter(), redraw_thread)
-        print(">>> stop [%f]: join" % time.perf_counter(), process)
-        process.join(5)
-        if process.is_alive():
-            print(">>> stop [%f]: terminate" % time.perf_counter(), process)
-            process.terminate()
-        print(">>> stop [%f]:" % time.perf_counter(), process)
+        try:
+            print(">>> stop [%f]: close data" % time.perf_counter())
+            updates.close()
+            send_thread.join()
+            try:
+                pin.send(None)
+            except OSError:
+                # the worker died, release() kills what is left of it
+                pass
+            print(">>> stop [%f]: set event" % time.perf_counter())
+            redraw_event.set()
+            print(">>> stop [%f]: join" % time.perf_counter(), redraw_thread)
+            redraw_thread.join()
+            print(">>> stop [%f]:" % time.perf_counter(), redraw_thread)
+        finally:
+            print(">>> stop [%f]: release" % time.perf_counter(), worker.process)
+            _pool_.release(worker)
+            if _arena_ is not None:
+                _arena_.close()
+            _fb_.close()
+            shutil.rmtree(fb_dir, True)
 
+    # the session starts as soon as the worker reads its first message
+    pin.send((_data_, _mmap_size_))
     redraw_thread.start()
-    process.start()
+    send_thread.start()
 
-    return update, stop
+    return update, stop, converged, alive
 
 
 if __name__ == "__main__":
-    update, stop = _main()
+    update, stop, converged, alive = _main()
     del _data_
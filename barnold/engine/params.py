@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "declarative node parameter tables"
+
+import operator
+
+import arnold
+
+# {type: (setter, unpack value)}
+_SETTERS = {
+    'BOOL': (arnold.AiNodeSetBool, False),
+    'BYTE': (arnold.AiNodeSetByte, False),
+    'INT': (arnold.AiNodeSetInt, False),
+    'UINT': (arnold.AiNodeSetUInt, False),
+    'FLOAT': (arnold.AiNodeSetFlt, False),
+    'STRING': (arnold.AiNodeSetStr, False),
+    'RGB': (arnold.AiNodeSetRGB, True),
+    'RGBA': (arnold.AiNodeSetRGBA, True),
+    'VECTOR': (arnold.AiNodeSetVec, True),
+    'VECTOR2': (arnold.AiNodeSetVec2, True),
+}
+
+
+class Params:
+    """Compiled parameters of a node type.
+
+    Setters are resolved once and all values are read from the data by one
+    attrgetter call.
+
+    Args:
+        params: (param, type[, attr]), attr is a dotted path of the value
+            relative to the data, the parameter name if omitted.
+    """
+
+    def __init__(self, *params):
+        self.params = [(p[0], p[1], p[2] if len(p) > 2 else p[0]) for p in params]
+        self._get = operator.attrgetter(*(attr for param, t, attr in self.params))
+        self._set = [(param, ) + _SETTERS[t] for param, t, attr in self.params]
+
+    def values(self, data):
+        v = self._get(data)
+        return v if len(self.params) > 1 else (v, )
+
+    def apply(self, node, data):
+        for (param, setter, unpack), v in zip(self._set, self.values(data)):
+            if unpack:
+                setter(node, param, *v)
+            else:
+                setter(node, param, v)
+
+    def ipr(self, data):
+        """Parameters in the IPR format: {param: (type, value)}"""
+        return {
+            param: (t, tuple(v) if self._set[i][2] else v)
+            for i, ((param, t, attr), v) in enumerate(zip(self.params, self.values(data)))
+        }
+
+
+# scene.arnold -> options
+OPTIONS = Params(
+    ("thread_priority", 'STRING'),
+    ("pin_threads", 'STRING'),
+    ("abort_on_error", 'BOOL'),
+    ("abort_on_license_fail", 'BOOL'),
+    ("skip_license_check", 'BOOL'),
+    ("error_color_bad_texture", 'RGB'),
+    ("error_color_bad_pixel", 'RGB'),
+    ("error_color_bad_shader", 'RGB'),
+    ("bucket_size", 'INT'),
+    ("bucket_scanning", 'STRING'),
+    ("ignore_textures", 'BOOL'),
+    ("ignore_shaders", 'BOOL'),
+    ("ignore_atmosphere", 'BOOL'),
+    ("ignore_lights", 'BOOL'),
+    ("ignore_shadows", 'BOOL'),
+    #TODO: DELETE? ("ignore_direct_lighting", 'BOOL'),
+    ("ignore_subdivision", 'BOOL'),
+    ("ignore_displacement", 'BOOL'),
+    ("ignore_bump", 'BOOL'),
+    ("ignore_motion_blur", 'BOOL'),
+    ("ignore_dof", 'BOOL'),
+    ("ignore_smoothing", 'BOOL'),
+    ("ignore_sss", 'BOOL'),
+    # TODO: DELETE? ("auto_transparency_mode", 'STRING'),
+    ("auto_transparency_depth", 'INT'),
+    # TODO: DELETE? ("auto_transparency_threshold", 'FLOAT'),
+    ("texture_max_open_files", 'INT'),
+    ("texture_max_memory_MB", 'FLOAT'),
+    ("texture_searchpath", 'STRING'),
+    ("texture_automip", 'BOOL'),
+    ("texture_autotile", 'INT'),
+    ("texture_accept_untiled", 'BOOL'),
+    ("texture_accept_unmipped", 'BOOL'),
+    #("texture_specular_blur", 'FLOAT'),
+    #("texture_diffuse_blur", 'FLOAT'),
+    ("low_light_threshold", 'FLOAT'),
+    ("GI_sss_samples", 'INT'),
+    ("sss_use_autobump", 'BOOL'),
+    ("GI_volume_samples", 'INT'),
+    ("max_subdivisions", 'BYTE'),
+    ("procedural_searchpath", 'STRING'),
+    ("plugin_searchpath", 'STRING'),
+    # TODO: DELETE? ("texture_gamma", 'FLOAT'),
+    # TODO: DELETE? ("light_gamma", 'FLOAT'),
+    # TODO: DELETE? ("shader_gamma", 'FLOAT'),
+    ("GI_diffuse_depth", 'INT'),
+    ("GI_specular_depth", 'INT'),
+    # TODO: DELETE? ("GI_reflection_depth", 'INT'),
+    ("GI_transmission_depth", 'INT'),
+    ("GI_volume_depth", 'INT'),
+    ("GI_total_depth", 'INT'),
+    ("GI_diffuse_samples", 'INT'),
+    ("GI_specular_samples", 'INT'),
+    ("GI_transmission_samples", 'INT'),
+)
+
+# material -> shader {shader type: Params}
+SHADERS = {
+    'lambert': Params(
+        ("Kd", 'FLOAT', "arnold.lambert.Kd"),
+        ("Kd_color", 'RGB', "arnold.lambert.Kd_color"),
+        ("opacity", 'RGB', "arnold.lambert.opacity"),
+    ),
+    'standard_surface': Params(
+        ("base", 'FLOAT', "arnold.standard_surface.base"),
+        ("base_color", 'RGB', "arnold.standard_surface.base_color"),
+        ("diffuse_roughness", 'FLOAT', "arnold.standard_surface.diffuse_roughness"),
+        ("metalness", 'FLOAT', "arnold.standard_surface.metalness"),
+        ("specular", 'FLOAT', "arnold.standard_surface.specular"),
+        ("specular_color", 'RGB', "arnold.standard_surface.specular_color"),
+        ("specular_roughness", 'FLOAT', "arnold.standard_surface.specular_roughness"),
+        #("specular_ior", 'FLOAT', "arnold.standard_surface.specular_ior"),
+        ("specular_anisotropy", 'FLOAT', "arnold.standard_surface.specular_anisotropy"),
+        ("specular_rotation", 'FLOAT', "arnold.standard_surface.specular_rotation"),
+        ("emission", 'FLOAT', "arnold.standard_surface.emission"),
+        ("emission_color", 'RGB', "arnold.standard_surface.emission_color"),
+        ("transmission", 'FLOAT', "arnold.standard_surface.transmission"),
+        ("transmission_color", 'RGB', "arnold.standard_surface.transmission_color"),
+        ("transmission_depth", 'FLOAT', "arnold.standard_surface.transmission_depth"),
+        ("transmission_scatter", 'RGB', "arnold.standard_surface.transmission_scatter"),
+        ("transmission_scatter_anisotropy", 'FLOAT', "arnold.standard_surface.transmission_scatter_anisotropy"),
+        ("transmission_dispersion", 'FLOAT', "arnold.standard_surface.transmission_dispersion"),
+        ("transmission_extra_roughness", 'FLOAT', "arnold.standard_surface.transmission_extra_roughness"),
+        ("transmit_aovs", 'BOOL', "arnold.standard_surface.transmit_aovs"),
+        ("subsurface", 'FLOAT', "arnold.standard_surface.subsurface"),
+        ("subsurface_color", 'RGB', "arnold.standard_surface.subsurface_color"),
+        ("subsurface_radius", 'RGB', "arnold.standard_surface.subsurface_radius"),
+        ("subsurface_scale", 'FLOAT', "arnold.standard_surface.subsurface_scale"),
+        ("subsurface_anisotropy", 'FLOAT', "arnold.standard_surface.subsurface_anisotropy"),
+        ("subsurface_type", 'STRING', "arnold.standard_surface.subsurface_type"),
+        ("thin_walled", 'BOOL', "arnold.standard_surface.thin_walled"),
+        ("normal", 'VECTOR', "arnold.standard_surface.normal"),
+        ("coat", 'FLOAT', "arnold.standard_surface.coat"),
+        ("coat_color", 'RGB', "arnold.standard_surface.coat_color"),
+        ("coat_roughness", 'FLOAT', "arnold.standard_surface.coat_roughness"),
+        #("coat_ior", 'FLOAT', "arnold.standard_surface.coat_ior"),
+        ("coat_normal", 'VECTOR', "arnold.standard_surface.coat_normal"),
+        ("coat_affect_color", 'FLOAT', "arnold.standard_surface.coat_affect_color"),
+        ("coat_affect_roughness", 'FLOAT', "arnold.standard_surface.coat_affect_roughness"),
+        ("caustics", 'BOOL', "arnold.standard_surface.caustics"),
+        ("internal_reflections", 'BOOL', "arnold.standard_surface.internal_reflections"),
+        ("exit_to_background", 'BOOL', "arnold.standard_surface.exit_to_background"),
+        ("indirect_diffuse", 'FLOAT', "arnold.standard_surface.indirect_diffuse"),
+        ("indirect_specular", 'FLOAT', "arnold.standard_surface.indirect_specular"),
+        ("thin_film_thickness", 'FLOAT', "arnold.standard_surface.thin_film_thickness"),
+        #("thin_film_ior", 'FLOAT', "arnold.standard_surface.thin_film_ior"),
+        ("sheen", 'FLOAT', "arnold.standard_surface.sheen"),
+        ("sheen_color", 'RGB', "arnold.standard_surface.sheen_color"),
+        ("sheen_roughness", 'FLOAT', "arnold.standard_surface.sheen_roughness"),
+        # TODO: other standard_surface node parmas
+    ),
+    'toon': Params(
+        ("base", 'FLOAT', "arnold.toon.base"),
+        ("base_color", 'RGB', "arnold.toon.base_color"),
+        ("base_tonemap", 'RGB', "arnold.toon.base_tonemap"),
+        ("mask_color", 'RGB', "arnold.toon.mask_color"),
+        ("edge_color", 'RGB', "arnold.toon.edge_color"),
+        ("edge_tonemap", 'RGB', "arnold.toon.edge_tonemap"),
+        ("edge_opacity", 'FLOAT', "arnold.toon.edge_opacity"),
+        ("edge_width_scale", 'FLOAT', "arnold.toon.edge_width_scale"),
+        ("silhouette_color", 'RGB', "arnold.toon.silhouette_color"),
+        ("silhouette_tonemap", 'RGB', "arnold.toon.silhouette_tonemap"),
+        ("silhouette_opacity", 'FLOAT', "arnold.toon.silhouette_opacity"),
+        ("silhouette_width_scale", 'FLOAT', "arnold.toon.silhouette_width_scale"),
+        ("enable_silhouette", 'BOOL', "arnold.toon.enable_silhouette"),
+        ("ignore_throughput", 'BOOL', "arnold.toon.ignore_throughput"),
+        ("enable", 'BOOL', "arnold.toon.enable"),
+        ("id_difference", 'BOOL', "arnold.toon.id_difference"),
+        ("shader_difference", 'BOOL', "arnold.toon.shader_difference"),
+        ("uv_threshold", 'FLOAT', "arnold.toon.uv_threshold"),
+        ("angle_threshold", 'FLOAT', "arnold.toon.angle_threshold"),
+        ("specular_color", 'RGB', "arnold.toon.specular_color"),
+        ("specular", 'FLOAT', "arnold.toon.specular"),
+        ("specular_roughness", 'FLOAT', "arnold.toon.specular_roughness"),
+        ("specular_tonemap", 'RGB', "arnold.toon.specular_tonemap"),
+        ("specular_anisotropy", 'FLOAT', "arnold.toon.specular_anisotropy"),
+        ("specular_rotation", 'FLOAT', "arnold.toon.specular_rotation"),
+        ("lights", 'STRING', "arnold.toon.lights"),
+        ("highlight_color", 'RGB', "arnold.toon.highlight_color"),
+        ("highlight_size", 'FLOAT', "arnold.toon.highlight_size"),
+        #("aov_highlight", 'STRING', "arnold.toon.aov_highlight"),
+        ("rim_light", 'STRING', "arnold.toon.rim_light"),
+        ("rim_light_color", 'RGB', "arnold.toon.rim_light_color"),
+        ("rim_light_width", 'FLOAT', "arnold.toon.rim_light_width"),
+        #("aov_rim_light", 'STRING', "arnold.toon.aov_rim_light"),
+        ("transmission_color", 'RGB', "arnold.toon.transmission_color"),
+        ("transmission", 'FLOAT', "arnold.toon.transmission"),
+        ("transmission_roughness", 'FLOAT', "arnold.toon.transmission_roughness"),
+        ("transmission_anisotropy", 'FLOAT', "arnold.toon.transmission_anisotropy"),
+        ("transmission_rotation", 'FLOAT', "arnold.toon.transmission_rotation"),
+        ("emission_color", 'RGB', "arnold.toon.emission_color"),
+        ("emission", 'FLOAT', "arnold.toon.emission"),
+        ("IOR", 'FLOAT', "arnold.toon.IOR"),
+        ("normal", 'VECTOR', "arnold.toon.normal"),
+        ("tangent", 'VECTOR', "arnold.toon.tangent"),
+        ("indirect_diffuse", 'FLOAT', "arnold.toon.indirect_diffuse"),
+        ("indirect_specular", 'FLOAT', "arnold.toon.indirect_specular"),
+        ("bump_mode", 'STRING', "arnold.toon.bump_mode"),
+        ("energy_conserving", 'BOOL', "arnold.toon.energy_conserving"),
+        ("user_id", 'BOOL', "arnold.toon.user_id"),
+        ("sheen", 'FLOAT', "arnold.toon.sheen"),
+        ("sheen_color", 'RGB', "arnold.toon.sheen_color"),
+        ("sheen_roughness", 'FLOAT', "arnold.toon.sheen_roughness"),
+    ),
+    'utility': Params(
+        ("color_mode", 'STRING', "arnold.utility.color_mode"),
+        ("shade_mode", 'STRING', "arnold.utility.shade_mode"),
+        ("overlay_mode", 'STRING', "arnold.utility.overlay_mode"),
+        ("color", 'RGB', "base_color"),
+        ("opacity", 'FLOAT', "arnold.utility.opacity"),
+        ("ao_distance", 'FLOAT', "arnold.utility.ao_distance"),
+    ),
+    'flat': Params(
+        ("color", 'RGB', "base_color"),
+        ("opacity", 'RGB', "arnold.flat.opacity"),
+    ),
+    'standard_hair': Params(
+        ("base", 'FLOAT', "arnold.standard_hair.base"),
+        ("base_color", 'RGB', "arnold.standard_hair.base_color"),
+        ("melanin", 'FLOAT', "arnold.standard_hair.melanin"),
+        ("melanin_redness", 'FLOAT', "arnold.standard_hair.melanin_redness"),
+        ("melanin_randomize", 'FLOAT', "arnold.standard_hair.melanin_randomize"),
+        ("roughness", 'FLOAT', "arnold.standard_hair.roughness"),
+        ("ior", 'FLOAT', "arnold.standard_hair.ior"),
+        ("shift", 'FLOAT', "arnold.standard_hair.shift"),
+        ("specular_tint", 'RGB', "arnold.standard_hair.specular_tint"),
+        ("specular2_tint", 'RGB', "arnold.standard_hair.specular2_tint"),
+        ("transmission_tint", 'RGB', "arnold.standard_hair.transmission_tint"),
+        ("diffuse", 'FLOAT', "arnold.standard_hair.diffuse"),
+        ("diffuse_color", 'RGB', "arnold.standard_hair.diffuse_color"),
+        ("emission", 'FLOAT', "arnold.standard_hair.emission"),
+        ("emission_color", 'RGB', "arnold.standard_hair.emission_color"),
+        ("opacity", 'RGB', "arnold.standard_hair.opacity"),
+        ("indirect_diffuse", 'FLOAT', "arnold.standard_hair.indirect_diffuse"),
+        ("indirect_specular", 'FLOAT', "arnold.standard_hair.indirect_specular"),
+        ("extra_depth", 'FLOAT', "arnold.standard_hair.extra_depth"),
+        ("extra_samples", 'FLOAT', "arnold.standard_hair.extra_samples"),
+    ),
+    'wireframe': Params(
+        ("edge_type", 'STRING', "arnold.wire.edge_type"),
+        ("line_color", 'RGB', "arnold.wire.line_color"),
+        ("fill_color", 'RGB', "arnold.wire.fill_color"),
+        ("line_width", 'FLOAT', "arnold.wire.line_width"),
+        ("raster_space", 'BOOL', "arnold.wire.raster_space"),
+    ),
+    'standard_volume': Params(
+        ("density", 'FLOAT', "arnold.standard_volume.density"),
+        ("scatter", 'FLOAT', "arnold.standard_volume.scatter"),
+        ("scatter_color", 'RGB', "arnold.standard_volume.scatter_color"),
+        ("scatter_anisotropy", 'FLOAT', "arnold.standard_volume.scatter_anisotropy"),
+        ("transparent", 'RGB', "arnold.standard_volume.transparent"),
+        ("transparent_depth", 'FLOAT', "arnold.standard_volume.transparent_depth"),
+        #("emission_mode", 'STRING', "arnold.standard_volume.emission_mode"),
+        ("emission", 'FLOAT', "arnold.standard_volume.emission"),
+        ("emission_color", 'RGB', "arnold.standard_volume.emission_color"),
+        ("temperature", 'FLOAT', "arnold.standard_volume.temperature"),
+        #("blackbody_kelvin", 'FLOAT', "arnold.standard_volume.blackbody_kelvin"),
+        #("blackbody_intensity", 'FLOAT', "arnold.standard_volume.blackbody_intensity"),
+        # ("interpolation", 'FLOAT', "arnold.standard_volume.interpolation"),
+    ),
+}
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "bucket delivery from the display driver to the render result"
+
+import ctypes
+import collections
+
+import numpy
+
+import arnold
+
+
+class TileRing:
+    """Preallocated pixel slabs filled by the display driver, drained here.
+
+    The block is shared with driver_display_callback (its "ring" parameter),
+    the render threads copy a finished bucket into a free slab and queue it
+    without entering Python, all Blender API calls are left to the consumer.
+    See driver_display_callback.cpp for the layout.
+
+    Sequences are loaded and freed cells and slabs are stored through the
+    atomic helpers of the driver plugin, plain numpy access isn't ordered
+    on weakly ordered CPUs (ARM).
+
+    Args:
+        nslots (int): number of slabs.
+        slab_size (int): floats of a slab, an RGBA bucket per AOV.
+        plugin (str): file of the driver plugin.
+        offset (tuple): (x, y) of the region, subtracted from the bucket positions.
+        ncells (int): queue length, power of two.
+    """
+
+    MAGIC = 0x52494e47  # "RING"
+    NO_SLAB = 0xFFFFFFFFFFFFFFFF
+    # header words
+    CELLS, ENQUEUE, DEQUEUE, SLABS, SLAB_SIZE, OVERFLOWS = range(1, 7)
+
+    def __init__(self, nslots, slab_size, plugin, offset=(0, 0), ncells=4096):
+        slab_size += slab_size & 1  # whole words
+        self.offset = offset
+        self.ncells = ncells
+        self.block = numpy.zeros(8 + ncells * 8 + nslots + nslots * slab_size // 2, dtype=numpy.uint64)
+        self.header = self.block[:8]
+        self.cells = self.block[8 : 8 + ncells * 8].reshape(ncells, 8)
+        self.cells[:, 0] = numpy.arange(ncells, dtype=numpy.uint64)
+        offset = 8 + ncells * 8
+        self.states = self.block[offset : offset + nslots]
+        self.slabs = self.block[offset + nslots:].view(numpy.float32).reshape(nslots, slab_size)
+        header = self.header
+        header[self.CELLS] = ncells
+        header[self.SLABS] = nslots
+        header[self.SLAB_SIZE] = slab_size
+        header[0] = self.MAGIC
+
+        lib = ctypes.CDLL(plugin)
+        self._load = lib.RingLoadAcquire
+        self._load.argtypes = [ctypes.c_void_p]
+        self._load.restype = ctypes.c_uint64
+        self._store = lib.RingStoreRelease
+        self._store.argtypes = [ctypes.c_void_p, ctypes.c_uint64]
+        self._store.restype = None
+        # addresses of the first cell and slab state
+        self._cells = self.cells.ctypes.data
+        self._states = self.states.ctypes.data
+
+    @property
+    def address(self):
+        """Pointer for the "ring" parameter of the driver"""
+        return ctypes.c_void_p(self.block.ctypes.data)
+
+    @property
+    def overflows(self):
+        """Buckets which didn't find a free slab"""
+        return int(self.header[self.OVERFLOWS])
+
+    def drain(self):
+        """All queued tiles: (highlights, finished).
+
+        Returns:
+            tuple: lists of (x, y, width, height, slot or None, pixels or None),
+                pixels of a finished bucket are (aovs, width * height, 4).
+        """
+        cells = self.cells
+        mask = self.ncells - 1
+        xoff, yoff = self.offset
+        pos = int(self.header[self.DEQUEUE])
+        highlights = []
+        finished = []
+        while True:
+            i = pos & mask
+            sequence = self._cells + i * 64
+            if self._load(sequence) != pos + 1:
+                break
+            cell = cells[i]
+            x, y, width, height, aovs, data, slab = (int(v) for v in cell[1:])
+            x -= xoff
+            y -= yoff
+            if not data:
+                highlights.append((x, y, width, height, None, None))
+            else:
+                n = width * height * 4 * aovs
+                if slab == self.NO_SLAB:
+                    # the ring was full, the driver allocated the buffer
+                    src = ctypes.cast(data, ctypes.POINTER(ctypes.c_float))
+                    pixels = numpy.ctypeslib.as_array(src, shape=(n, )).copy()
+                    arnold.AiFree(ctypes.c_void_p(data))
+                    slab = None
+                else:
+                    pixels = self.slabs[slab, :n]
+                finished.append((x, y, width, height, slab, pixels.reshape(aovs, -1, 4)))
+            # the cell is free for the next round of the producers
+            self._store(sequence, pos + self.ncells)
+            pos += 1
+        self.header[self.DEQUEUE] = pos
+        return highlights, finished
+
+    def release(self, tiles):
+        """Return the slabs of the written tiles to the driver"""
+        for t in tiles:
+            if t[4] is not None:
+                self._store(self._states + t[4] * 8, 0)
+
+
+class CallbackTiles:
+    """Tiles of a display driver without the ring, built before it.
+
+    Same interface as TileRing, the callback of the driver runs on the
+    render threads and only copies the beauty bucket, the consumer writes it.
+
+    Args:
+        offset (tuple): (x, y) of the region, subtracted from the bucket positions.
+    """
+
+    overflows = 0
+
+    def __init__(self, offset=(0, 0)):
+        xoff, yoff = offset
+        tiles = self._tiles = collections.deque()
+
+        def _callback(x, y, width, height, buffer, data):
+            pixels = None
+            if buffer:
+                try:
+                    src = ctypes.cast(buffer, ctypes.POINTER(ctypes.c_float))
+                    pixels = numpy.ctypeslib.as_array(src, shape=(1, width * height, 4)).copy()
+                finally:
+                    arnold.AiFree(buffer)
+            tiles.append((x - xoff, y - yoff, width, height, None, pixels))
+
+        # the callback must outlive the render
+        self.callback = arnold.AtDisplayCallBack(_callback)
+
+    def drain(self):
+        """All delivered tiles: (highlights, finished), see TileRing.drain"""
+        tiles = self._tiles
+        highlights = []
+        finished = []
+        while tiles:
+            t = tiles.popleft()
+            (highlights if t[5] is None else finished).append(t)
+        return highlights, finished
+
+    def release(self, tiles):
+        pass
+
+
+def rows(tiles):
+    """Coalesce horizontally adjacent tiles of equal height.
+
+    Args:
+        tiles (list): [(x, y, width, height, data)].
+    Returns:
+        list: [(x, y, width, height, [data])], data of a run from left to right.
+    """
+    ret = []
+    for x, y, w, h, data in sorted(tiles, key=lambda t: (t[1], t[3], t[0])):
+        if ret:
+            _x, _y, _w, _h, run = ret[-1]
+            if _y == y and _h == h and _x + _w == x:
+                run.append(data)
+                ret[-1] = (_x, _y, _w + w, _h, run)
+                continue
+        ret.append((x, y, w, h, [data]))
+    return ret
+
+
+def join(height, run):
+    """Pixels of a run of tiles as one rect (width * height, 4)"""
+    if len(run) == 1:
+        return run[0].reshape(-1, 4)
+    return numpy.concatenate([p.reshape(height, -1, 4) for p in run], axis=1).reshape(-1, 4)
@@ -2,6 +2,9 @@
 
 __authors__ = "Tyler Furby, Ildar Nikolaev"
 
+import os
+import time
+import subprocess
 import traceback
 
 import bpy
@@ -9,6 +12,8 @@ import bl_ui
 from bpy.types import Operator
 from bpy.props import (
     BoolProperty,
+    EnumProperty,
+    IntProperty,
     StringProperty
 )
 from bpy_extras.io_utils import ExportHelper
@@ -165,12 +170,64 @@ class ArnoldExportASS(Operator, ExportHelper):
     filter_glob: StringProperty(default="*.ass", options={'HIDDEN'})
     binary: BoolProperty(name="Binary-encode ASS File", default=True)
     open_procs: BoolProperty(name="Expand Procedurals")
+    split: EnumProperty(
+        name="Split Geometry",
+        description="Write geometry into separate files referenced by procedurals",
+        items=[
+            ('NONE', "None", "Single file"),
+            ('OBJECT', "Per Object", "File per object"),
+            ('COLLECTION', "Per Collection", "File per collection")
+        ],
+        default='NONE'
+    )
+    compress: BoolProperty(name="Compress Chunks (.ass.gz)")
+    frames: EnumProperty(
+        name="Frames",
+        items=[
+            ('CURRENT', "Current Frame", "Export the current frame"),
+            ('RANGE', "Frame Range", "Export the scene frame range, file per frame (name.####.ass)")
+        ],
+        default='CURRENT'
+    )
+    processes: IntProperty(
+        name="Processes",
+        description="Background Blender processes exporting frame slices (the file must be saved)",
+        min=1, soft_max=32,
+        default=1
+    )
+    static_include: BoolProperty(
+        name="Static Include",
+        description="Write not animated objects once into a shared include file",
+        default=True
+    )
+    # used by background processes
+    frame_start: IntProperty(default=0, options={'HIDDEN'})
+    frame_end: IntProperty(default=-1, options={'HIDDEN'})
+    include: StringProperty(options={'HIDDEN'})
 
     @classmethod
     def poll(cls, context):
         return context.scene and context.scene.render.engine == ArnoldRenderEngine.bl_idname
 
+    def draw(self, context):
+        layout = self.layout
+        layout.prop(self, "binary")
+        layout.prop(self, "open_procs")
+        layout.prop(self, "frames")
+        # a frame range is written as a file per frame
+        col = layout.column()
+        col.prop(self, "split")
+        col.prop(self, "compress")
+        col.enabled = self.frames == 'CURRENT'
+        col = layout.column()
+        col.prop(self, "processes")
+        col.prop(self, "static_include")
+        col.enabled = self.frames == 'RANGE'
+
     def execute(self, context):
+        if self.frames == 'RANGE' and (self.split != 'NONE' or self.compress):
+            self.report({'ERROR'}, "Export ASS:\nSplit and compressed chunks need the current frame mode")
+            return {'CANCELLED'}
         if self.filepath:
             try:
                 from . import engine
@@ -179,16 +236,23 @@ class ArnoldExportASS(Operator, ExportHelper):
                 scene = context.scene
                 render = scene.render
                 resolution = render.resolution_percentage / 100
-                engine.export_ass(
-                    context.blend_data,
-                    depsgraph,
-                    scene.camera,
-                    int(render.resolution_x * resolution),
-                    int(render.resolution_y * resolution),
-                    self.filepath,
-                    self.open_procs,
-                    self.binary
-                )
+                xres = int(render.resolution_x * resolution)
+                yres = int(render.resolution_y * resolution)
+                if self.frames == 'RANGE':
+                    self._export_frames(context, engine, xres, yres)
+                else:
+                    engine.export_ass(
+                        context.blend_data,
+                        depsgraph,
+                        scene.camera,
+                        xres,
+                        yres,
+                        self.filepath,
+                        self.open_procs,
+                        self.binary,
+                        self.split,
+                        self.compress
+                    )
                 return {'FINISHED'}
             except Exception as e:
                 self.report({'ERROR'}, traceback.format_exc())
@@ -196,6 +260,98 @@ class ArnoldExportASS(Operator, ExportHelper):
             self.report({'WARNING'}, "Export ASS:\nEmpty path specified!")
         return {'CANCELLED'}
 
+    def _export_frames(self, context, engine, xres, yres):
+        scene = context.scene
+        if self.frame_end < self.frame_start:
+            frames = list(range(scene.frame_start, scene.frame_end + 1, scene.frame_step))
+        else:
+            frames = list(range(self.frame_start, self.frame_end + 1, scene.frame_step))
+        if not frames:
+            return
+
+        include = self.include
+        if self.static_include and not include:
+            include = os.path.splitext(self.filepath)[0] + "_static" + (".ass.gz" if self.compress else ".ass")
+            frame_current = scene.frame_current
+            scene.frame_set(frames[0])
+            n = engine.export_ass_static(context.blend_data, context.depsgraph, scene.camera,
+                                         xres, yres, include, self.binary)
+            scene.frame_set(frame_current)
+            print("Arnold: %d static objects '%s'" % (n, include))
+
+        processes = min(self.processes, len(frames))
+        if processes > 1 and (not context.blend_data.filepath or context.blend_data.is_dirty):
+            self.report({'WARNING'}, "Export ASS:\nSave the file to use background processes")
+            processes = 1
+
+        wm = context.window_manager
+        wm.progress_begin(0, len(frames))
+        start = time.perf_counter()
+
+        def _progress(done):
+            wm.progress_update(done)
+            if done:
+                eta = (time.perf_counter() - start) / done * (len(frames) - done)
+                print("Arnold: %d/%d frames, ETA %.1fs" % (done, len(frames), eta))
+
+        try:
+            if processes > 1:
+                self._export_frames_mp(frames, processes, include, _progress)
+            else:
+                frame_current = scene.frame_current
+                done = iter(range(1, len(frames) + 1))
+                try:
+                    engine.export_ass_frames(context.blend_data, scene.camera, xres, yres,
+                                             self.filepath, frames, self.open_procs, self.binary,
+                                             include, lambda frame: _progress(next(done)))
+                finally:
+                    scene.frame_set(frame_current)
+        finally:
+            wm.progress_end()
+        self.report({'INFO'}, "Export ASS: %d frames (%.1fs)" % (len(frames), time.perf_counter() - start))
+
+    def _export_frames_mp(self, frames, processes, include, progress):
+        """Export contiguous frame slices in background Blender processes"""
+        from .engine import frame_path
+
+        # the operator reports errors instead of raising, the exit code is set by the expression
+        expr = (
+            "import bpy\n"
+            "if bpy.ops.barnold.export_ass(filepath=%r, binary=%r, open_procs=%r, frames='RANGE', "
+            "frame_start=%d, frame_end=%d, static_include=False, include=%r) != {'FINISHED'}:\n"
+            "    raise RuntimeError('Export ASS failed')"
+        )
+        paths = [frame_path(self.filepath, frame) for frame in frames]
+        mtime = int(time.time())  # whole seconds, file systems with coarse timestamps
+        n = len(frames)
+        procs = []
+        for i in range(processes):
+            fs = frames[n * i // processes:n * (i + 1) // processes]
+            cmd = [
+                bpy.app.binary_path, "-b", bpy.data.filepath, "--python-exit-code", "1", "--python-expr",
+                expr % (self.filepath, self.binary, self.open_procs, fs[0], fs[-1], include)
+            ]
+            procs.append(subprocess.Popen(cmd, stdout=subprocess.DEVNULL))
+
+        done = 0
+        try:
+            while any(p.poll() is None for p in procs):
+                time.sleep(0.5)
+                d = sum(1 for path in paths if os.path.exists(path) and os.path.getmtime(path) >= mtime)
+                if d != done:
+                    done = d
+                    progress(done)
+        except:
+            for p in procs:
+                p.kill()
+            raise
+        failed = [p.args for p in procs if p.returncode != 0]
+        if failed:
+            raise RuntimeError("Background export failed: %s" % failed)
+        missing = [path for path in paths if not os.path.exists(path) or os.path.getmtime(path) < mtime]
+        if missing:
+            raise RuntimeError("Background export didn't write: %s" % missing)
+
     @classmethod
     def register(cls):
         def menu_func(self, context):
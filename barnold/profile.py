@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "per phase and per object export timings"
+
+import os
+import csv
+import json
+import time
+import threading
+import collections
+from contextlib import contextmanager
+
+# report of the last profiled render, see Profiler.report()
+LAST = None
+
+
+class Profiler:
+    """Export timings by phase (to_mesh, foreach_get, AiArrayConvert, ...).
+
+    Timings are also accumulated per object, the current object is set by
+    the exporter, worker threads pass it explicitly.
+    """
+
+    def __init__(self):
+        self.phases = collections.OrderedDict()  # {phase: seconds}
+        self.objects = collections.OrderedDict()  # {name: {phase: seconds}}
+        self.nbytes = collections.Counter()  # {name: bytes}
+        self.object = None  # current object name
+        self._lock = threading.Lock()
+
+    def add(self, phase, seconds, nbytes=0, ob=None):
+        if ob is None:
+            ob = self.object
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+            if ob is not None:
+                t = self.objects.setdefault(ob, {})
+                t[phase] = t.get(phase, 0.0) + seconds
+                self.nbytes[ob] += nbytes
+
+    @contextmanager
+    def phase(self, phase, ob=None):
+        pc = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - pc, ob=ob)
+
+    def report(self):
+        """
+        Returns:
+            dict: {"phases": {phase: seconds},
+                   "objects": [{"name", "seconds", "bytes", phase: seconds}], slowest first}
+        """
+        objects = []
+        for name, t in self.objects.items():
+            ob = {"name": name, "seconds": sum(t.values()), "bytes": self.nbytes[name]}
+            ob.update(t)
+            objects.append(ob)
+        objects.sort(key=lambda ob: ob["seconds"], reverse=True)
+        return {"phases": dict(self.phases), "objects": objects}
+
+
+def write(report, filepath):
+    """Write a report as JSON, or as CSV of the objects if filepath ends with .csv"""
+    dirname = os.path.dirname(filepath)
+    if dirname:
+        os.makedirs(dirname, exist_ok=True)
+    if filepath.lower().endswith(".csv"):
+        phases = list(report["phases"])
+        with open(filepath, "w", newline="") as f:
+            w = csv.writer(f)
+            w.writerow(["name", "seconds", "bytes"] + phases)
+            for ob in report["objects"]:
+                w.writerow([ob["name"], ob["seconds"], ob["bytes"]] + [ob.get(p, 0.0) for p in phases])
+    else:
+        with open(filepath, "w") as f:
+            json.dump(report, f, indent=2)
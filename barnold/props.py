@@ -40,6 +40,22 @@ _LOG_FLAGS = [
     ('SSS', "SSS", "messages about sub-surface scattering pointclouds", 0x2000),
     ('ALL', "All", "All messages", 0x3fff)
 ]
+# extra AOVs written to render passes in the same render
+# [(aov, arnold type, pass, channels, chan_id, pass type)]
+AOVS = [
+    ('diffuse', "RGB", "Diffuse", 3, "RGB", 'COLOR'),
+    ('specular', "RGB", "Specular", 3, "RGB", 'COLOR'),
+    ('transmission', "RGB", "Transmission", 3, "RGB", 'COLOR'),
+    ('sss', "RGB", "SSS", 3, "RGB", 'COLOR'),
+    ('emission', "RGB", "Emission", 3, "RGB", 'COLOR'),
+    ('direct', "RGB", "Direct", 3, "RGB", 'COLOR'),
+    ('indirect', "RGB", "Indirect", 3, "RGB", 'COLOR'),
+    ('albedo', "RGB", "Albedo", 3, "RGB", 'COLOR'),
+    ('Z', "FLOAT", "Depth", 1, "Z", 'VALUE'),
+    ('N', "VECTOR", "Normal", 3, "XYZ", 'VECTOR'),
+    ('P', "VECTOR", "Position", 3, "XYZ", 'VECTOR'),
+    ('motionvector', "RGB", "Motion", 3, "RGB", 'COLOR'),
+]
 _SPACE_TYPES = [
     ('raster', "Raster", "Raster"),
     ('object', "Object", "Object")
@@ -75,6 +91,9 @@ class ArnoldOptions(PropertyGroup):
     ui_paths: BoolProperty(
         name="Search paths"
     )
+    ui_profile: BoolProperty(
+        name="Profile"
+    )
     ui_licensing: BoolProperty(
         name="Licensing"
     )
@@ -105,6 +124,48 @@ class ArnoldOptions(PropertyGroup):
         items=_LOG_FLAGS,
         options={'ENUM_FLAG'}
     )
+    output_mode: EnumProperty(
+        name="Output",
+        items=[
+            ('BLENDER', "Blender", "Buckets are written to the render result"),
+            ('EXR', "EXR", "Buckets are written to an OpenEXR file as they complete, "
+                           "Blender gets only the beauty preview")
+        ],
+        default='BLENDER'
+    )
+    exr_filepath: StringProperty(
+        name="File",
+        description="OpenEXR file, '#' are replaced with the frame number",
+        subtype='FILE_PATH',
+        default="//render_####.exr"
+    )
+    exr_compression: EnumProperty(
+        name="Compression",
+        items=[
+            ('none', "None", "None"),
+            ('zip', "ZIP", "ZIP"),
+            ('zips', "ZIPS", "ZIPS"),
+            ('piz', "PIZ", "PIZ"),
+            ('pxr24', "PXR24", "PXR24"),
+            ('b44', "B44", "B44"),
+            ('b44a', "B44A", "B44A"),
+            ('dwaa', "DWAA", "DWAA"),
+            ('dwab', "DWAB", "DWAB")
+        ],
+        default='zip'
+    )
+    exr_half_precision: BoolProperty(
+        name="Half Precision"
+    )
+    exr_tiled: BoolProperty(
+        name="Tiled",
+        default=True
+    )
+    exr_preview: BoolProperty(
+        name="Preview",
+        description="Display the beauty in Blender while rendering",
+        default=True
+    )
     console_log_flags: EnumProperty(
         name="Console flags",
         items=_LOG_FLAGS,
@@ -134,6 +195,12 @@ class ArnoldOptions(PropertyGroup):
         ],
         default= "RGBA RGB __filter "
     )
+    aovs: EnumProperty(
+        name="AOVs",
+        description="Extra AOVs rendered to passes along with the beauty",
+        items=[(a[0], a[2], a[2]) for a in AOVS],
+        options={'ENUM_FLAG'}
+    )
 
     #############################
 
@@ -237,10 +304,99 @@ class ArnoldOptions(PropertyGroup):
         min=16, soft_max=1024,
         default=64,
     )
+    ipr_workers: IntProperty(
+        name="Warm Workers",
+        description="Arnold processes kept initialized for the next viewport render",
+        min=0, max=4,
+        default=1
+    )
+    ipr_dynamic_resolution: BoolProperty(
+        name="Dynamic Resolution",
+        description="Lower the viewport resolution while the view changes to keep the frame time",
+        default=True
+    )
+    ipr_frame_budget: FloatProperty(
+        name="Frame Time",
+        description="Target time of the first frame after a change",
+        min=0.01, soft_max=1,
+        default=0.1,
+        subtype='TIME', unit='TIME'
+    )
+    ipr_min_scale: FloatProperty(
+        name="Min. Scale",
+        description="Lowest fraction of the viewport resolution",
+        min=0.05, max=1,
+        default=0.25,
+        subtype='FACTOR'
+    )
+    ipr_idle_time: FloatProperty(
+        name="Idle Time",
+        description="Render at the full resolution when the view didn't change for this long",
+        min=0, soft_max=5,
+        default=0.5,
+        subtype='TIME', unit='TIME'
+    )
+    ipr_progressive: BoolProperty(
+        name="Accumulate Passes",
+        description="Refine a still view with passes of new samples averaged into the viewport",
+        default=True
+    )
+    ipr_pass_samples: IntProperty(
+        name="Pass Samples",
+        description="Camera (AA) samples of every pass",
+        min=1, soft_max=4,
+        default=1
+    )
+    ipr_max_samples: IntProperty(
+        name="Max. Samples",
+        description="Stop refining after this many samples per pixel, 0 - Camera (AA) samples squared",
+        min=0, soft_max=1024,
+        default=0
+    )
+    ipr_time_limit: FloatProperty(
+        name="Time Limit",
+        description="Stop refining after this many seconds, 0 - no limit",
+        min=0, soft_max=600,
+        default=0,
+        subtype='TIME', unit='TIME'
+    )
     display_gamma: FloatProperty(
         name="Display Driver",
         default=1  # / 2.2  # TODO: inspect gamma correction
     )
+    geometry_cache: BoolProperty(
+        name="Geometry Cache",
+        description="Keep translated mesh buffers between renders and reuse them for unchanged objects",
+        default=True
+    )
+    geometry_cache_size: IntProperty(
+        name="Cache Size (MB)",
+        description="Maximum memory used by the geometry cache",
+        min=1, soft_max=65536,
+        default=2048
+    )
+    export_threads: IntProperty(
+        name="Export Threads",
+        description="Threads converting mesh buffers to arnold arrays (0 - number of CPUs)",
+        min=0, soft_max=64,
+        default=0
+    )
+    profile: BoolProperty(
+        name="Profile Export",
+        description="Record export timings per phase and object"
+    )
+    profile_filepath: StringProperty(
+        name="Report",
+        description="Profile report, CSV if the file ends with .csv, JSON otherwise",
+        subtype='FILE_PATH',
+        default="//arnold_profile.json"
+    )
+    profile_top: IntProperty(
+        name="Slowest Objects",
+        description="Number of the slowest objects shown",
+        min=1, soft_max=100,
+        default=10
+    )
 
     def _get_bucket_size(self):
         r = self.id_data.render
@@ -15,9 +15,9 @@ from bpy.types import (
     Operator,
 )
 
-import barnold.engine as engine
 import barnold.nodes as nodes
 from . import ArnoldRenderEngine
+from . import profile
 
 # icons
 import os
@@ -295,6 +295,15 @@ class ArnoldRenderMainPanel(ArnoldButtonsPanel, Panel):
         row.alignment = 'RIGHT'
         row.label(text="AOV Pass")
         row.prop(opts, "aov_pass", text="")
+        col.prop(opts, "aovs")
+        col.prop(opts, "output_mode")
+        if opts.output_mode == 'EXR':
+            col.prop(opts, "exr_filepath")
+            col.prop(opts, "exr_compression")
+            row = col.row()
+            row.prop(opts, "exr_half_precision")
+            row.prop(opts, "exr_tiled")
+            row.prop(opts, "exr_preview")
 
         col.separator()
         layout.separator()
@@ -426,6 +435,12 @@ class ArnoldRenderSystemPanel(ArnoldButtonsPanel, Panel):
             col.prop(opts, "pin_threads")
             col.separator()
             col.prop(opts, "procedural_force_expand")
+            col.separator()
+            col.prop(opts, "geometry_cache")
+            subcol = col.column()
+            subcol.prop(opts, "geometry_cache_size")
+            subcol.enabled = opts.geometry_cache
+            col.prop(opts, "export_threads")
 
         sublayout = _subpanel(layout, "IPR", opts.ui_ipr, opts_path, "ui_ipr", "scene")
         if sublayout:
@@ -434,6 +449,36 @@ class ArnoldRenderSystemPanel(ArnoldButtonsPanel, Panel):
             col.prop(opts, "initial_sampling_level")
             col.label(text="Viewport Rendering", icon='SETTINGS')
             col.prop(opts, "ipr_bucket_size")
+            col.prop(opts, "ipr_workers")
+            col.prop(opts, "ipr_dynamic_resolution")
+            subcol = col.column()
+            subcol.prop(opts, "ipr_frame_budget")
+            subcol.prop(opts, "ipr_min_scale")
+            subcol.prop(opts, "ipr_idle_time")
+            subcol.enabled = opts.ipr_dynamic_resolution
+            col.prop(opts, "ipr_progressive")
+            subcol = col.column()
+            subcol.prop(opts, "ipr_pass_samples")
+            subcol.prop(opts, "ipr_max_samples")
+            subcol.prop(opts, "ipr_time_limit")
+            subcol.enabled = opts.ipr_progressive
+
+        sublayout = _subpanel(layout, "Profile", opts.ui_profile, opts_path, "ui_profile", "scene")
+        if sublayout:
+            col = sublayout.column()
+            col.prop(opts, "profile")
+            subcol = col.column()
+            subcol.prop(opts, "profile_filepath")
+            subcol.prop(opts, "profile_top")
+            subcol.enabled = opts.profile
+            report = profile.LAST
+            if report is not None:
+                col.label(text="Slowest Objects", icon='TIME')
+                for ob in report["objects"][:opts.profile_top]:
+                    row = col.row()
+                    row.label(text=ob["name"])
+                    row.label(text="%.3fs" % ob["seconds"])
+                    row.label(text="%.1fMb" % (ob["bytes"] / 1048576))
 
         sublayout = _subpanel(layout, "Search paths", opts.ui_paths, opts_path, "ui_paths", "scene")
         if sublayout:
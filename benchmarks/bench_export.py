@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = """export stage benchmarks, runs without blender and arnold
+
+    python benchmarks/bench_export.py [--sizes 32 128 512] [--repeat 5] [--json report.json]
+
+Every bench_* function takes a scene size and returns the callable to time:
+size is the grid size of meshes (size x size quads), the number of hair
+parents is size * 4 with 16 children each, materials are size * 2.
+"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy
+
+import stubs
+import scene
+
+engine, arnold = stubs.install()
+
+from barnold.engine import bla
+from barnold.engine import params
+
+
+def bench_mesh_arrays(size):
+    """_MeshArrays, foreach_get of the mesh buffers"""
+    mesh = scene.mesh(size)
+    return lambda: engine._MeshArrays(mesh)
+
+
+def bench_polymesh(size):
+    """_AiPolymesh, arrays conversion on the calling thread"""
+    mesh = scene.mesh(size, 4)
+    arrays = engine._MeshArrays(mesh)
+    materials = [scene.material("M%d" % i, 'standard_surface', params.SHADERS) for i in range(4)]
+
+    def run():
+        engine._AiPolymesh(arrays, materials, engine.Shaders(None))
+    return run
+
+
+def bench_polymesh_pipeline(size):
+    """_AiPolymesh of 8 meshes through the export pipeline"""
+    arrays = [engine._MeshArrays(scene.mesh(size)) for i in range(8)]
+    materials = [scene.material("M", 'lambert', params.SHADERS)]
+
+    def run():
+        shaders = engine.Shaders(None)
+        pipeline = engine._Pipeline(4)
+        try:
+            for a in arrays:
+                engine._AiPolymesh(a, materials, shaders, pipeline)
+        finally:
+            pipeline.close()
+    return run
+
+
+def bench_shaders(size):
+    """Shaders.get of node and built-in materials, 8 distinct node trees"""
+    nt = sys.modules["barnold.nodes"]
+    types = list(params.SHADERS)
+    materials = [scene.node_material("N%d" % i, nt, i % 8) for i in range(size)]
+    materials += [scene.material("B%d" % i, types[i % len(types)], params.SHADERS) for i in range(size)]
+
+    def run():
+        shaders = engine.Shaders(None)
+        for mat in materials:
+            shaders.get(mat)
+    return run
+
+
+def bench_curves(size):
+    """bla.psys_get_curves of parent and child path caches, bezier basis"""
+    ps = scene.ParticleSystem(bla, size * 4, size * 64, 8)
+    props = scene.hair_props('bezier')
+    return lambda: bla.psys_get_curves(ps, 8, False, props)
+
+
+def bench_ipr_polymesh(size):
+    """_IprPolymesh to shared memory and pickling of the IPR message"""
+    mesh = scene.mesh(size, 2)
+    ob = scene.mesh_object("Grid", mesh, [scene.node_material("N", sys.modules["barnold.nodes"])] * 2)
+
+    def run():
+        arena = engine._SharedArrays()
+        try:
+            nodes = []
+            engine._IprPolymesh(ob, mesh, nodes, {}, arena)
+            pickle.dumps(nodes)
+        finally:
+            arena.close()
+    return run
+
+
+def bench_exr_outputs(size):
+    """_AiOutputs of the EXR output mode, buckets written by the driver_exr stand-in"""
+    opts = SimpleNamespace(
+        aov_pass="RGBA RGBA __filter ", aovs={'diffuse', 'Z', 'N'}, output_mode='EXR',
+        exr_filepath=os.path.join(tempfile.gettempdir(), "bench_exr_####.exr"), exr_compression='dwaa',
+        exr_half_precision=True, exr_tiled=True, exr_preview=False,
+    )
+    sys.modules["bpy"].context.scene = SimpleNamespace(frame_current=7)
+    bucket = numpy.ones(16 * 16 * 4, dtype=numpy.float32)
+
+    def run():
+        arnold.reset()
+        options = arnold.AiNode("options")
+        display, aovs = engine._AiOutputs(options, opts, {})
+        writer = stubs.ExrWriter(arnold)
+        # every layer goes to one file, the display driver gets nothing
+        assert writer.filename == os.path.join(tempfile.gettempdir(), "bench_exr_0007.exr"), writer.filename
+        assert (writer.compression, writer.half_precision, writer.tiled) == ('dwaa', True, True)
+        assert writer.layers == [
+            ("RGBA", "RGBA", "__filter"),
+            ("diffuse", "RGB", "__filter"),
+            ("Z", "FLOAT", "__closest"),
+            ("N", "VECTOR", "__closest"),
+        ], writer.layers
+        assert aovs == [], aovs
+        writer.open(size, size)
+        for y in range(0, size, 16):
+            for x in range(0, size, 16):
+                w = min(16, size - x)
+                h = min(16, size - y)
+                writer.write_bucket(x, y, w, h, [bucket[:w * h * 4]] * len(writer.layers))
+        writer.close()
+        os.remove(writer.filename + ".npz")
+    return run
+
+
+def _measure(run, repeat):
+    arnold.reset()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    calls = sum(arnold.calls.values())
+    nbytes = arnold.nbytes
+    times = []
+    for i in range(repeat):
+        pc = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - pc)
+    return {"seconds": min(times), "peak": peak, "calls": calls, "bytes": nbytes}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[32, 128, 512])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", help="run benchmarks whose name contains this string")
+    parser.add_argument("--json", help="write the results to a JSON file")
+    args = parser.parse_args(argv)
+
+    benches = [(n[6:], f) for n, f in sorted(globals().items()) if n.startswith("bench_")]
+    if args.only:
+        benches = [(n, f) for n, f in benches if args.only in n]
+
+    results = []
+    print("%-20s %6s %12s %12s %10s %14s" % ("bench", "size", "seconds", "peak KiB", "Ai calls", "array bytes"))
+    for name, bench in benches:
+        for size in args.sizes:
+            r = _measure(bench(size), args.repeat)
+            r.update(bench=name, size=size)
+            results.append(r)
+            print("%-20s %6d %12.6f %12.1f %10d %14d" % (
+                name, size, r["seconds"], r["peak"] / 1024, r["calls"], r["bytes"]))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "synthetic blender data: meshes, materials, node trees, particle caches"
+
+import ctypes
+from types import SimpleNamespace
+
+import numpy
+
+from stubs import Matrix
+
+# defaults by parameter type, see barnold.engine.params
+_DEFAULTS = {
+    'BOOL': False, 'BYTE': 0, 'INT': 1, 'UINT': 1, 'FLOAT': 0.5, 'STRING': "",
+    'RGB': (0.8, 0.8, 0.8), 'RGBA': (0.8, 0.8, 0.8, 1.0), 'VECTOR': (0.0, 0.0, 1.0),
+    'VECTOR2': (0.0, 0.0),
+}
+
+
+class ID(SimpleNamespace):
+    """Data-block, hashed by identity like bpy.types.ID"""
+    __hash__ = object.__hash__
+    __eq__ = object.__eq__
+
+
+class Collection:
+    """bpy_prop_collection with foreach_get over flat numpy arrays"""
+
+    def __init__(self, n, **attrs):
+        self.n = n
+        self.attrs = attrs
+
+    def __len__(self):
+        return self.n
+
+    def foreach_get(self, attr, out):
+        out[:] = self.attrs[attr].ravel()
+
+
+def mesh(size, nmaterials=1):
+    """Grid of size x size quads with normals, uvs and material indices"""
+    n = size + 1
+    x, y = numpy.meshgrid(numpy.arange(n, dtype='f'), numpy.arange(n, dtype='f'))
+    co = numpy.stack([x.ravel(), y.ravel(), numpy.zeros(n * n, 'f')], axis=1)
+    i = (numpy.arange(size)[:, None] * n + numpy.arange(size)[None, :]).ravel()
+    quads = numpy.stack([i, i + 1, i + n + 1, i + n], axis=1).ravel().astype(numpy.uint32)
+    npolygons = size * size
+    nloops = len(quads)
+    normals = numpy.tile(numpy.array([0, 0, 1], 'f'), nloops)
+    uv = co[quads, :2] / size
+    mat_index = (numpy.arange(npolygons) % max(nmaterials, 1)).astype(numpy.uint8)
+    return SimpleNamespace(
+        vertices=Collection(n * n, co=co),
+        loops=Collection(nloops, vertex_index=quads, normal=normals),
+        polygons=Collection(
+            npolygons, loop_total=numpy.full(npolygons, 4, numpy.uint32), vertices=quads,
+            material_index=mat_index, use_smooth=numpy.ones(npolygons, numpy.bool_)
+        ),
+        uv_layers=[SimpleNamespace(active_render=True, data=Collection(nloops, uv=uv))],
+        materials=[None] * nmaterials,
+    )
+
+
+def _namespace(params, root=None):
+    """Nested namespaces with default values for the attribute paths of a Params table"""
+    root = root or SimpleNamespace()
+    for param, t, attr in params.params:
+        ns = root
+        *path, name = attr.split(".")
+        for p in path:
+            if not hasattr(ns, p):
+                setattr(ns, p, SimpleNamespace())
+            ns = getattr(ns, p)
+        setattr(ns, name, _DEFAULTS[t])
+    return root
+
+
+def material(name, shader_type, shaders):
+    """Material without nodes of a built-in shader type.
+
+    Args:
+        shaders (dict): barnold.engine.params.SHADERS.
+    """
+    mat = ID(name=name, use_nodes=False, type='SURFACE', diffuse_color=(0.8, 0.8, 0.8, 1.0))
+    for params in shaders.values():
+        _namespace(params, mat)
+    mat.arnold.type = shader_type
+    return mat
+
+
+def _socket(identifier, bl_idname, value, link=None):
+    return SimpleNamespace(
+        identifier=identifier, bl_idname=bl_idname, default_value=value, hide_value=False,
+        is_linked=link is not None, links=[SimpleNamespace(from_node=link)] if link is not None else []
+    )
+
+
+def node_material(name, nt, variant=0):
+    """Material with an image -> color_correct -> standard_surface tree.
+
+    Materials with equal variant have structurally identical trees.
+    """
+    image = nt.ArnoldNode()
+    image.ai_name = "image"
+    image.name = "Image"
+    image.inputs = [_socket("uvcoords", "NodeSocketVector", (0.0, 0.0, 0.0))]
+    image.ai_properties = {"filename": ('STRING', "//textures/tex_%d.tx" % variant)}
+    cc = nt.ArnoldNode()
+    cc.ai_name = "color_correct"
+    cc.name = "Color Correct"
+    cc.inputs = [
+        _socket("input", "NodeSocketColor", (0.0, 0.0, 0.0, 1.0), image),
+        _socket("gamma", "NodeSocketFloat", 1.0),
+        _socket("saturation", "NodeSocketFloat", 1.0),
+    ]
+    cc.ai_properties = {}
+    surface = nt.ArnoldNode()
+    surface.ai_name = "standard_surface"
+    surface.name = "Standard Surface"
+    surface.inputs = [
+        _socket("base_color", "NodeSocketColor", (0.8, 0.8, 0.8, 1.0), cc),
+        _socket("specular_roughness", "NodeSocketFloat", 0.2),
+        _socket("metalness", "NodeSocketFloat", 0.0),
+    ]
+    surface.ai_properties = {}
+    output = nt.ArnoldNodeOutput()
+    output.is_active = True
+    output.inputs = [_socket("shader", "NodeSocketShader", None, surface)]
+    tree = SimpleNamespace(
+        nodes=[image, cc, surface, output],
+        links=[SimpleNamespace(from_node=surface, to_node=output)]
+    )
+    return ID(name=name, use_nodes=True, node_tree=tree, type='SURFACE',
+              diffuse_color=(0.8, 0.8, 0.8, 1.0))
+
+
+def mesh_object(name, data, materials):
+    return ID(
+        name=name, type='MESH', data=data, matrix_world=Matrix(),
+        material_slots=[SimpleNamespace(material=mat) for mat in materials]
+    )
+
+
+class ParticleSystem:
+    """Hair particle system with parent and child path caches in C memory.
+
+    Paths are allocated in buffers of 1024, like the blender cache.
+    """
+
+    def __init__(self, bla, nparents, nchildren, steps):
+        self._ps = bla._ParticleSystem()
+        self._buffers = []
+        key = ctypes.sizeof(bla._ParticleCacheKey)
+        self._ps.pathcache = self._cache(bla, nparents, steps, key)
+        self._ps.childcache = self._cache(bla, nchildren, steps, key)
+        self.particles = [None] * nparents
+        self.child_particles = [None] * nchildren
+
+    def _cache(self, bla, n, steps, key):
+        ptrs = (ctypes.c_void_p * max(n, 1))()
+        self._buffers.append(ptrs)
+        rng = numpy.random.RandomState(n)
+        for start in range(0, n, 1024):
+            m = min(1024, n - start)
+            buf = (ctypes.c_char * (m * steps * key))()
+            self._buffers.append(buf)
+            keys = numpy.frombuffer(buf, dtype=bla._KEY)
+            keys['co'] = rng.random_sample((m * steps, 3))
+            addr = ctypes.addressof(buf)
+            for i in range(m):
+                ptrs[start + i] = addr + i * steps * key
+        return ctypes.cast(ptrs, type(self._ps.pathcache))
+
+    def as_pointer(self):
+        return ctypes.addressof(self._ps)
+
+
+def hair_props(basis):
+    return SimpleNamespace(basis=basis, bezier_scale=0.5, radius_root=0.1, radius_tip=0.01)
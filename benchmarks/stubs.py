@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+
+__authors__ = "Tyler Furby, Ildar Nikolaev"
+__doc__ = "recording stand-ins for the arnold, bpy and mathutils modules"
+
+import os
+import sys
+import math
+import types
+import ctypes
+import itertools
+import collections
+
+import numpy
+
+ROOT = os.path.normpath(os.path.join(os.path.dirname(__file__), os.path.pardir))
+
+# {AI_TYPE_*: element size in bytes}
+_TYPES = collections.OrderedDict([
+    ("BYTE", 1), ("INT", 4), ("UINT", 4), ("BOOLEAN", 1), ("FLOAT", 4),
+    ("RGB", 12), ("RGBA", 16), ("VECTOR", 12), ("VECTOR2", 8), ("STRING", 8),
+    ("POINTER", 8), ("NODE", 8), ("ARRAY", 8), ("MATRIX", 64), ("ENUM", 4),
+])
+
+
+class Arnold(types.ModuleType):
+    """arnold module stand-in.
+
+    Every Ai* call is counted, arrays are copied like AiArrayConvert does, so
+    the numbers include the conversion cost but not the renderer.
+    """
+
+    def __init__(self):
+        super().__init__("arnold")
+        self.calls = collections.Counter()  # {function: calls}
+        self.nbytes = 0  # bytes copied to arrays
+        self.nodes = {}  # {address: (type, {param: value})}
+        self._ids = itertools.count(1)
+        for i, t in enumerate(_TYPES):
+            setattr(self, "AI_TYPE_" + t, i)
+        self.AI_SUCCESS = 0
+        self.AI_RENDER_MODE_CAMERA = 0
+        self.AI_NODE_SHAPE = 1
+        self.AI_NODE_SHADER = 2
+
+    def reset(self):
+        self.calls.clear()
+        self.nbytes = 0
+        self.nodes.clear()
+
+    def __getattr__(self, name):
+        if not name.startswith(("Ai", "At")):
+            raise AttributeError(name)
+        calls = self.calls
+
+        if name.startswith("AiNodeSet"):
+            nodes = self.nodes
+
+            def f(node, param, *value):
+                calls[name] += 1
+                nodes[node.value][1][param] = value
+        else:
+            def f(*args):
+                calls[name] += 1
+        f.__name__ = name
+        setattr(self, name, f)
+        return f
+
+    def AiNode(self, node_type):
+        self.calls["AiNode"] += 1
+        node = ctypes.c_void_p(next(self._ids))
+        self.nodes[node.value] = (node_type, {})
+        return node
+
+    def AiNodeLink(self, src, param, node):
+        self.calls["AiNodeLink"] += 1
+        self.nodes[node.value][1][param] = src
+
+    def AiArrayConvert(self, nelements, nkeys, type, data):
+        self.calls["AiArrayConvert"] += 1
+        size = nelements * nkeys * list(_TYPES.values())[type]
+        self.nbytes += size
+        return ctypes.create_string_buffer(ctypes.string_at(data, size), size)
+
+    def AiArrayAllocate(self, nelements, nkeys, type):
+        self.calls["AiArrayAllocate"] += 1
+        return [None] * (nelements * nkeys)
+
+    def AiArraySetPtr(self, array, i, value):
+        self.calls["AiArraySetPtr"] += 1
+        array[i] = value
+
+    def AiArray(self, nelements, nkeys, type, *values):
+        self.calls["AiArray"] += 1
+        return list(values)
+
+    def AtMatrix(self, *values):
+        return values
+
+
+class ExrWriter:
+    """driver_exr stand-in, writes the buckets of the outputs routed to it.
+
+    Resolves the driver and its layers from the nodes recorded by the Arnold
+    stand-in, like the renderer does with the options outputs. Layers are
+    numpy images, written to a .npz file instead of an OpenEXR one.
+    """
+
+    def __init__(self, arnold, name="__exr"):
+        nodes = arnold.nodes.values()
+        drivers = [p for t, p in nodes if t == "driver_exr" and p.get("name") == (name,)]
+        if len(drivers) != 1:
+            raise ValueError("%d driver_exr nodes named %r" % (len(drivers), name))
+        params = drivers[0]
+        self.filename = params["filename"][0]
+        self.compression = params["compression"][0]
+        self.half_precision = params["half_precision"][0]
+        self.tiled = params["tiled"][0]
+        # [(aov, type, filter)] of "aov type filter driver" outputs
+        outputs = [p["outputs"][0] for t, p in nodes if "outputs" in p]
+        if len(outputs) != 1:
+            raise ValueError("%d options nodes with outputs" % len(outputs))
+        self.layers = []
+        for output in outputs[0]:
+            aov, type, filter, driver = output.decode().split()
+            if driver == name:
+                self.layers.append((aov, type, filter))
+        self.images = None
+
+    def open(self, width, height):
+        dtype = numpy.float16 if self.half_precision else numpy.float32
+        self.images = {aov: numpy.zeros((height, width, 4), dtype) for aov, type, filter in self.layers}
+
+    def write_bucket(self, x, y, width, height, buckets):
+        """Write the RGBA buckets, one for every layer"""
+        for (aov, type, filter), bucket in zip(self.layers, buckets):
+            self.images[aov][y:y + height, x:x + width] = bucket.reshape(height, width, 4)
+
+    def close(self):
+        """Write the layers to filename + ".npz" """
+        save = numpy.savez if self.compression == "none" else numpy.savez_compressed
+        save(self.filename, **self.images)
+
+
+class Matrix(numpy.ndarray):
+    """mathutils.Matrix stand-in, a 4x4 float array"""
+
+    def __new__(cls, rows=None):
+        return numpy.array(numpy.eye(4) if rows is None else rows, dtype=numpy.float32).view(cls)
+
+    @classmethod
+    def Rotation(cls, angle, size, axis):
+        c = math.cos(angle)
+        s = math.sin(angle)
+        i, j = {'X': (1, 2), 'Y': (2, 0), 'Z': (0, 1)}[axis]
+        m = cls()
+        m[i, i] = c
+        m[i, j] = -s
+        m[j, i] = s
+        m[j, j] = c
+        return m
+
+    def transposed(self):
+        return self.T.copy()
+
+    def inverted(self):
+        return numpy.linalg.inv(self).view(Matrix)
+
+
+def _module(name, **attrs):
+    mod = types.ModuleType(name)
+    mod.__dict__.update(attrs)
+    return mod
+
+
+def _classes(name):
+    """Module which creates an empty class for every missing attribute"""
+    mod = types.ModuleType(name)
+
+    def __getattr__(attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        cls = type(attr, (), {})
+        setattr(mod, attr, cls)
+        return cls
+
+    mod.__getattr__ = __getattr__
+    return mod
+
+
+def _bpy():
+    _property = lambda **kwargs: kwargs
+    props = _module("bpy.props", **{
+        name: _property for name in (
+            "BoolProperty", "BoolVectorProperty", "CollectionProperty", "EnumProperty",
+            "FloatProperty", "FloatVectorProperty", "IntProperty", "IntVectorProperty",
+            "PointerProperty", "StringProperty"
+        )
+    })
+    props.__all__ = list(n for n in props.__dict__ if n.endswith("Property"))
+    bpy = _module(
+        "bpy",
+        types=_classes("bpy.types"),
+        props=props,
+        app=_module("bpy.app", version=(2, 80, 0), handlers=_module("bpy.app.handlers", persistent=lambda f: f)),
+        utils=_module("bpy.utils", register_class=lambda cls: None, unregister_class=lambda cls: None),
+        path=_module("bpy.path", abspath=lambda path: path),
+        data=_module("bpy.data"),
+        context=_module("bpy.context"),
+    )
+    return bpy
+
+
+def _nodes():
+    class ArnoldNode:
+        pass
+
+    class ArnoldNodeOutput:
+        pass
+
+    return _module("barnold.nodes", ArnoldNode=ArnoldNode, ArnoldNodeOutput=ArnoldNodeOutput)
+
+
+def install():
+    """Register the stand-ins and import the engine.
+
+    Returns:
+        tuple: (barnold.engine module, Arnold stand-in)
+    """
+    arnold = sys.modules.get("arnold")
+    if not isinstance(arnold, Arnold):
+        arnold = Arnold()
+        bpy = _bpy()
+        sys.modules.update({
+            "arnold": arnold,
+            "bpy": bpy,
+            "bpy.types": bpy.types,
+            "bpy.props": bpy.props,
+            "bpy.app": bpy.app,
+            "bpy.app.handlers": bpy.app.handlers,
+            "bgl": _classes("bgl"),
+            "mathutils": _module("mathutils", Matrix=Matrix, Vector=numpy.array, geometry=_module("geometry")),
+            "barnold.nodes": _nodes(),
+        })
+        if ROOT not in sys.path:
+            sys.path.insert(0, ROOT)
+    import barnold
+    barnold.nodes = sys.modules["barnold.nodes"]
+    import barnold.engine
+    return barnold.engine, arnold
@@ -1,19 +1,203 @@
 #include <ai.h>
 
+#include <atomic>
+#include <cstdint>
+#include <thread>
+
 namespace ASTR {
 	static const AtString callback("callback");
 	static const AtString callback_data("callback_data");
 	static const AtString color_space("color_space");
+	static const AtString ring("ring");
 };
 
 AI_DRIVER_NODE_EXPORT_METHODS(DriverDisplayCallbackMtd)
 
+// Outputs of a driver delivered to the ring
+static const int MAX_AOVS = 32;
+
 typedef void(*DisplayCallback)(uint32_t x, uint32_t y, uint32_t width, uint32_t height, float* buffer, void* data);
 
+// Tile ring shared with the Python consumer, see barnold/engine/tiles.py.
+//
+// The block is allocated by the consumer and made of 64 bit words:
+//
+//   header[8]          magic, cells, enqueue position, dequeue position,
+//                      slabs, slab size in floats, overflows, reserved
+//   cells[cells][8]    sequence, x, y, width, height, aovs, data, slab
+//   states[slabs]      0 - free slab, 1 - slab in use
+//   slabs[slabs]       slab size floats each
+//
+// Data of a bucket is the RGBA bucket of every output, in the order of the
+// outputs of the driver.
+//
+// Cells are a bounded multi producer, single consumer queue (sequence numbers
+// per cell), render threads copy the bucket into a free slab and queue it,
+// they never call into Python. Cells with a NULL data are highlights. The
+// consumer reads sequences with RingLoadAcquire and frees cells and slabs
+// with RingStoreRelease.
+namespace Ring {
+	static const uint64_t MAGIC = 0x52494e47;  // "RING"
+	static const uint64_t NO_SLAB = ~(uint64_t)0;
+
+	enum { H_MAGIC, H_CELLS, H_ENQUEUE, H_DEQUEUE, H_SLABS, H_SLAB_SIZE, H_OVERFLOWS, H_SIZE = 8 };
+
+	struct Cell
+	{
+		std::atomic<uint64_t> sequence;
+		uint64_t x, y, width, height, aovs, data, slab;
+	};
+	static_assert(sizeof(Cell) == 64, "cell is 8 words");
+
+	struct View
+	{
+		std::atomic<uint64_t>* header;
+		Cell* cells;
+		std::atomic<uint64_t>* states;
+		float* slabs;
+		uint64_t ncells, nslabs, slab_size;
+
+		explicit View(void* block)
+		{
+			header = (std::atomic<uint64_t>*)block;
+			ncells = header[H_CELLS].load(std::memory_order_relaxed);
+			nslabs = header[H_SLABS].load(std::memory_order_relaxed);
+			slab_size = header[H_SLAB_SIZE].load(std::memory_order_relaxed);
+			cells = (Cell*)(header + H_SIZE);
+			states = (std::atomic<uint64_t>*)(cells + ncells);
+			slabs = (float*)(states + nslabs);
+		}
+
+		bool valid() const
+		{
+			return header[H_MAGIC].load(std::memory_order_relaxed) == MAGIC;
+		}
+
+		// Free slab for n floats, or memory of AiMalloc if the ring is full,
+		// the consumer releases it with AiFree
+		float* acquire(uint64_t n, uint64_t& slab)
+		{
+			if (n <= slab_size)
+			{
+				for (uint64_t i = 0; i < nslabs; i++)
+				{
+					uint64_t expected = 0;
+					if (states[i].compare_exchange_strong(expected, 1, std::memory_order_acquire))
+					{
+						slab = i;
+						return slabs + i * slab_size;
+					}
+				}
+			}
+			header[H_OVERFLOWS].fetch_add(1, std::memory_order_relaxed);
+			slab = NO_SLAB;
+			return (float*)AiMalloc(n * sizeof(float));
+		}
+
+		void push(uint64_t x, uint64_t y, uint64_t width, uint64_t height, uint64_t aovs, float* data, uint64_t slab)
+		{
+			std::atomic<uint64_t>& enqueue = header[H_ENQUEUE];
+			uint64_t pos = enqueue.load(std::memory_order_relaxed);
+			Cell* cell;
+			for (;;)
+			{
+				cell = &cells[pos & (ncells - 1)];
+				int64_t dif = (int64_t)cell->sequence.load(std::memory_order_acquire) - (int64_t)pos;
+				if (dif == 0)
+				{
+					if (enqueue.compare_exchange_weak(pos, pos + 1, std::memory_order_relaxed))
+						break;
+				}
+				else
+				{
+					// the consumer is a whole queue behind
+					if (dif < 0)
+						std::this_thread::yield();
+					pos = enqueue.load(std::memory_order_relaxed);
+				}
+			}
+			cell->x = x;
+			cell->y = y;
+			cell->width = width;
+			cell->height = height;
+			cell->aovs = aovs;
+			cell->data = (uint64_t)(uintptr_t)data;
+			cell->slab = slab;
+			cell->sequence.store(pos + 1, std::memory_order_release);
+		}
+	};
+};
+
+// Ordered access to the words of the ring for the Python consumer, which
+// loads them with ctypes from this plugin, numpy loads and stores are plain
+AI_EXPORT_LIB uint64_t RingLoadAcquire(const uint64_t* word)
+{
+	return ((const std::atomic<uint64_t>*)word)->load(std::memory_order_acquire);
+}
+
+AI_EXPORT_LIB void RingStoreRelease(uint64_t* word, uint64_t value)
+{
+	((std::atomic<uint64_t>*)word)->store(value, std::memory_order_release);
+}
+
+// Converts a bucket of an output to bottom up RGBA
+static void ConvertBucket(float* buffer, int pixel_type, const void* bucket_data, int bucket_size_x, int bucket_size_y,
+                          AtNode* color_manager, AtString display_space)
+{
+	// data AOVs are left in the linear space
+	const bool transform = pixel_type == AI_TYPE_RGB || pixel_type == AI_TYPE_RGBA;
+
+	for (int y = 0; y < bucket_size_y; y++)
+	{
+		for (int x = 0; x < bucket_size_x; x++)
+		{
+			AtRGBA source = AI_RGBA_ZERO;
+			int idx = (bucket_size_y - y - 1) * bucket_size_x + x;
+
+			switch (pixel_type)
+			{
+				case AI_TYPE_FLOAT:
+				{
+					float f = ((float*)bucket_data)[idx];
+					source = AtRGBA(f, f, f, 1.0f);
+					break;
+				}
+				case AI_TYPE_RGB:
+				{
+					AtRGB rgb = ((AtRGB*)bucket_data)[idx];
+					source = AtRGBA(rgb, 1.0f);
+					break;
+				}
+				case AI_TYPE_VECTOR:
+				{
+					AtVector v = ((AtVector*)bucket_data)[idx];
+					source = AtRGBA(v.x, v.y, v.z, 1.0f);
+					break;
+				}
+				case AI_TYPE_RGBA:
+				{
+					source = ((AtRGBA*)bucket_data)[idx];
+					break;
+				}
+			}
+
+			if (transform)
+				AiColorManagerTransform(color_manager, display_space, false, false, NULL, (float*)&source.rgb());
+
+			float* target = &buffer[(y * bucket_size_x + x) * 4];
+			target[0] = source.r;
+			target[1] = source.g;
+			target[2] = source.b;
+			target[3] = source.a;
+		}
+	}
+}
+
 node_parameters
 {
 	AiParameterPtr("callback"     , NULL);
 	AiParameterPtr("callback_data", NULL);  // This value will be passed directly to the callback function
+	AiParameterPtr("ring"         , NULL);  // Tile ring of the consumer, replaces the callback
 }
 
 node_initialize
@@ -31,6 +215,7 @@ driver_supports_pixel_type
 	{
 	case AI_TYPE_FLOAT:
 	case AI_TYPE_RGB:
+	case AI_TYPE_VECTOR:
 	case AI_TYPE_RGBA:
 		return true;
 	default:
@@ -54,108 +239,99 @@ driver_needs_bucket
 
 driver_prepare_bucket
 {
+	void* block = AiNodeGetPtr(node, ASTR::ring);
+	if (block)
+	{
+		Ring::View ring(block);
+		if (ring.valid())
+			ring.push(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, 0, NULL, Ring::NO_SLAB);
+		return;
+	}
+
 	DisplayCallback cb = (DisplayCallback)AiNodeGetPtr(node, ASTR::callback);
 
-// Call the callback function with a NULL buffer pointer, to indicate
-// a bucket is going to start being rendered.
-if (cb)
-{
-	void *cb_data = AiNodeGetPtr(node, ASTR::callback_data);
-	(*cb)(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, NULL, cb_data);
-}
+	// Call the callback function with a NULL buffer pointer, to indicate
+	// a bucket is going to start being rendered.
+	if (cb)
+	{
+		void *cb_data = AiNodeGetPtr(node, ASTR::callback_data);
+		(*cb)(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, NULL, cb_data);
+	}
 }
 
 driver_write_bucket
 {
-	int pixel_type;
-const void* bucket_data;
+	// All AOV layers in the order of the outputs
+	int pixel_types[MAX_AOVS];
+	const void* bucket_datas[MAX_AOVS];
+	int naovs = 0;
+	while (naovs < MAX_AOVS && AiOutputIteratorGetNext(iterator, NULL, &pixel_types[naovs], &bucket_datas[naovs]))
+		naovs++;
+	if (!naovs)
+		return;
 
-// Get the first AOV layer
-if (!AiOutputIteratorGetNext(iterator, NULL, &pixel_type, &bucket_data))
-return;
+	// Retrieve color manager for conversion
+	AtNode* color_manager = (AtNode*)AiNodeGetPtr(AiUniverseGetOptions(), "color_manager");
+	AtString display_space, linear_space;
+	AiColorManagerGetDefaults(color_manager, display_space, linear_space);
 
-const bool dither = true;
+	if (!display_space)
+		display_space = linear_space;
 
-// Retrieve color manager for conversion
-AtNode* color_manager = (AtNode*)AiNodeGetPtr(AiUniverseGetOptions(), "color_manager");
-AtString display_space, linear_space;
-AiColorManagerGetDefaults(color_manager, display_space, linear_space);
+	const uint64_t size = (uint64_t)bucket_size_x * bucket_size_y * 4;
 
-if (!display_space)
-display_space = linear_space;
-
-// Allocates memory for the final pixels in the bucket
-//
-// This memory is not released here. The client code is
-// responsible for its release, which must be done using
-// the AiFree() function in the Arnold API
-float* buffer = (float*)AiMalloc(bucket_size_x * bucket_size_y * sizeof(float) * 4);
-int minx = bucket_xo;
-int miny = bucket_yo;
-int maxx = bucket_xo + bucket_size_x - 1;
-int maxy = bucket_yo + bucket_size_y - 1;
-
-for (int y = 0; y < bucket_size_y; y++)
-{
-	for (int x = 0; x < bucket_size_x; x++)
+	void* block = AiNodeGetPtr(node, ASTR::ring);
+	if (block)
 	{
-		AtRGBA source = AI_RGBA_ZERO;
-
-		switch (pixel_type)
-		{
-			case AI_TYPE_FLOAT:
-			{
-				int idx = (bucket_size_y - y - 1) * bucket_size_x + x;
-				float f = ((float*)bucket_data)[idx];
-				source = AtRGBA(f, f, f, 1.0f);
-				break;
-			}
-			case AI_TYPE_RGB:
-			{
-				int idx = (bucket_size_y - y - 1) * bucket_size_x + x;
-				AtRGB rgb = ((AtRGB*)bucket_data)[idx];
-				source = AtRGBA(rgb, 1.0f);
-				break;
-			}
-			case AI_TYPE_RGBA:
-			{
-				int idx = (bucket_size_y - y - 1) * bucket_size_x + x;
-				source = ((AtRGBA*)bucket_data)[idx];
-				break;
-			}
-		}
+		// The bucket is copied into a preallocated slab and queued, the
+		// consumer thread drains the ring and releases the slab. AOVs are
+		// packed one after another, so every bucket is a single slab.
+		Ring::View ring(block);
+		if (!ring.valid())
+			return;
+		uint64_t slab;
+		float* buffer = ring.acquire(size * naovs, slab);
+		for (int i = 0; i < naovs; i++)
+			ConvertBucket(buffer + size * i, pixel_types[i], bucket_datas[i], bucket_size_x, bucket_size_y,
+			              color_manager, display_space);
+		ring.push(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, naovs, buffer, slab);
+		return;
+	}
 
-		AiColorManagerTransform(color_manager, display_space, false, false, NULL, (float*)&source.rgb());
+	// The callback gets the first AOV layer
+	const int pixel_type = pixel_types[0];
+	const void* bucket_data = bucket_datas[0];
 
-		int i = bucket_xo + x;
-		int j = bucket_yo + y;
+	// Allocates memory for the final pixels in the bucket
+	//
+	// This memory is not released here. The client code is
+	// responsible for its release, which must be done using
+	// the AiFree() function in the Arnold API
+	float* buffer = (float*)AiMalloc(size * sizeof(float));
+	ConvertBucket(buffer, pixel_type, bucket_data, bucket_size_x, bucket_size_y, color_manager, display_space);
 
-		float* target = &buffer[(y * bucket_size_x + x) * 4];
-		target[0] = source.r;
-		target[1] = source.g;
-		target[2] = source.b;
-		target[3] = source.a;
+	// Sends the buffer with the final pixels to the callback for display.
+	//
+	// The callback receives ownership over this buffer, so it must
+	// release it when it is done with it, using the AiFree() function
+	// in the Arnold API.
+	//
+	// The reason for doing this is to decouple this code from the visualization
+	// process, so, as soon as the buffer is ready, this driver will send it to
+	// the callback and return to the rendering process, which will continue
+	// asynchronously, in parallel with the visualization of the bucket, carried
+	// out by the client code.
+	//
+	DisplayCallback cb = (DisplayCallback)AiNodeGetPtr(node, ASTR::callback);
+	if (cb)
+	{
+		void *cb_data = AiNodeGetPtr(node, ASTR::callback_data);
+		(*cb)(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, buffer, cb_data);
+	}
+	else
+	{
+		AiFree(buffer);
 	}
-}
-
-// Sends the buffer with the final pixels to the callback for display.
-//
-// The callback receives ownership over this buffer, so it must
-// release it when it is done with it, using the AiFree() function
-// in the Arnold API.
-//
-// The reason for doing this is to decouple this code from the visualization
-// process, so, as soon as the buffer is ready, this driver will send it to
-// the callback and return to the rendering process, which will continue
-// asynchronously, in parallel with the visualization of the bucket, carried
-// out by the client code.
-//
-DisplayCallback cb = (DisplayCallback)AiNodeGetPtr(node, ASTR::callback);
-if (cb)
-{
-	void *cb_data = AiNodeGetPtr(node, ASTR::callback_data);
-	(*cb)(bucket_xo, bucket_yo, bucket_size_x, bucket_size_y, buffer, cb_data);
-}
 }
 
 driver_process_bucket
@@ -175,11 +351,11 @@ node_finish
 node_loader
 {
 	if (i > 0)
-	return false;
+		return false;
 
-node->methods = DriverDisplayCallbackMtd;
-node->name = "driver_display_callback";
-node->node_type = AI_NODE_DRIVER;
-strcpy(node->version, AI_VERSION);
-return true;
+	node->methods = DriverDisplayCallbackMtd;
+	node->name = "driver_display_callback";
+	node->node_type = AI_NODE_DRIVER;
+	strcpy(node->version, AI_VERSION);
+	return true;
 }